@@ -0,0 +1,199 @@
+"""
+벤치마크용 가짜 구성 요소 (OpenAI, Pinecone, Yahoo를 호출하지 않음).
+
+- FakeChatModel: 첫 토큰까지의 시간, 토큰당 시간, 출력 토큰 수를 설정할 수 있는 chat model
+  (bind_tools/with_structured_output 지원)
+- LatencyEmbeddings: 입력마다 항상 같은 벡터를 반환하는 임베딩 + 지연 시간
+- LatencyVectorStore: 검색 지연 시간을 설정할 수 있는 메모리 vector store (Pinecone/Chroma 대신 사용)
+- make_fake_tool: 지연 시간을 설정할 수 있는 tool
+
+모든 가짜 구성 요소는 CallCounter에 이름별 호출 횟수와 토큰 수를 기록합니다.
+"""
+import re
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import StructuredTool
+from langchain_core.vectorstores import InMemoryVectorStore
+
+
+def count_words(text):
+    # 가짜 구성 요소의 토큰 수는 tokenizer 없이 공백 기준 단어 수로 계산
+    return len(str(text).split())
+
+
+class CallCounter:
+    """이름별 호출 횟수와 입력/출력 토큰 수"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, input_tokens=0, output_tokens=0):
+        with self._lock:
+            stats = self._stats.setdefault(name, {'calls': 0, 'input_tokens': 0, 'output_tokens': 0})
+            stats['calls'] += 1
+            stats['input_tokens'] += input_tokens
+            stats['output_tokens'] += output_tokens
+
+    def report(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    지연 시간과 출력 토큰 수를 설정할 수 있는 가짜 chat model.
+
+    - first_token_latency: 요청 후 첫 토큰까지 걸리는 시간(초)
+    - token_latency: 이후 토큰 하나마다 걸리는 시간(초)
+    - response: 고정 응답. 없으면 output_tokens개의 단어로 된 응답을 만듦
+    - bind_tools로 tool이 연결되면 첫 호출에서 첫 번째 tool을 호출하고, tool 결과를 받으면 답변을 반환
+    - with_structured_output은 structured_response를 그대로 반환
+    """
+
+    name: str = 'chat'
+    counter: Any = None
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+    output_tokens: int = 20
+    response: Optional[str] = None
+    structured_response: Optional[dict] = None
+    tool_names: list = []
+
+    @property
+    def _llm_type(self):
+        return 'fake-benchmark-chat'
+
+    def _record(self, messages, output):
+        if self.counter is not None:
+            prompt = ' '.join(str(message.content) for message in messages)
+            self.counter.record(self.name, count_words(prompt), count_words(output))
+
+    def _text(self):
+        if self.response is not None:
+            return self.response
+        return ' '.join(f'{self.name}-token{i}' for i in range(self.output_tokens))
+
+    @staticmethod
+    def _ticker(messages):
+        # 질문에 들어 있는 ticker(대문자 2~5자)를 tool 인자로 사용
+        for message in reversed(messages):
+            found = re.findall(r'\b[A-Z]{2,5}\b', str(message.content))
+            if found:
+                return found[-1]
+        return 'AAPL'
+
+    def _tool_call_message(self, messages):
+        if not self.tool_names or isinstance(messages[-1], ToolMessage):
+            return None
+        call_id = f'call_{time.perf_counter_ns()}'
+        return AIMessage(content='', tool_calls=[
+            {'name': self.tool_names[0], 'args': {'ticker': self._ticker(messages)}, 'id': call_id}
+        ])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_latency)
+        message = self._tool_call_message(messages)
+        if message is None:
+            text = self._text()
+            time.sleep(self.token_latency * max(count_words(text) - 1, 0))
+            message = AIMessage(content=text)
+        self._record(messages, message.content)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_latency)
+        message = self._tool_call_message(messages)
+        if message is not None:
+            self._record(messages, '')
+            yield ChatGenerationChunk(message=AIMessageChunk(content='', tool_calls=message.tool_calls))
+            return
+        words = self._text().split(' ')
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else ' ' + word))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        self._record(messages, ' '.join(words))
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={'tool_names': [tool.name for tool in tools]})
+
+    def with_structured_output(self, schema=None, **kwargs):
+        def respond(value):
+            time.sleep(self.first_token_latency)
+            if self.counter is not None:
+                self.counter.record(self.name, count_words(value), count_words(self.structured_response))
+            return dict(self.structured_response or {})
+
+        return RunnableLambda(respond)
+
+
+class LatencyEmbeddings(Embeddings):
+    """같은 텍스트에 항상 같은 벡터를 반환하고, 요청마다 latency초를 기다리는 가짜 임베딩"""
+
+    def __init__(self, size=256, latency=0.0, counter=None, name='embedding'):
+        self._underlying = DeterministicFakeEmbedding(size=size)
+        self.model = f'fake-embedding-{size}'
+        self.latency = latency
+        self.counter = counter
+        self.name = name
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        if self.counter is not None:
+            self.counter.record(self.name, sum(count_words(text) for text in texts))
+        return self._underlying.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class LatencyVectorStore(InMemoryVectorStore):
+    """
+    메모리 vector store에 검색 지연 시간과 호출 횟수 기록을 추가한 가짜 vector store.
+    from_existing_index(index_name=..., embedding=...)로 PineconeVectorStore 대신 사용할 수 있습니다.
+    """
+
+    def __init__(self, embedding, latency=0.0, counter=None, name='vector_store'):
+        super().__init__(embedding)
+        self.latency = latency
+        self.counter = counter
+        self.name = name
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        time.sleep(self.latency)
+        results = super().similarity_search_with_score(query, k=k, **kwargs)
+        if self.counter is not None:
+            self.counter.record(self.name, count_words(query), len(results))
+        return results
+
+    def from_existing_index(self, index_name=None, embedding=None, **kwargs):
+        return self
+
+
+def make_fake_tool(name, description, latency=0.0, counter=None, func=None):
+    """
+    ticker 하나를 받는 가짜 tool을 만듭니다. func를 넘기면 그 결과를, 아니면 고정된 문자열을 반환합니다.
+    """
+    def run(ticker: str) -> str:
+        time.sleep(latency)
+        result = func(ticker) if func else f'{name} result for {ticker}'
+        if counter is not None:
+            counter.record(f'tool:{name}', 1, count_words(result))
+        return result
+
+    return StructuredTool.from_function(run, name=name, description=description)
@@ -0,0 +1,321 @@
+"""
+OpenAI/Pinecone/Yahoo를 호출하지 않는 end-to-end 지연 시간/처리량 벤치마크.
+
+가짜 chat model, 임베딩, vector store, tool(benchmarks/fakes.py)로 아래 파이프라인을 실행합니다.
+- llm: llm_rag/llm.py의 get_ai_response (speculative 또는 chain 모드)
+- graph: langgraph-lecture/spring_doc_graph.py의 self-RAG 그래프
+- stock: langgraph-lecture/Agent/stock-multi-agent.py의 supervisor 그래프
+
+질의 목록은 config.py의 answer_examples 질문과 문서(langgraph-lecture/documents)의 제목으로 만들고,
+설정한 동시 요청 수로 재생한 뒤 단계별/전체 p50/p95/p99, 처리량, LLM 호출 횟수를 JSON으로 저장합니다.
+
+사용 예:
+    python benchmarks/pipelines.py --pipelines llm graph stock --concurrency 8 --output bench.json
+    python benchmarks/pipelines.py --pipelines graph --llm-latency 0.3 --token-latency 0.01 --requests 50
+"""
+import argparse
+import contextlib
+import glob
+import importlib.util
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LLM_RAG_DIR = os.path.join(ROOT_DIR, 'llm_rag')
+GRAPH_DIR = os.path.join(ROOT_DIR, 'langgraph-lecture')
+AGENT_DIR = os.path.join(GRAPH_DIR, 'Agent')
+for path in (LLM_RAG_DIR, GRAPH_DIR, AGENT_DIR):
+    if path not in sys.path:
+        sys.path.append(path)
+
+from fakes import CallCounter, FakeChatModel, LatencyEmbeddings, LatencyVectorStore, make_fake_tool  # noqa: E402
+
+STOCK_TICKERS = ['RXRX', 'NVDA', 'AAPL', 'MSFT', 'TSLA', 'AMZN', 'GOOGL', 'META']
+
+
+def load_corpus(documents_pattern, max_doc_queries=20):
+    """answer_examples의 질문 + 문서 제목(# ...)으로 질의 목록을 만듭니다."""
+    from config import answer_examples
+
+    queries = [example['input'] for example in answer_examples]
+    for path in sorted(glob.glob(documents_pattern)):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('#'):
+                    title = re.sub(r'^#+\s*(\d+(\.\d+)*\.?\s*)?', '', line).strip()
+                    if len(title) > 3:
+                        queries.append(title)
+    queries = list(dict.fromkeys(queries))
+    return queries[:len(answer_examples) + max_doc_queries]
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values, dtype=float)
+    return {
+        'count': int(values.size),
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(values.max()),
+    }
+
+
+def replay(run_one, queries, requests, concurrency):
+    """
+    queries를 순서대로 반복해 requests개의 요청을 concurrency개씩 동시에 실행합니다.
+    run_one(index, query)는 단계별 시간(초) dict를 반환해야 합니다.
+    """
+    def timed(index):
+        started = time.perf_counter()
+        try:
+            stages = run_one(index, queries[index % len(queries)])
+            return time.perf_counter() - started, stages, None
+        except Exception as e:
+            return time.perf_counter() - started, {}, f'{type(e).__name__}: {e}'
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, range(requests)))
+    wall_seconds = time.perf_counter() - started
+
+    stages = {}
+    for _, request_stages, _ in results:
+        for stage, seconds in request_stages.items():
+            stages.setdefault(stage, []).append(seconds)
+    errors = [error for _, _, error in results if error]
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'wall_seconds': wall_seconds,
+        'throughput_rps': requests / wall_seconds if wall_seconds else None,
+        'end_to_end': percentiles([seconds for seconds, _, error in results if not error]),
+        'stages': {stage: percentiles(values) for stage, values in stages.items()},
+        'errors': len(errors),
+        'error_samples': errors[:5],
+    }
+
+
+def make_chat(args, counter, name, **kwargs):
+    return FakeChatModel(
+        name=name,
+        counter=counter,
+        first_token_latency=args.llm_latency,
+        token_latency=args.token_latency,
+        output_tokens=args.output_tokens,
+        **kwargs,
+    )
+
+
+def make_vector_store(args, counter, embedding, documents):
+    vector_store = LatencyVectorStore(embedding, latency=args.retriever_latency, counter=counter)
+    vector_store.add_documents(documents)
+    return vector_store
+
+
+def stream_stage_timings(graph, inputs):
+    """graph를 'updates' 모드로 실행하고, node별로 직전 update 이후 걸린 시간을 더해 반환합니다."""
+    stages = {}
+    previous = time.perf_counter()
+    # config.graph_checkpoint_enabled로 checkpointer가 붙어 있어도 실행되도록 실행마다 새 thread_id를 사용
+    config = {'configurable': {'thread_id': str(uuid.uuid4())}}
+    for update in graph.stream(inputs, config, stream_mode='updates'):
+        now = time.perf_counter()
+        for node in update:
+            stages[node] = stages.get(node, 0.0) + now - previous
+        previous = now
+    return stages
+
+
+def bench_llm(args, counter, workdir, queries):
+    import llm
+    from embedding_cache import CachedEmbeddings
+    from hybrid_retriever import load_documents
+
+    llm.answer_cache_path = os.path.join(workdir, 'answer_cache.sqlite3')
+    llm.history_store_path = os.path.join(workdir, 'history.sqlite3')
+    llm.pipeline_mode = args.llm_pipeline_mode
+    if not args.answer_cache:
+        # 같은 질문이 반복되어도 캐시된 답변을 쓰지 않도록 threshold를 1보다 크게 설정
+        llm.answer_cache_threshold = 1.01
+
+    embedding = CachedEmbeddings(
+        LatencyEmbeddings(latency=args.embedding_latency, counter=counter), os.path.join(workdir, 'embedding_cache')
+    )
+    llm._chain_registry.clear()
+    llm._chain_registry['embedding'] = embedding
+    # model_routing.json의 역할별 모델 대신 역할마다 가짜 모델을 등록 (호출 수가 역할별로 기록됨)
+    for role in ('rewrite', 'contextualize', 'answer'):
+        llm._chain_registry[f'llm:{role}'] = make_chat(args, counter, role)
+    # get_retriever()는 그대로 사용하고, Pinecone만 메모리 vector store로 바꿈
+    llm.PineconeVectorStore = make_vector_store(args, counter, embedding, load_documents(args.documents_pattern))
+    llm.warm_up()
+    counter.reset()
+
+    def run_one(index, query):
+        for _ in llm.get_ai_response(query, f'bench-{index}'):
+            pass
+        return {}
+
+    result = replay(run_one, queries, args.requests or len(queries), args.concurrency)
+    if args.llm_pipeline_mode == 'speculative':
+        timings = list(llm.get_speculative_pipeline().timings)
+        stages = {}
+        for timing in timings:
+            for stage, value in timing.items():
+                if stage != 'speculative_hit':
+                    stages.setdefault(stage, []).append(value)
+        result['stages'] = {stage: percentiles(values) for stage, values in stages.items()}
+    result['context_packer'] = llm.get_context_packer().report()
+    return result
+
+
+def bench_graph(args, counter, workdir, queries):
+    from langchain_core.prompts import PromptTemplate
+
+    import spring_doc_graph
+    from embedding_cache import CachedEmbeddings
+    from hybrid_retriever import BM25Index, HybridRetriever, load_documents
+
+    documents = load_documents(args.documents_pattern)
+    embedding = CachedEmbeddings(
+        LatencyEmbeddings(latency=args.embedding_latency, counter=counter), os.path.join(workdir, 'embedding_cache')
+    )
+    vector_store = make_vector_store(args, counter, embedding, documents)
+    retriever = HybridRetriever(
+        index=BM25Index(documents), vector_retriever=vector_store.as_retriever(search_kwargs={'k': 3}), k=3
+    )
+    # 문서 관련성/helpfulness 평가는 hub 프롬프트의 structured output 대신 {'Score': 1}을 반환하는 가짜 모델 사용
+    grader = make_chat(args, counter, 'grader', structured_response={'Score': 1}).with_structured_output()
+    llms = {
+        'rewrite_llm': make_chat(args, counter, 'rewrite'),
+        'doc_relevance_llm': grader,
+        'helpfulness_llm': grader,
+        'generate_llm': make_chat(args, counter, 'generate'),
+        'hallucination_llm': make_chat(args, counter, 'hallucination', response='not hallucinated'),
+    }
+    prompts = {
+        'generate': PromptTemplate.from_template('{context}\n\n{question}'),
+        'doc_relevance': PromptTemplate.from_template('{documents}\n\n{question}'),
+        'helpfulness': PromptTemplate.from_template('{question}\n\n{student_answer}'),
+        'rewrite': spring_doc_graph.rewrite_prompt,
+        'hallucination': spring_doc_graph.hallucination_prompt,
+    }
+    metrics = spring_doc_graph.LoopMetrics()
+    graph = spring_doc_graph.build_graph(retriever=retriever, llms=llms, prompts=prompts, metrics=metrics)
+    counter.reset()
+
+    def run_one(index, query):
+        return stream_stage_timings(graph, {'query': query})
+
+    result = replay(run_one, queries, args.requests or len(queries), args.concurrency)
+    result['loops'] = metrics.report()
+    return result
+
+
+def load_stock_module():
+    # 파일 이름에 '-'가 있어 import 문으로 불러올 수 없으므로 경로로 불러옴
+    # 모듈을 만들 때 ChatOpenAI/Polygon 클라이언트를 생성하므로 키가 없으면 가짜 값을 넣어 둠 (실제로 호출하지 않음)
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    os.environ.setdefault('POLYGON_API_KEY', 'benchmark')
+    spec = importlib.util.spec_from_file_location('stock_multi_agent', os.path.join(AGENT_DIR, 'stock-multi-agent.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_stock(args, counter, workdir, queries):
+    from langgraph.prebuilt import create_react_agent
+
+    from market_data import FakeMarketDataProvider, MarketDataStore
+
+    stock = load_stock_module()
+    provider = FakeMarketDataProvider(delay=args.tool_latency)
+    stock.market_data_store = MarketDataStore(os.path.join(workdir, 'market_cache'), provider)
+    news_tool = make_fake_tool('stock_news', 'Return recent news for a ticker', args.tool_latency, counter)
+    stock.research_agents.update({
+        'market_research': create_react_agent(make_chat(args, counter, 'market_research'), tools=[news_tool]),
+        'stock_research': create_react_agent(make_chat(args, counter, 'stock_research'), tools=[stock.get_stock_price]),
+        'company_research': create_react_agent(
+            make_chat(args, counter, 'company_research'), tools=[stock.company_research_tool]
+        ),
+    })
+    stock.small_llm = make_chat(args, counter, 'planner', structured_response={'workers': []})
+    stock.analyst_chain = stock.analyst_prompt | make_chat(args, counter, 'analyst')
+    graph = stock.build_graph('parallel')
+    counter.reset()
+
+    def run_one(index, query):
+        return stream_stage_timings(graph, {'messages': [('user', query)]})
+
+    result = replay(run_one, queries, args.requests or len(queries), args.concurrency)
+    result['market_data'] = {'provider_calls': provider.calls, 'store': stock.market_data_store.stats()}
+    return result
+
+
+def main():
+    from config import documents_pattern
+
+    parser = argparse.ArgumentParser(description='가짜 LLM/임베딩/vector store/tool로 파이프라인 지연 시간을 측정합니다.')
+    parser.add_argument('--pipelines', nargs='+', choices=['llm', 'graph', 'stock'], default=['llm', 'graph', 'stock'])
+    parser.add_argument('--concurrency', type=int, default=4, help='동시에 실행할 요청 수')
+    parser.add_argument('--requests', type=int, default=None, help='파이프라인별 요청 수 (기본값: 질의 수)')
+    parser.add_argument('--llm-latency', type=float, default=0.05, help='가짜 LLM의 첫 토큰까지 시간(초)')
+    parser.add_argument('--token-latency', type=float, default=0.002, help='가짜 LLM의 토큰당 시간(초)')
+    parser.add_argument('--output-tokens', type=int, default=50, help='가짜 LLM 답변의 토큰 수')
+    parser.add_argument('--embedding-latency', type=float, default=0.02, help='가짜 임베딩 요청 시간(초)')
+    parser.add_argument('--retriever-latency', type=float, default=0.02, help='가짜 vector store 검색 시간(초)')
+    parser.add_argument('--tool-latency', type=float, default=0.05, help='가짜 tool/시세 provider 호출 시간(초)')
+    parser.add_argument('--llm-pipeline-mode', choices=['speculative', 'chain'], default='speculative')
+    parser.add_argument('--answer-cache', action='store_true', help='llm 파이프라인에서 의미 기반 답변 캐시를 사용')
+    parser.add_argument('--documents-pattern', default=documents_pattern)
+    parser.add_argument('--max-doc-queries', type=int, default=20, help='문서 제목에서 만들 질의 수')
+    parser.add_argument('--offline-tokenizer', action='store_true',
+                        help='tiktoken BPE 파일을 받을 수 없는 환경에서 공백 기준 tokenizer를 사용')
+    parser.add_argument('--output', help='결과를 저장할 JSON 파일 경로')
+    args = parser.parse_args()
+
+    if args.offline_tokenizer:
+        import token_counter
+
+        class WhitespaceEncoding:
+            def encode(self, text):
+                return text.split()
+
+        token_counter._get_encoding = lambda encoding_name: WhitespaceEncoding()
+
+    queries = load_corpus(args.documents_pattern, args.max_doc_queries)
+    stock_queries = [f'Would you invest in {ticker}?' for ticker in STOCK_TICKERS]
+    benches = {'llm': (bench_llm, queries), 'graph': (bench_graph, queries), 'stock': (bench_stock, stock_queries)}
+
+    result = {'config': vars(args), 'pipelines': {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.pipelines:
+            bench, pipeline_queries = benches[name]
+            counter = CallCounter()
+            pipeline_dir = os.path.join(workdir, name)
+            os.makedirs(pipeline_dir)
+            # 노드 안의 print 출력이 결과 JSON과 섞이지 않도록 실행 중에는 버림
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                pipeline_result = bench(args, counter, pipeline_dir, pipeline_queries)
+            pipeline_result['calls'] = counter.report()
+            result['pipelines'][name] = pipeline_result
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+spring_doc_graph.py의 시작 시간 벤치마크.
+
+- import: 새 파이썬 프로세스에서 `import spring_doc_graph`에 걸리는 시간 (네트워크 호출 없이 끝나야 함)
+- compile: 가짜 retriever/LLM/프롬프트로 build_graph()를 호출해 그래프를 compile하는 시간
+
+사용 예:
+    python benchmarks/startup_spring_doc_graph.py --repeat 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+GRAPH_DIR = os.path.join(ROOT_DIR, 'langgraph-lecture')
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import spring_doc_graph; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def measure_import(repeat):
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_SNIPPET], cwd=GRAPH_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+
+def measure_compile(repeat):
+    sys.path.insert(0, GRAPH_DIR)
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.retrievers import BaseRetriever
+
+    import spring_doc_graph
+
+    class EmptyRetriever(BaseRetriever):
+        def _get_relevant_documents(self, query, *, run_manager):
+            return []
+
+    fake_llm = FakeListChatModel(responses=['ok'])
+    llms = {name: fake_llm for name in ('rewrite_llm', 'doc_relevance_llm', 'helpfulness_llm', 'generate_llm',
+                                        'hallucination_llm')}
+    prompt = PromptTemplate.from_template('{question}')
+    prompts = {
+        'generate': prompt,
+        'doc_relevance': prompt,
+        'helpfulness': prompt,
+        'rewrite': spring_doc_graph.rewrite_prompt,
+        'hallucination': spring_doc_graph.hallucination_prompt,
+    }
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        spring_doc_graph.build_graph(retriever=EmptyRetriever(), llms=llms, prompts=prompts)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def summarize(timings):
+    return {
+        'runs': len(timings),
+        'min_seconds': min(timings),
+        'median_seconds': statistics.median(timings),
+        'max_seconds': max(timings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='spring_doc_graph import/compile 시간을 측정합니다.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='결과를 저장할 JSON 파일 경로')
+    args = parser.parse_args()
+
+    result = {
+        'import': summarize(measure_import(args.repeat)),
+        'compile': summarize(measure_compile(args.repeat)),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+get_stock_price 결과의 프롬프트 토큰 벤치마크 (네트워크 호출 없음).
+
+FakeMarketDataProvider의 시세로 ticker마다 아래 두 결과를 만들고 o200k_base 토큰 수를 비교합니다.
+- raw: 기존 get_stock_price 결과 (한 달치 시세 DataFrame의 to_dict())
+- indicators: 지표 요약 (langgraph-lecture/Agent/indicators.py, 3개월치 시세로 계산)
+
+tool 결과는 ToolMessage로 대화에 남아 이후 supervisor/analyst 호출마다 다시 들어가므로
+--downstream-calls만큼 곱한 요청당 절약 토큰도 함께 계산합니다.
+여러 ticker를 한 번에 계산(batch)할 때와 ticker마다 따로 계산할 때의 시간도 측정합니다.
+
+사용 예:
+    python benchmarks/stock_indicators.py --tickers 50 --output indicators.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LLM_RAG_DIR = os.path.join(ROOT_DIR, 'llm_rag')
+AGENT_DIR = os.path.join(ROOT_DIR, 'langgraph-lecture', 'Agent')
+for path in (LLM_RAG_DIR, AGENT_DIR):
+    if path not in sys.path:
+        sys.path.append(path)
+
+from indicators import summarize_prices  # noqa: E402
+from market_data import FakeMarketDataProvider, period_start  # noqa: E402
+
+BASE_TICKERS = ['RXRX', 'NVDA', 'AAPL', 'MSFT', 'TSLA', 'AMZN', 'GOOGL', 'META']
+
+
+def tool_message_text(value):
+    # LangChain이 dict tool 결과를 ToolMessage 내용으로 바꾸는 방식과 같게 JSON, 실패하면 str()
+    try:
+        return json.dumps(value, ensure_ascii=False)
+    except TypeError:
+        return str(value)
+
+
+def make_tickers(count):
+    return [BASE_TICKERS[i] if i < len(BASE_TICKERS) else f'T{i:03d}' for i in range(count)]
+
+
+def measure_tokens(frames, today, downstream_calls):
+    from token_counter import count_tokens
+
+    month_start = period_start('1mo', today)
+    summaries = summarize_prices(frames)
+    per_ticker = {}
+    for ticker, frame in frames.items():
+        raw = tool_message_text(frame.loc[str(month_start):].to_dict())
+        compact = tool_message_text(summaries[ticker])
+        per_ticker[ticker] = {'raw': count_tokens(raw), 'indicators': count_tokens(compact)}
+
+    raw = np.array([tokens['raw'] for tokens in per_ticker.values()])
+    compact = np.array([tokens['indicators'] for tokens in per_ticker.values()])
+    return {
+        'tickers': len(per_ticker),
+        'avg_raw_tokens': float(raw.mean()),
+        'avg_indicator_tokens': float(compact.mean()),
+        'max_indicator_tokens': int(compact.max()),
+        'saved_tokens_per_result': float((raw - compact).mean()),
+        'saved_ratio': float(1 - compact.sum() / raw.sum()),
+        # tool 결과 하나가 이후 downstream_calls번의 LLM 호출에 다시 들어갈 때 요청당 절약되는 토큰
+        'saved_tokens_per_request': float((raw - compact).mean() * (1 + downstream_calls)),
+        'example': summaries[next(iter(frames))],
+    }
+
+
+def measure_compute(frames, repeat):
+    batched = []
+    looped = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        summarize_prices(frames)
+        batched.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for ticker, frame in frames.items():
+            summarize_prices({ticker: frame})
+        looped.append(time.perf_counter() - started)
+    return {
+        'repeat': repeat,
+        'batched_seconds': float(np.median(batched)),
+        'per_ticker_seconds': float(np.median(looped)),
+        'speedup': float(np.median(looped) / np.median(batched)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='get_stock_price 결과의 토큰 수와 지표 계산 시간을 측정합니다.')
+    parser.add_argument('--tickers', type=int, default=len(BASE_TICKERS), help='ticker 수')
+    parser.add_argument('--downstream-calls', type=int, default=2,
+                        help='tool 결과가 다시 들어가는 이후 LLM 호출 수 (기본값: supervisor + analyst)')
+    parser.add_argument('--repeat', type=int, default=5, help='계산 시간 측정 반복 횟수')
+    parser.add_argument('--offline-tokenizer', action='store_true',
+                        help='tiktoken BPE 파일을 받을 수 없는 환경에서 공백 기준 tokenizer를 사용')
+    parser.add_argument('--output', help='결과를 저장할 JSON 파일 경로')
+    args = parser.parse_args()
+
+    if args.offline_tokenizer:
+        import token_counter
+
+        class WhitespaceEncoding:
+            def encode(self, text):
+                return text.split()
+
+        token_counter._get_encoding = lambda encoding_name: WhitespaceEncoding()
+
+    today = date.today()
+    provider = FakeMarketDataProvider()
+    frames = {
+        ticker: provider.fetch_prices(ticker, period_start('3mo', today), today + timedelta(days=1))
+        for ticker in make_tickers(args.tickers)
+    }
+    result = {
+        'config': vars(args),
+        'tokens': measure_tokens(frames, today, args.downstream_calls),
+        'compute': measure_compute(frames, args.repeat),
+    }
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+양자화 로컬 vector 인덱스(llm_rag/quantized_index.py)와 기존 방식의 recall@k / QPS / 메모리 벤치마크 (네트워크 호출 없음).
+
+비교 대상:
+- exact: 원래 3072차원 float32 벡터 전체를 메모리에 올려 brute-force로 검색 (정답 기준)
+- chroma: 같은 벡터를 넣은 Chroma(HNSW) collection (chromadb가 설치되어 있을 때)
+- quantized: --dims x --quantizations 조합의 QuantizedIndex (근사 검색 + 원래 벡터로 rescoring)
+
+벡터는 앞 차원일수록 분산이 큰(Matryoshka 임베딩과 비슷한) 합성 데이터를 쓰거나, --chroma-directory로
+기존 Chroma 저장소의 벡터를 사용합니다. 질의는 저장된 벡터에 잡음을 더해 만듭니다.
+각 인덱스는 별도 프로세스에서 열어 인덱스를 열고 질의를 실행한 뒤 늘어난 resident memory(RSS)를 측정합니다.
+
+사용 예:
+    python benchmarks/vector_index.py --documents 20000 --queries 200 --dims 256 1024 --output vector_index.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LLM_RAG_DIR = os.path.join(ROOT_DIR, 'llm_rag')
+if LLM_RAG_DIR not in sys.path:
+    sys.path.append(LLM_RAG_DIR)
+
+from quantized_index import QuantizedIndex, build_from_chroma, normalize  # noqa: E402
+
+
+def resident_bytes():
+    """
+    (anonymous, file) resident memory (Linux /proc/self/status).
+    memmap으로 읽은 파일 page는 RssFile에 잡히며, 메모리가 부족하면 커널이 다시 가져갈 수 있음
+    """
+    values = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(('RssAnon:', 'RssFile:')):
+                name, value = line.split(':')
+                values[name] = int(value.split()[0]) * 1024
+    return values['RssAnon'], values['RssFile']
+
+
+def make_vectors(count, dim, clusters, seed):
+    """cluster 구조가 있고 앞 차원일수록 분산이 큰 정규화 벡터"""
+    rng = np.random.default_rng(seed)
+    spectrum = (1 + np.arange(dim)) ** -0.5
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32) * spectrum
+    vectors = centers[rng.integers(0, clusters, count)]
+    vectors += 0.5 * rng.standard_normal((count, dim)).astype(np.float32) * spectrum
+    return normalize(vectors)
+
+
+def make_queries(vectors, count, noise, seed):
+    rng = np.random.default_rng(seed + 1)
+    rows = rng.integers(0, len(vectors), count)
+    spectrum = (1 + np.arange(vectors.shape[1])) ** -0.5
+    return normalize(vectors[rows] + noise * rng.standard_normal((count, vectors.shape[1])) * spectrum)
+
+
+def exact_top_k(vectors, queries, k):
+    return np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+
+def recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def run_backend(backend, workdir, k, oversample):
+    """별도 프로세스에서 인덱스를 열고 질의를 실행해 (찾은 행 번호, 시간, RSS 증가량)을 반환합니다."""
+    queries = np.load(os.path.join(workdir, 'queries.npy'))
+    before = resident_bytes()
+    started = time.perf_counter()
+
+    if backend == 'exact':
+        vectors = np.load(os.path.join(workdir, 'vectors.npy'))
+
+        def search(query):
+            return np.argsort(-(vectors @ query))[:k]
+        index_bytes = vectors.nbytes
+    elif backend == 'chroma':
+        import chromadb
+
+        collection = chromadb.PersistentClient(path=os.path.join(workdir, 'chroma')).get_collection('bench')
+
+        def search(query):
+            ids = collection.query(query_embeddings=[query.tolist()], n_results=k)['ids'][0]
+            return [int(doc_id) for doc_id in ids]
+        search(queries[0])  # HNSW segment를 메모리에 올림
+        index_bytes = None
+    else:
+        index = QuantizedIndex.open(os.path.join(workdir, backend))
+
+        def search(query):
+            return [row for row, _ in index.search(query, k, oversample)]
+        index_bytes = index.memory_bytes()
+    load_seconds = time.perf_counter() - started
+
+    found = []
+    started = time.perf_counter()
+    for query in queries:
+        found.append(search(query))
+    seconds = time.perf_counter() - started
+    after = resident_bytes()
+    return {
+        'found': [list(map(int, rows)) for rows in found],
+        'load_seconds': load_seconds,
+        'qps': len(queries) / seconds,
+        'index_bytes': index_bytes,
+        # 프로세스 전용 메모리(anon)와 memmap 파일 page(file)의 증가량
+        'rss_anon_delta_bytes': after[0] - before[0],
+        'rss_file_delta_bytes': after[1] - before[1],
+    }
+
+
+def build_chroma(workdir, vectors, batch_size=5000):
+    import chromadb
+
+    client = chromadb.PersistentClient(path=os.path.join(workdir, 'chroma'))
+    collection = client.create_collection('bench', metadata={'hnsw:space': 'cosine'})
+    for start in range(0, len(vectors), batch_size):
+        rows = range(start, min(start + batch_size, len(vectors)))
+        collection.add(ids=[str(row) for row in rows], embeddings=vectors[start:start + batch_size].tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='양자화 로컬 vector 인덱스의 recall@k, QPS, 메모리를 측정합니다.')
+    parser.add_argument('--documents', type=int, default=10000, help='합성 벡터 수')
+    parser.add_argument('--full-dim', type=int, default=3072, help='합성 벡터 차원 (text-embedding-3-large: 3072)')
+    parser.add_argument('--clusters', type=int, default=200, help='합성 벡터의 cluster 수')
+    parser.add_argument('--chroma-directory', help='합성 벡터 대신 이 Chroma 저장소의 벡터를 사용')
+    parser.add_argument('--collection', default='spring_framework_docs')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--noise', type=float, default=0.6, help='질의를 만들 때 더할 잡음의 크기')
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--oversample', type=int, default=10, help='rescoring할 후보 수 = k * oversample')
+    parser.add_argument('--dims', type=int, nargs='+', default=[256, 512, 1024])
+    parser.add_argument('--quantizations', nargs='+', choices=['int8', 'binary'], default=['int8', 'binary'])
+    parser.add_argument('--skip-chroma', action='store_true', help='Chroma(HNSW) 비교를 건너뜀')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='결과를 저장할 JSON 파일 경로')
+    args = parser.parse_args()
+
+    result = {'config': vars(args), 'backends': {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.chroma_directory:
+            index = build_from_chroma(args.chroma_directory, args.collection, os.path.join(workdir, 'source'),
+                                      dim=10 ** 6)
+            vectors = np.asarray(index.full)
+        else:
+            vectors = make_vectors(args.documents, args.full_dim, args.clusters, args.seed)
+        queries = make_queries(vectors, args.queries, args.noise, args.seed)
+        np.save(os.path.join(workdir, 'vectors.npy'), vectors)
+        np.save(os.path.join(workdir, 'queries.npy'), queries)
+        truth = exact_top_k(vectors, queries, args.k)
+        result['documents'] = len(vectors)
+
+        backends = ['exact']
+        if not args.skip_chroma:
+            try:
+                build_chroma(workdir, vectors)
+                backends.append('chroma')
+            except ImportError:
+                result['chroma_skipped'] = 'chromadb is not installed'
+        ids = [str(row) for row in range(len(vectors))]
+        for dim in args.dims:
+            for quantization in args.quantizations:
+                name = f'quantized-{quantization}-{dim}'
+                QuantizedIndex.build(os.path.join(workdir, name), ids, [''] * len(vectors), [{}] * len(vectors),
+                                     vectors, dim=dim, quantization=quantization)
+                backends.append(name)
+        del vectors
+
+        # 인덱스마다 새 프로세스에서 측정 (이전 인덱스가 올린 메모리가 섞이지 않도록)
+        for backend in backends:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                measured = executor.submit(run_backend, backend, workdir, args.k, args.oversample).result()
+            found = measured.pop('found')
+            result['backends'][backend] = {f'recall@{args.k}': recall(found, truth), **measured}
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+시세 DataFrame을 LLM에 넘길 작은 요약(지표)으로 바꾸는 모듈 (stock-multi-agent.py의 get_stock_price).
+
+기존에는 한 달치 일별 시세(Open/High/Low/Close/Volume)를 to_dict()로 그대로 넘겨 이후 supervisor/analyst 호출마다
+프롬프트 토큰이 크게 늘었지만, 이 모듈은 ticker마다 항상 같은 개수의 값만 반환합니다.
+
+- 수익률: 1일/5일/21일(약 한 달)/전체 기간
+- 변동성: 일별 로그 수익률의 표준편차(연율화)
+- 이동평균: 단기/장기 이동평균의 위치와 마지막 교차(golden/death cross)
+- 낙폭: 최대 낙폭(max drawdown)과 현재 고점 대비 낙폭
+- 거래량 이상: 직전 volume_window일 평균 대비 z-score가 volume_z를 넘은 날
+
+여러 ticker를 (거래일 x ticker) 행렬 하나로 모아 한 번에 계산합니다.
+    summaries = summarize_prices({'AAPL': aapl_frame, 'NVDA': nvda_frame})
+"""
+import numpy as np
+import pandas as pd
+
+RETURN_WINDOWS = (1, 5, 21)
+SHORT_WINDOW = 5
+LONG_WINDOW = 20
+VOLUME_WINDOW = 20
+VOLUME_Z = 2.0
+TRADING_DAYS = 252
+
+
+def _matrix(frames, column):
+    # ticker별 시세를 마지막 거래일 기준으로 오른쪽 정렬한 (거래일 x ticker) 행렬로 합침
+    # (ticker마다 기간이 달라도 마지막 행이 각 ticker의 최신 값이 되고, 모자란 앞부분은 NaN)
+    rows = max((len(frame) for frame in frames.values()), default=0)
+    matrix = np.full((rows, len(frames)), np.nan)
+    for i, frame in enumerate(frames.values()):
+        if column in frame and len(frame):
+            matrix[rows - len(frame):, i] = frame[column].to_numpy(dtype=float)
+    return pd.DataFrame(matrix, columns=list(frames))
+
+
+def _last_true(mask):
+    """열마다 마지막으로 True인 행 번호 (없으면 -1)"""
+    if not len(mask):
+        return np.full(mask.shape[1], -1)
+    reversed_index = np.argmax(mask[::-1], axis=0)
+    return np.where(mask.any(axis=0), len(mask) - 1 - reversed_index, -1)
+
+
+def _value(value, digits):
+    value = float(value)
+    return None if np.isnan(value) else round(value, digits)
+
+
+def compute_indicators(frames, return_windows=RETURN_WINDOWS, short_window=SHORT_WINDOW, long_window=LONG_WINDOW,
+                       volume_window=VOLUME_WINDOW, volume_z=VOLUME_Z):
+    """
+    여러 ticker의 지표를 한 번에 계산합니다.
+
+    Args:
+        frames (dict): ticker -> Close/Volume 컬럼이 있는 일별 시세 DataFrame (MarketDataStore.get_prices 결과)
+        return_windows (tuple): 수익률을 계산할 거래일 수
+        short_window (int), long_window (int): 단기/장기 이동평균 거래일 수
+        volume_window (int): 거래량 평균/표준편차를 계산할 직전 거래일 수
+        volume_z (float): 거래량 이상으로 볼 z-score
+
+    Returns:
+        pd.DataFrame: ticker를 index로 하는 지표 표 (값이 없으면 NaN)
+    """
+    close = _matrix(frames, 'Close').ffill()
+    volume = _matrix(frames, 'Volume')
+    values = close.to_numpy()
+    rows = len(values)
+    result = pd.DataFrame(index=close.columns)
+    result['days'] = close.notna().sum().to_numpy()
+    result['last_close'] = values[-1] if rows else np.nan
+
+    for window in return_windows:
+        result[f'return_{window}d'] = values[-1] / values[-1 - window] - 1 if rows > window else np.nan
+    first = close.bfill().iloc[0].to_numpy() if rows else np.nan
+    result['return_period'] = values[-1] / first - 1 if rows else np.nan
+
+    log_returns = np.log(close).diff()
+    result['volatility'] = (log_returns.std() * np.sqrt(TRADING_DAYS)).to_numpy()
+
+    # 이동평균: 단기 - 장기의 부호가 바뀐 날이 교차일 (+1: golden cross, -1: death cross)
+    short_ma = close.rolling(short_window).mean()
+    long_ma = close.rolling(long_window).mean()
+    sign = np.sign((short_ma - long_ma).to_numpy())
+    previous = np.vstack([np.full((1, sign.shape[1]), np.nan), sign[:-1]]) if rows else sign
+    crossed = (sign != previous) & ~np.isnan(sign) & ~np.isnan(previous) & (sign != 0)
+    last_cross = _last_true(crossed)
+    columns = np.arange(sign.shape[1])
+    result['ma_trend'] = sign[-1] if rows else np.nan
+    result['price_vs_long_ma'] = values[-1] / long_ma.to_numpy()[-1] - 1 if rows else np.nan
+    result['last_cross'] = np.where(last_cross >= 0, sign[np.maximum(last_cross, 0), columns] if rows else 0, np.nan)
+    result['last_cross_days_ago'] = np.where(last_cross >= 0, rows - 1 - last_cross, np.nan)
+
+    drawdown = close / close.cummax() - 1
+    result['max_drawdown'] = drawdown.min().to_numpy()
+    result['drawdown'] = drawdown.to_numpy()[-1] if rows else np.nan
+
+    # 거래량 z-score: 그날을 제외한 직전 volume_window일의 평균/표준편차 기준
+    history = volume.shift(1).rolling(volume_window, min_periods=min(5, volume_window))
+    z = ((volume - history.mean()) / history.std()).to_numpy()
+    anomalies = np.nan_to_num(z, nan=0.0) > volume_z
+    last_anomaly = _last_true(anomalies)
+    result['volume_z'] = z[-1] if len(z) else np.nan
+    result['volume_anomalies'] = anomalies.sum(axis=0)
+    result['last_volume_anomaly_days_ago'] = np.where(last_anomaly >= 0, len(z) - 1 - last_anomaly, np.nan)
+    return result
+
+
+def summarize_prices(frames, **kwargs):
+    """
+    compute_indicators 결과를 ticker별 작은 dict로 바꿉니다. ticker 수와 기간에 관계없이 ticker마다 키 개수가 같습니다.
+
+    Returns:
+        dict: ticker -> {as_of, days, last_close, returns, volatility, moving_average, drawdown, volume}
+    """
+    table = compute_indicators(frames, **kwargs)
+    short_window = kwargs.get('short_window', SHORT_WINDOW)
+    long_window = kwargs.get('long_window', LONG_WINDOW)
+    summaries = {}
+    for ticker, row in table.iterrows():
+        frame = frames[ticker]
+        trend = row['ma_trend']
+        cross = row['last_cross']
+        summaries[ticker] = {
+            'as_of': frame.index[-1].date().isoformat() if len(frame) else None,
+            'days': int(row['days']),
+            'last_close': _value(row['last_close'], 2),
+            'returns': {
+                key.removeprefix('return_'): _value(row[key], 4) for key in row.index if key.startswith('return_')
+            },
+            'volatility': _value(row['volatility'], 4),
+            'moving_average': {
+                'windows': [short_window, long_window],
+                'trend': None if np.isnan(trend) else ('bullish' if trend > 0 else 'bearish' if trend < 0 else 'flat'),
+                'price_vs_long_ma': _value(row['price_vs_long_ma'], 4),
+                'last_cross': None if np.isnan(cross) else ('golden' if cross > 0 else 'death'),
+                'last_cross_days_ago': None if np.isnan(row['last_cross_days_ago']) else int(row['last_cross_days_ago']),
+            },
+            'drawdown': {'max': _value(row['max_drawdown'], 4), 'current': _value(row['drawdown'], 4)},
+            'volume': {
+                'z_score': _value(row['volume_z'], 2),
+                'anomalies': int(row['volume_anomalies']),
+                'last_anomaly_days_ago': (
+                    None if np.isnan(row['last_volume_anomaly_days_ago']) else int(row['last_volume_anomaly_days_ago'])
+                ),
+            },
+        }
+    return summaries
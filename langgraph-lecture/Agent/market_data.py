@@ -0,0 +1,303 @@
+"""
+stock-multi-agent.py의 tool이 사용하는 시세/기업 정보 캐시.
+
+- 시세(prices): ticker별 Parquet 파일에 날짜 단위로 저장하고, 요청한 기간 중 비어 있는 날짜만 provider에서 받아옴
+- 기업 정보(info, financials, sec_filings): ticker별 snapshot을 JSON으로 저장하고 종류별 TTL이 지나면 다시 받아옴
+- 같은 ticker에 대한 동시 요청은 하나로 합쳐서(coalescing) provider를 한 번만 호출
+- provider는 YahooFinanceProvider 대신 FakeMarketDataProvider를 넘겨 네트워크 없이 사용할 수 있음
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# 데이터 종류별 TTL(초). 과거 시세는 바뀌지 않으므로 prices의 TTL은 오늘 날짜 데이터에만 적용
+DEFAULT_TTL = {
+    'prices': 15 * 60,
+    'info': 24 * 60 * 60,
+    'financials': 7 * 24 * 60 * 60,
+    'sec_filings': 24 * 60 * 60,
+}
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+class YahooFinanceProvider:
+    """yfinance로 시세와 기업 정보를 받아오는 provider"""
+
+    def fetch_prices(self, ticker, start, end):
+        import yfinance as yf
+
+        frame = yf.download(ticker, start=start.isoformat(), end=end.isoformat(), progress=False)
+        if isinstance(frame.columns, pd.MultiIndex):
+            # 최신 yfinance는 ticker 하나를 받아와도 (Price, Ticker) 2단 컬럼을 반환
+            frame.columns = frame.columns.get_level_values(0)
+        return frame
+
+    def fetch_info(self, ticker):
+        import yfinance as yf
+
+        return yf.Ticker(ticker).info
+
+    def fetch_financials(self, ticker):
+        import yfinance as yf
+
+        return json.loads(yf.Ticker(ticker).financials.to_json(date_format='iso'))
+
+    def fetch_sec_filings(self, ticker):
+        import yfinance as yf
+
+        return json.loads(json.dumps(yf.Ticker(ticker).sec_filings, default=str))
+
+
+class FakeMarketDataProvider:
+    """
+    네트워크 없이 같은 입력에 항상 같은 값을 돌려주는 provider (테스트/벤치마크용).
+    calls에 종류별 호출 횟수를, fetched_days에 받아온 시세 일 수를 기록합니다.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = {}
+        self.fetched_days = 0
+        self._lock = threading.Lock()
+
+    def _record(self, kind):
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+        if self.delay:
+            time.sleep(self.delay)
+
+    @staticmethod
+    def _seed(ticker):
+        return int(hashlib.sha256(ticker.encode('utf-8')).hexdigest()[:8], 16)
+
+    def fetch_prices(self, ticker, start, end):
+        self._record('prices')
+        days = pd.bdate_range(start, end - timedelta(days=1), name='Date')
+        with self._lock:
+            self.fetched_days += len(days)
+        seed = self._seed(ticker)
+        # 날짜마다 고정된 값이 나오도록 (ticker, 날짜)로 가격을 계산
+        base = 50 + seed % 200
+        offsets = np.array([day.toordinal() % 30 for day in days], dtype=float)
+        close = base + offsets
+        return pd.DataFrame({
+            'Open': close - 0.5,
+            'High': close + 1.0,
+            'Low': close - 1.0,
+            'Close': close,
+            'Volume': (1_000_000 + (seed % 1000) * 1000 + offsets * 10_000).astype('int64'),
+        }, index=days)
+
+    def fetch_info(self, ticker):
+        self._record('info')
+        return {'symbol': ticker, 'longName': f'{ticker} Inc.', 'marketCap': self._seed(ticker) * 1000}
+
+    def fetch_financials(self, ticker):
+        self._record('financials')
+        return {'2024-12-31': {'Total Revenue': float(self._seed(ticker) % 10_000) * 1e6}}
+
+    def fetch_sec_filings(self, ticker):
+        self._record('sec_filings')
+        return [{'date': '2025-02-27', 'type': '10-K', 'title': f'{ticker} annual report'}]
+
+
+def period_start(period, today):
+    """'10d', '2wk', '1mo', '1y' 형식의 기간을 시작 날짜로 바꿉니다. (yfinance의 period 표기)"""
+    match = re.fullmatch(r'(\d+)(d|wk|mo|y)', period)
+    if not match:
+        raise ValueError(f'unsupported period: {period}')
+    amount, unit = int(match.group(1)), match.group(2)
+    if unit == 'd':
+        return today - timedelta(days=amount)
+    if unit == 'wk':
+        return today - timedelta(weeks=amount)
+    months = amount if unit == 'mo' else amount * 12
+    return (pd.Timestamp(today) - pd.DateOffset(months=months)).date()
+
+
+class MarketDataStore:
+    """
+    시세/기업 정보를 디스크에 캐시하는 저장소.
+
+        market_data = MarketDataStore(cache_dir, YahooFinanceProvider())
+        market_data.get_prices('RXRX', period='1mo')
+
+    - prices/{ticker}.parquet: 날짜별 시세 (Open, High, Low, Close, Volume)
+    - index.sqlite3: ticker별로 받아온 시세 기간(coverage)과 기업 정보 snapshot
+    """
+
+    def __init__(self, cache_dir, provider, ttl=None, clock=time.time):
+        self.provider = provider
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+        self.clock = clock
+
+        self._prices_dir = os.path.join(cache_dir, 'prices')
+        os.makedirs(self._prices_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite3'), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS coverage ("
+            "ticker TEXT PRIMARY KEY, start TEXT NOT NULL, end TEXT NOT NULL, fetched_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            "kind TEXT NOT NULL, ticker TEXT NOT NULL, payload TEXT NOT NULL, fetched_at REAL NOT NULL, "
+            "PRIMARY KEY (kind, ticker))"
+        )
+        self._conn.commit()
+
+        # _lock은 SQLite 연결과 통계를, _key_locks는 같은 ticker에 대한 동시 요청을 하나로 합치는 데 사용
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _today(self):
+        return datetime.fromtimestamp(self.clock()).date()
+
+    def _prices_path(self, ticker):
+        return os.path.join(self._prices_dir, f'{ticker.upper()}.parquet')
+
+    def _read_prices(self, ticker):
+        path = self._prices_path(ticker)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=PRICE_COLUMNS, index=pd.DatetimeIndex([], name='Date'))
+        return pd.read_parquet(path)
+
+    def _write_prices(self, ticker, frame):
+        # 다른 스레드/프로세스가 쓰다 만 파일을 읽지 않도록 임시 파일에 쓴 뒤 교체
+        path = self._prices_path(ticker)
+        frame.to_parquet(path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    def _missing_ranges(self, ticker, start, end, today):
+        """[start, end) 중 아직 받아오지 않았거나 TTL이 지난 날짜 구간 목록"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT start, end, fetched_at FROM coverage WHERE ticker = ?", (ticker,)
+            ).fetchone()
+        if row is None:
+            return [(start, end)]
+
+        covered_start, covered_end = date.fromisoformat(row[0]), date.fromisoformat(row[1])
+        # 오늘 날짜 시세는 장중에 바뀌므로 TTL이 지나면 오늘부터 다시 받아옴
+        if covered_end > today and self.clock() - row[2] > self.ttl['prices']:
+            covered_end = today
+        # 받아둔 마지막 날짜가 지났는데 그날이 끝나기 전에 받은 것이면(장중 시세) 확정된 시세로 그날부터 다시 받아옴
+        elif covered_end <= today and datetime.fromtimestamp(row[2]).date() < covered_end:
+            covered_end -= timedelta(days=1)
+        if covered_start >= end or covered_end <= start:
+            # 받아둔 기간과 겹치지 않으면 사이의 빈 날짜까지 함께 받아 coverage를 하나의 구간으로 유지
+            return [(min(start, covered_end), max(end, covered_start))]
+
+        ranges = []
+        if start < covered_start:
+            ranges.append((start, covered_start))
+        if end > covered_end:
+            ranges.append((covered_end, end))
+        return ranges
+
+    def get_prices(self, ticker, period='1mo', start=None, end=None):
+        """
+        ticker의 일별 시세를 DataFrame으로 반환합니다. 캐시에 없는 날짜만 provider에서 받아옵니다.
+
+        Args:
+            ticker (str): 종목 코드
+            period (str): start를 생략했을 때 사용할 기간 (예: '10d', '1mo', '1y')
+            start (date): 시작 날짜 (포함)
+            end (date): 끝 날짜 (포함하지 않음). 생략하면 오늘까지
+        """
+        ticker = ticker.upper()
+        today = self._today()
+        end = end or today + timedelta(days=1)
+        start = start or period_start(period, today)
+
+        with self._key_lock(('prices', ticker)):
+            missing = self._missing_ranges(ticker, start, end, today)
+            frame = self._read_prices(ticker)
+            if missing:
+                fetched = [self.provider.fetch_prices(ticker, range_start, range_end) for range_start, range_end in missing]
+                parts = [part for part in [frame] + [part[PRICE_COLUMNS] for part in fetched] if len(part)]
+                if parts:
+                    frame = pd.concat(parts)
+                    frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+                self._write_prices(ticker, frame)
+
+                starts = [start] + [range_start for range_start, _ in missing]
+                ends = [end] + [range_end for _, range_end in missing]
+                fetched_at = self.clock()
+                with self._lock:
+                    row = self._conn.execute(
+                        "SELECT start, end, fetched_at FROM coverage WHERE ticker = ?", (ticker,)
+                    ).fetchone()
+                    if row:
+                        starts.append(date.fromisoformat(row[0]))
+                        ends.append(date.fromisoformat(row[1]))
+                        # fetched_at은 마지막 날짜를 받아온 시각이므로, 앞쪽 기간만 받아왔으면 이전 값을 유지
+                        if max(range_end for _, range_end in missing) < max(ends):
+                            fetched_at = row[2]
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO coverage (ticker, start, end, fetched_at) VALUES (?, ?, ?, ?)",
+                        (ticker, min(starts).isoformat(), max(ends).isoformat(), fetched_at),
+                    )
+                    self._conn.commit()
+
+        with self._lock:
+            if missing:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return frame.loc[pd.Timestamp(start):pd.Timestamp(end) - pd.Timedelta(days=1)]
+
+    def get_snapshot(self, kind, ticker):
+        """
+        기업 정보 snapshot(kind: 'info', 'financials', 'sec_filings')을 반환합니다.
+        kind별 TTL 안에 받아온 값이 있으면 provider를 호출하지 않습니다.
+        """
+        ticker = ticker.upper()
+        with self._key_lock((kind, ticker)):
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT payload, fetched_at FROM snapshots WHERE kind = ? AND ticker = ?", (kind, ticker)
+                ).fetchone()
+            if row and self.clock() - row[1] <= self.ttl[kind]:
+                with self._lock:
+                    self.hits += 1
+                return json.loads(row[0])
+
+            # 캐시에서 읽을 때와 같은 값이 되도록 JSON으로 바꾼 값을 반환
+            payload = json.dumps(getattr(self.provider, f'fetch_{kind}')(ticker), default=str)
+            with self._lock:
+                self.misses += 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO snapshots (kind, ticker, payload, fetched_at) VALUES (?, ?, ?, ?)",
+                    (kind, ticker, payload, self.clock()),
+                )
+                self._conn.commit()
+            return json.loads(payload)
+
+    def get_info(self, ticker):
+        return self.get_snapshot('info', ticker)
+
+    def get_financials(self, ticker):
+        return self.get_snapshot('financials', ticker)
+
+    def get_sec_filings(self, ticker):
+        return self.get_snapshot('sec_filings', ticker)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else None}
@@ -1,5 +1,8 @@
+import os
+import sys
+from functools import partial
+
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langgraph.graph import MessagesState
 from langgraph.types import Command
 from typing import Literal
@@ -8,57 +11,85 @@ from langchain_community.tools.yahoo_finance_news import YahooFinanceNewsTool
 from langgraph.prebuilt import create_react_agent
 from langchain_community.agent_toolkits.polygon.toolkit import PolygonToolkit
 from langchain_community.utilities.polygon import PolygonAPIWrapper
-import yfinance as yf
 from langchain.tools import tool
 from langchain_core.prompts import PromptTemplate
 from typing import Literal
 from typing_extensions import TypedDict
 from langgraph.graph import MessagesState, StateGraph, START, END
-from langgraph.types import Command
+from langgraph.types import Command, Send
+
+from indicators import summarize_prices
+from market_data import MarketDataStore, YahooFinanceProvider
+
+# llm_rag의 계측 모듈(instrumentation.py)과 모델 router(model_router.py)를 함께 사용
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'llm_rag'))
+
+from instrumentation import get_callbacks
+from model_router import get_model_router
 
 load_dotenv()
 
-llm = ChatOpenAI(model='gpt-4o')
-small_llm = ChatOpenAI(model='gpt-4o-mini')
+# 같은 ticker의 시세/기업 정보는 디스크 캐시(market_cache/)에서 재사용하고, 비어 있는 날짜만 yfinance로 받아옴
+# 네트워크 없이 실행하려면 YahooFinanceProvider() 대신 market_data.FakeMarketDataProvider()를 넘기면 된다.
+market_data_store = MarketDataStore(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'market_cache'), YahooFinanceProvider()
+)
+
+# 역할별 모델은 llm_rag/model_routing.json에서 정함
+# worker 선택(plan)과 자료 조사(research)는 small tier, 최종 분석(analyst)만 large tier 모델을 사용
+model_router = get_model_router()
+research_llm = model_router.get('research')
+small_llm = model_router.get('plan')
+analyst_llm = model_router.get('analyst')
 
 polygon = PolygonAPIWrapper()
 toolkit = PolygonToolkit.from_polygon_api_wrapper(polygon)
 polygon_tools = toolkit.get_tools()
 market_research_tools = [YahooFinanceNewsTool()] + polygon_tools
 market_research_agent = create_react_agent(
-    llm,
+    research_llm,
     tools=market_research_tools,
     state_modifier='You are a market researcher. Provide fact only not opinions'
 )
 
 
+def research(state: MessagesState, agent, name):
+    """
+    research agent를 실행하고, 마지막 답변을 worker 이름을 붙인 메시지로 반환합니다.
+    parallel 모드에서는 이 함수가 그대로 worker node가 됩니다.
+    """
+    result = agent.invoke(state)
+    return {'messages': [HumanMessage(content=result['messages'][-1].content, name=name)]}
+
+
 def market_research_node(state: MessagesState) -> Command[Literal["supervisor"]]:
-    result = market_research_agent.invoke(state)
     # print(f'market_research_node: {result}')
     return Command( 
-        update={'messages': [HumanMessage(content=result['messages'][-1].content, name='market_research')]},
+        update=research(state, market_research_agent, 'market_research'),
         goto='stock_research'
     )
 
 
 @tool
-def get_stock_price(ticker: str) -> str:
-    """Given a stock ticker, return the price data for the past Month""" # 10 days
-    stock_info = yf.download(ticker, period='1mo').to_dict() # 10d
-    return stock_info
+def get_stock_price(ticker: str) -> dict:
+    """Given a stock ticker, return a summary of the past 3 months of prices: returns (1d/5d/21d/period), annualized volatility, 5/20-day moving average trend and crossover, drawdown and volume anomalies"""
+    # 일별 시세 전체(to_dict) 대신 지표 요약(indicators.py)만 넘겨 이후 supervisor/analyst 호출의 프롬프트 토큰을 줄임
+    # 요약의 크기는 기간과 관계없으므로 20일 이동평균을 계산할 수 있도록 3개월치를 사용
+    ticker = ticker.upper()
+    prices = market_data_store.get_prices(ticker, period='3mo')
+    return summarize_prices({ticker: prices})[ticker]
 
 
 stock_research_tools = [get_stock_price]
 stock_research_agent = create_react_agent(
-    llm, tools=stock_research_tools, state_modifier='You are a stock researcher. Provide facts only not opinions'
+    research_llm, tools=stock_research_tools, state_modifier='You are a stock researcher. Provide facts only not opinions'
 )
 
 
 def stock_research_node(state: MessagesState) -> Command[Literal["supervisor"]]:
-    result = stock_research_agent.invoke(state)
     # print(f'stock_research_node: {result}')
     return Command(
-        update={'messages': [HumanMessage(content=result['messages'][-1].content, name='stock_research')]},
+        update=research(state, stock_research_agent, 'stock_research'),
         goto='supervisor'
     )
 
@@ -66,9 +97,8 @@ def stock_research_node(state: MessagesState) -> Command[Literal["supervisor"]]:
 @tool
 def company_research_tool(ticker: str) -> dict:
     """Given a ticker, return the financial information and SEC filings"""
-    company_info = yf.Ticker(ticker).info
-    finacial_info = company_info.get_financials()
-    sec_filings = company_info.get_sec_filings()
+    finacial_info = market_data_store.get_financials(ticker)
+    sec_filings = market_data_store.get_sec_filings(ticker)
     return {
         'financial_info': finacial_info,
         'sec_filings': sec_filings
@@ -76,15 +106,14 @@ def company_research_tool(ticker: str) -> dict:
 
 company_research_tools = [company_research_tool]
 company_rearch_agent = create_react_agent(
-    llm, tools=company_research_tools, state_modifier='Yoy are a company researcher. Provide facts only not opinions'
+    research_llm, tools=company_research_tools, state_modifier='Yoy are a company researcher. Provide facts only not opinions'
 )
 
 
 def company_research_node(state: MessagesState) -> Command[Literal["supervisor"]]:
-    result = company_rearch_agent.invoke(state)
     # print(f'company_research_node: {result})
     return Command(
-        update = {'messages': [HumanMessage(content=result['messages'][-1].content, name='company_research')]},
+        update = research(state, company_rearch_agent, 'company_research'),
         goto='supervisor'
     )
 
@@ -100,7 +129,7 @@ Translation into Korean:
 {{Korean_Result}}"""
 )
 
-analyst_chain = analyst_prompt | llm
+analyst_chain = analyst_prompt | analyst_llm
 
 def analyst_node(state: MessagesState):
     """
@@ -135,7 +164,7 @@ class Router(TypedDict):
     next: Literal[members + ["FINISH"]]
 
 
-def supervisor_node(state: MessagesState) -> Command[Literal[["market_research", "stock_research", "company_research"], "analyst"]]:
+def supervisor_node(state: MessagesState) -> Command[Literal["market_research", "stock_research", "company_research", "analyst"]]:
     """
     supervisor node입니다. 주어진 State를 기반으로 각 worker의 결과를 종합하고,
     다음에 수행할 worker를 결정합니다. 모든 작업이 완료되면 analyst node로 이동합니다.
@@ -149,26 +178,108 @@ def supervisor_node(state: MessagesState) -> Command[Literal[["market_research",
     messages = [
         {"role": "system", "content": system_prompt},
     ] + state["messages"]
-    response = llm.with_structured_output(Router).invoke(messages)
+    response = small_llm.with_structured_output(Router).invoke(messages)
     goto = response["next"]
     if goto == "FINISH":
         goto = "analyst"
 
     return Command(goto=goto)
 
-graph_builder = StateGraph(MessagesState)
+research_agents = {
+    'market_research': market_research_agent,
+    'stock_research': stock_research_agent,
+    'company_research': company_rearch_agent,
+}
+
+plan_prompt = (
+    "You are a supervisor managing the following research workers: "
+    f"{members}. Given the user request, choose every worker whose research is needed."
+    " They will all run at the same time, so choose them all at once."
+)
+
+
+class ResearchPlan(TypedDict):
+    """Workers to run in parallel. If empty, all workers run."""
+    workers: list[Literal["market_research", "stock_research", "company_research"]]
+
+
+def plan_research_node(state: MessagesState) -> Command[Literal["market_research", "stock_research", "company_research"]]:
+    """
+    parallel 모드의 supervisor node입니다. 필요한 worker를 한 번에 고르고 Send로 동시에 실행합니다.
+    worker를 고르는 것만 하므로 small tier 모델(small_llm)을 사용합니다.
+
+    Args:
+        state (MessagesState): 현재 메시지 상태를 나타내는 객체입니다.
+
+    Returns:
+        Command: 선택한 worker마다 Send를 담은 명령을 반환합니다.
+    """
+    messages = [
+        {"role": "system", "content": plan_prompt},
+    ] + state["messages"]
+    response = small_llm.with_structured_output(ResearchPlan).invoke(messages)
+    workers = list(dict.fromkeys(response.get("workers") or members))
+    return Command(goto=[Send(worker, state) for worker in workers])
 
-graph_builder.add_node("supervisor", supervisor_node)
-graph_builder.add_node("market_research", market_research_node)
-graph_builder.add_node("stock_research", stock_research_node)
-graph_builder.add_node("company_research", company_research_node)
-graph_builder.add_node("analyst", analyst_node)
 
-graph_builder.add_edge(START, "supervisor")
-graph_builder.add_edge("analyst", END)
-graph = graph_builder.compile()
+def _compile(graph_builder, callbacks, checkpointer):
+    # instrumentation이 꺼져 있으면 callback 없이 compile
+    if checkpointer is None:
+        from config import graph_checkpoint_enabled
+        from graph_checkpoint import get_checkpointer
 
-for chunk in graph.stream(
-    {"messages": [("user", "Yould you invest in Recursion Pharmaceuticals Inc?")]}, stream_mode="values"
-):
-    chunk['messages'][-1].pretty_print()
+        checkpointer = get_checkpointer() if graph_checkpoint_enabled else None
+    graph = graph_builder.compile(checkpointer=checkpointer)
+    return graph.with_config(callbacks=callbacks) if callbacks else graph
+
+
+def build_graph(mode='parallel', callbacks=None, checkpointer=None):
+    """
+    supervisor 그래프를 만들어 compile한 결과를 반환합니다.
+
+    Args:
+        mode (str): 'parallel'이면 필요한 worker를 동시에 실행한 뒤 analyst를 한 번 호출하고,
+            'sequential'이면 기존처럼 supervisor가 worker를 하나씩 호출합니다.
+        callbacks (list): 그래프 실행에 붙일 callback. 생략하면 instrumentation 설정에 따라 node별 계측 callback을 붙입니다.
+        checkpointer: 그래프 실행 상태를 저장할 checkpointer. 생략하면 config.graph_checkpoint_enabled일 때
+            SQLite checkpointer(llm_rag/graph_checkpoint.py)를 사용합니다. checkpointer가 있으면 실행마다
+            configurable.thread_id가 필요하고, 실패한 실행은 graph.invoke(None, config)로 이어서 실행하며
+            이미 끝난 research worker는 다시 실행하지 않습니다.
+
+    Returns:
+        CompiledStateGraph: compile된 그래프를 반환합니다.
+    """
+    callbacks = get_callbacks('stock_multi_agent') if callbacks is None else callbacks
+    graph_builder = StateGraph(MessagesState)
+    graph_builder.add_node("analyst", analyst_node)
+    graph_builder.add_edge("analyst", END)
+
+    if mode == 'sequential':
+        graph_builder.add_node("supervisor", supervisor_node)
+        graph_builder.add_node("market_research", market_research_node)
+        graph_builder.add_node("stock_research", stock_research_node)
+        graph_builder.add_node("company_research", company_research_node)
+        graph_builder.add_edge(START, "supervisor")
+        return _compile(graph_builder, callbacks, checkpointer)
+
+    # worker의 결과 메시지는 MessagesState의 reducer(add_messages)가 합쳐 주고,
+    # Send로 보낸 worker는 같은 step에서 실행되므로 analyst는 모든 worker가 끝난 뒤 한 번만 실행된다.
+    graph_builder.add_node("supervisor", plan_research_node)
+    for name, agent in research_agents.items():
+        graph_builder.add_node(name, partial(research, agent=agent, name=name))
+        graph_builder.add_edge(name, "analyst")
+    graph_builder.add_edge(START, "supervisor")
+    return _compile(graph_builder, callbacks, checkpointer)
+
+
+graph = build_graph('parallel')
+
+if __name__ == '__main__':
+    import uuid
+
+    # checkpointer(config.graph_checkpoint_enabled)가 붙어 있으면 thread_id가 필요하므로 실행마다 새 thread_id를 사용
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    for chunk in graph.stream(
+        {"messages": [("user", "Yould you invest in Recursion Pharmaceuticals Inc?")]}, config, stream_mode="values"
+    ):
+        chunk['messages'][-1].pretty_print()
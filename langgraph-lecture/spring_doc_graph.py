@@ -1,185 +1,573 @@
 # %%
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+# import 시점에는 가벼운 모듈만 불러오고, hub 프롬프트/Chroma/ChatOpenAI 준비는 build_graph()를 호출할 때 수행
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from functools import lru_cache, partial
+from typing import Literal
+
+from typing_extensions import Annotated, List, TypedDict
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph, START, END
 
-embedding_function = OpenAIEmbeddings(model='text-embedding-3-large')
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-vector_store = Chroma (
-    embedding_function=embedding_function,
-    collection_name='spring_framework_docs',
-    persist_directory='./spring_framework_docs'
-)
-retriever = vector_store.as_retriever(search_kwargs={'k': 3})
+# llm_rag의 공용 모듈(임베딩 캐시 등)을 함께 사용
+sys.path.append(os.path.join(BASE_DIR, '..', 'llm_rag'))
+
+from context_packer import ContextPacker
+from hub_cache import pull_prompt
+from instrumentation import get_callbacks
+from query_rewriter import QueryRewriter, parse_dictionary
+from token_counter import count_tokens
+
+# node별 실행 시간/토큰 수는 instrumentation(config.instrumentation_enabled)으로 기록하고,
+# 평가 결과 같은 디버깅용 내용은 logging의 DEBUG 레벨로 남김
+logger = logging.getLogger(__name__)
+
+
+def add_tokens(current, update):
+    # tokens_used의 reducer: None이면 0으로 초기화하고, 아니면 더함
+    if update is None:
+        return 0
+    return (current or 0) + update
 
-# %%
-from typing_extensions import List, TypedDict
-from langchain_core.documents import Document
-from langgraph.graph import StateGraph
 
 class AgentState(TypedDict):
     query: str
     context: List[Document]
     answer: str
+    # 생성된 답변에 대한 평가 결과 (두 평가 node가 병렬로 채움)
+    hallucination: str
+    helpfulness: str
+    # 입력으로 넘길 수 있는 질의별 예산: 마감 시각(time.time() 기준), 최대 답변 생성 횟수, 토큰 예산
+    # init_budget이 budget으로 옮긴 뒤 비우므로, checkpointer로 같은 thread_id를 다시 사용해도 이전 실행의 값이 남지 않음
+    deadline: float
+    max_iterations: int
+    token_budget: int
+    # 이번 실행에 적용되는 예산 {'deadline', 'max_iterations', 'token_budget'} (입력에 없던 값은 build_graph의 기본값)
+    budget: dict
+    # 여러 node가 동시에 더할 수 있도록 합산(reducer)으로 누적 (init_budget이 None을 보내 실행마다 0부터 다시 셈)
+    tokens_used: Annotated[int, add_tokens]
+    generations: int
+    # hallucination이 아니라고 평가된 마지막 답변 (예산이 끝났을 때 대신 반환)
+    best_answer: str
+    degraded: bool
+    degraded_reason: str
+    # join_grades/rewrite가 정한 다음 경로와, 진행 중인 loop 정보 (loop 지연 시간 측정용)
+    route: str
+    loop: str
+    loop_started: float
+
+# %%
+# 형식: 표현1, 표현2 -> 바꿀 단어
+dictionary = ['사용자, 유저, 이용자 -> 클라이언트']
+rewrite_prompt = PromptTemplate.from_template(f"""
+사용자의 질문을 보고, 우리의 사전을 참고해서 사용자의 질문을 변경해주세요.
+사전: {dictionary}
+질문: {{query}}
+""")
+
+# hallucination_prompt = hub.pull("langchain-ai/rag-answer-hallucination")
+hallucination_prompt = PromptTemplate.from_template("""
+You are a teacher tasked with evaluating whether a student's answer is based on documents or not,
+Given documents, which are excerpts from income tax law, and a student's answer;
+If the student's answer is based on documents, respond with "not hallucinated",
+If the student's answer is not based on documents, respond with "hallucinated".
+
+documents: {documents}
+student_answer: {student_answer}
+
+""")
+
+# %%
+# 그래프에 필요한 구성 요소(retriever, LLM, 프롬프트)를 만드는 함수들
+# 무거운 import(langchain_chroma, langchain_openai)는 함수 안에서 수행
+
+def get_retriever():
+    from langchain_openai import OpenAIEmbeddings
+
+    from config import (
+        embedding_cache_dir, documents_pattern, vector_index_mode, quantized_index_dir, quantized_index_oversample,
+        chroma_persist_directory, lexical_fast_path, lexical_min_score, lexical_margin,
+    )
+    from embedding_cache import CachedEmbeddings
+    from hybrid_retriever import BM25Index, HybridRetriever, load_documents
+
+    embedding_function = CachedEmbeddings(OpenAIEmbeddings(model='text-embedding-3-large'), embedding_cache_dir)
+
+    if vector_index_mode == 'quantized':
+        # 양자화된 로컬 인덱스(quantized_index.py)로 후보를 고르고 원래 벡터로 다시 점수를 매김
+        from quantized_index import QuantizedRetriever, open_index
+
+        vector_retriever = QuantizedRetriever(
+            index=open_index(quantized_index_dir), embedding=embedding_function, k=3,
+            oversample=quantized_index_oversample,
+        )
+    else:
+        from langchain_chroma import Chroma
+
+        vector_store = Chroma (
+            embedding_function=embedding_function,
+            collection_name='spring_framework_docs',
+            persist_directory=chroma_persist_directory,
+        )
+        vector_retriever = vector_store.as_retriever(search_kwargs={'k': 3})
+    # ingest.py가 Chroma에 넣은 것과 같은 chunk의 BM25 검색과 vector 검색 결과를 RRF로 합치고,
+    # fast path를 켜 두었으면 키워드 검색이 확실할 때 임베딩 호출을 건너뜀
+    return HybridRetriever(
+        index=BM25Index(load_documents(documents_pattern)),
+        vector_retriever=vector_retriever,
+        k=3,
+        lexical_fast_path=lexical_fast_path,
+        lexical_min_score=lexical_min_score,
+        lexical_margin=lexical_margin,
+    )
+
+
+def get_llms():
+    # set the LANGSMITH_API_KEY environment variable (create key in settings)
+    # rewrite와 평가는 small tier, 답변 생성만 large tier 모델을 사용 (llm_rag/model_routing.json)
+    from model_router import get_model_router
+
+    router = get_model_router()
+    return {
+        'rewrite_llm': router.get('rewrite'),
+        'doc_relevance_llm': router.get('grade_relevance'),
+        'helpfulness_llm': router.get('grade_helpfulness'),
+        'generate_llm': router.get('generate'),
+        'hallucination_llm': router.get('grade_hallucination'),
+    }
+
+
+def get_prompts():
+    # prompt는 genereate, rewrite, 문서 관련성 등 프롬포트가 필요하다.
+    # 따라서 prompt라는 이름으로는 중복 변수 이름이 될 수 있다.
+    # hub 프롬프트는 chat.py와 같은 디렉터리(config.hub_cache_dir)에 저장해 한 번만 받아옴
+    from config import hub_cache_dir
+
+    return {
+        'generate': pull_prompt("rlm/rag-prompt", hub_cache_dir),
+        'doc_relevance': pull_prompt("langchain-ai/rag-document-relevance", hub_cache_dir),
+        'helpfulness': pull_prompt("langchain-ai/rag-answer-helpfulness", hub_cache_dir),
+        'rewrite': rewrite_prompt,
+        'hallucination': hallucination_prompt,
+    }
+
+# %%
+class LoopMetrics:
+    """
+    그래프의 loop(hallucinated -> generate, unhelpful -> rewrite -> retrieve)가 얼마나 자주 실행되고
+    loop 한 번이 응답 시간을 얼마나 늘리는지, 예산 부족으로 degraded 답변을 반환한 횟수를 기록합니다.
+    """
+
+    def __init__(self, maxlen=1000):
+        self._lock = threading.Lock()
+        self._maxlen = maxlen
+        self.queries = 0
+        self.loops = {}
+        self.latencies = {}
+        self.degraded = {}
+
+    def record_query(self):
+        with self._lock:
+            self.queries += 1
+
+    def record_loop(self, loop):
+        with self._lock:
+            self.loops[loop] = self.loops.get(loop, 0) + 1
+
+    def record_latency(self, loop, seconds):
+        with self._lock:
+            self.latencies.setdefault(loop, deque(maxlen=self._maxlen)).append(seconds)
+
+    def record_degraded(self, reason):
+        with self._lock:
+            self.degraded[reason] = self.degraded.get(reason, 0) + 1
+
+    def report(self):
+        """loop별 실행 횟수, 질의당 평균 횟수, 추가된 시간(초)의 평균/p95와 degraded 사유별 횟수를 반환합니다."""
+        with self._lock:
+            loops = {}
+            for loop, count in self.loops.items():
+                latencies = sorted(self.latencies.get(loop, []))
+                loops[loop] = {
+                    'count': count,
+                    'per_query': count / self.queries if self.queries else None,
+                    'avg_added_seconds': sum(latencies) / len(latencies) if latencies else None,
+                    'p95_added_seconds': latencies[int(len(latencies) * 0.95)] if latencies else None,
+                }
+            return {'queries': self.queries, 'loops': loops, 'degraded': dict(self.degraded)}
+
+
+loop_metrics = LoopMetrics()
+
+
+def budget_exhausted(state: AgentState, now=None):
+    """예산이 남아 있으면 None, 다 썼으면 그 사유('deadline', 'iterations', 'tokens')를 반환합니다."""
+    now = now or time.time()
+    budget = state['budget']
+    if now >= budget['deadline']:
+        return 'deadline'
+    if state['generations'] >= budget['max_iterations']:
+        return 'iterations'
+    if state['tokens_used'] >= budget['token_budget']:
+        return 'tokens'
+    return None
+
+
+def _used_tokens(response, *texts):
+    # 모델이 사용량(usage_metadata)을 알려주면 그 값을, 아니면 입력/출력 텍스트로 추정
+    usage = getattr(response, 'usage_metadata', None)
+    if usage:
+        return usage['total_tokens']
+    return sum(count_tokens(str(text)) for text in texts)
+
+
+def _close_loop(state: AgentState, metrics, now):
+    # 진행 중이던 loop가 끝났으면 loop가 시작된 뒤 걸린 시간을 기록
+    if state.get('loop'):
+        metrics.record_latency(state['loop'], now - state['loop_started'])
+
 
-graph_builder = StateGraph(AgentState)
+def init_budget(state: AgentState, time_limit, max_iterations, token_budget, metrics):
+    metrics.record_query()
+    return {
+        'budget': {
+            'deadline': state.get('deadline') or time.time() + time_limit,
+            'max_iterations': state.get('max_iterations') or max_iterations,
+            'token_budget': state.get('token_budget') or token_budget,
+        },
+        # 입력 예산은 읽은 뒤 비우고, checkpointer로 같은 thread_id를 다시 사용할 때
+        # 이전 실행의 토큰 수/답변/degraded 사유가 남아 있지 않도록 초기화
+        'deadline': 0.0,
+        'max_iterations': 0,
+        'token_budget': 0,
+        'tokens_used': None,
+        'generations': 0,
+        'degraded': False,
+        'degraded_reason': '',
+        'answer': '',
+        'best_answer': '',
+    }
 
 # %%
 # Node는 2가지가 필요
 # 1. 문서를 가져오는 retrieve
 # 2. 답변을 생성하는 generate
 
-def retrieve(state: AgentState):
+def retrieve(state: AgentState, retriever):
     query = state['query']
     docs = retriever.invoke(query)
     return {'context': docs}
 
-# %%
-# set the LANGSMITH_API_KEY environment variable (create key in settings)
-from langchain_openai import ChatOpenAI
 
-llm = ChatOpenAI(model='gpt-4o')
+def generate(state: AgentState, generate_chain, context_packer):
+    # 겹치거나 거의 같은 문서를 정리해 토큰 예산 안에서 프롬프트에 넣음 (평가 node는 원래 context를 그대로 사용)
+    context, _ = context_packer.pack(state['context'])
+    query = state['query']
+    response = generate_chain.invoke({'question': query, 'context': context})
+    tokens = _used_tokens(response, query, *[doc.page_content for doc in context], response.content)
+    return {'answer': response.content, 'generations': state['generations'] + 1, 'tokens_used': tokens}
 
-# %%
-from langchain import hub
-from langchain_core.output_parsers import StrOutputParser
 
-# prompt는 genereate, rewrite, 문서 관련성 등 프롬포트가 필요하다.
-# 따라서 prompt라는 이름으로는 중복 변수 이름이 될 수 있다.
-generate_prompt = hub.pull("rlm/rag-prompt")
-generate_llm = ChatOpenAI(model='gpt-4o', max_completion_tokens=100)
+def _relevance_inputs(query, docs):
+    # 문서 하나당 평가 요청 하나
+    return [{'question': query, 'documents': [doc]} for doc in docs]
 
-def generate(state: AgentState):
-    context = state['context']
+
+def _keep_relevant(docs, responses):
+    return [doc for doc, response in zip(docs, responses) if response['Score'] == 1]
+
+
+def _grading_tokens(query, docs):
+    return sum(_used_tokens(None, query, doc.page_content) for doc in docs)
+
+
+def grade_documents(state: AgentState, doc_relevance_chain, min_relevant=2, max_concurrency=4):
+    """
+    검색된 문서를 하나씩 따로 평가해 관련 있는 문서만 context에 남깁니다.
+    max_concurrency개씩 묶어 동시에 평가하고, 관련 문서가 min_relevant개 모이면 나머지는 평가하지 않습니다.
+    """
     query = state['query']
-    rag_chain = generate_prompt | generate_llm # | StrOutputParser
-    response = rag_chain.invoke({'question': query, 'context': context})
-    return {'answer': response.content}
+    context = state['context']
+    relevant = []
+    graded = 0
+    for start in range(0, len(context), max_concurrency):
+        docs = context[start:start + max_concurrency]
+        responses = doc_relevance_chain.batch(_relevance_inputs(query, docs))
+        relevant.extend(_keep_relevant(docs, responses))
+        graded += len(docs)
+        if len(relevant) >= min_relevant:
+            break
+    logger.debug('relevant documents: %d/%d', len(relevant), len(context))
+    return {'context': relevant, 'tokens_used': _grading_tokens(query, context[:graded])}
 
-# %%
-from langchain import hub
-from typing import Literal
-doc_relevance_prompt = hub.pull("langchain-ai/rag-document-relevance")
 
-def check_doc_relevance(state: AgentState) -> Literal['relevant', 'irrelevant']:
+async def agrade_documents(state: AgentState, doc_relevance_chain, min_relevant=2, max_concurrency=4):
+    # grade_documents의 async 버전 (graph.ainvoke/astream에서 사용)
     query = state['query']
     context = state['context']
-    print(f'context = {context}')
-    doc_relevance_chain = doc_relevance_prompt | llm
-    response = doc_relevance_chain.invoke({'question': query, 'documents': context})
-    print(f'doc relevance response: {response}')
-    if response['Score'] == 1:
+    relevant = []
+    graded = 0
+    for start in range(0, len(context), max_concurrency):
+        docs = context[start:start + max_concurrency]
+        responses = await doc_relevance_chain.abatch(_relevance_inputs(query, docs))
+        relevant.extend(_keep_relevant(docs, responses))
+        graded += len(docs)
+        if len(relevant) >= min_relevant:
+            break
+    logger.debug('relevant documents: %d/%d', len(relevant), len(context))
+    return {'context': relevant, 'tokens_used': _grading_tokens(query, context[:graded])}
+
+
+def check_doc_relevance(state: AgentState) -> Literal['relevant', 'irrelevant', 'degrade']:
+    # rewrite 후 다시 검색한 경우(이전 답변이 있는 경우)에는 예산이 끝났거나 관련 문서가 없으면
+    # 지금까지의 답변을 degraded로 반환
+    answered = bool(state.get('answer'))
+    if answered and budget_exhausted(state):
+        return 'degrade'
+    # grade_documents가 관련 문서를 하나라도 남겼으면 답변 생성
+    if state['context']:
         return 'relevant'
+    if answered:
+        return 'degrade'
     return 'irrelevant'
 
-# %%
-from langchain_core.prompts import PromptTemplate
-
-dictionary = ['사용자와 관련된 표현 -> 클라이언트']
-rewrite_prompt = PromptTemplate.from_template(f"""
-사용자의 질문을 보고, 우리의 사전을 참고해서 사용자의 질문을 변경해주세요.
-사전: {dictionary}
-질문: {{query}}
-""")
 
 # 입력된 쿼리(query)를 변형(rewrite)하여 새로운 쿼리를 생성하는 것
-def rewrite(state: AgentState):
+def rewrite(state: AgentState, query_rewriter, rewrite_chain):
+    """
+    사전으로 먼저 바꿔 보고, 바뀌지 않으면(사전 표현이 없거나 이미 바꾼 질문이면) LLM으로 질문을 다시 작성합니다.
+    그래도 질문이 그대로이면 같은 검색/생성을 반복하지 않도록 route를 'unchanged_query'로 두어 degrade로 보냅니다.
+    """
     query = state['query']
-    rewrite_chain = rewrite_prompt | llm
-    response = rewrite_chain.invoke({'query': query})
-    return {'query': response.content}
+    rewritten = query_rewriter.rewrite(query)
+    tokens = 0
+    if rewritten == query:
+        rewritten = rewrite_chain.invoke({'query': query})
+        tokens = _used_tokens(None, query, rewritten)
+    route = 'rewritten' if rewritten.strip() != query.strip() else 'unchanged_query'
+    return {'query': rewritten, 'route': route, 'tokens_used': tokens}
 
-# %%
-from langchain import hub
-from langchain_core.output_parsers import StrOutputParser
 
-# hallucination_prompt = hub.pull("langchain-ai/rag-answer-hallucination")
-hallucination_prompt = PromptTemplate.from_template("""
-You are a teacher tasked with evaluating whether a student's answer is based on documents or not,
-Given documents, which are excerpts from income tax law, and a student's answer; 
-If the student's answer is based on documents, respond with "not hallucinated",                                             
-If the student's answer is not based on documents, respond with "hallucinated".
-                                                    
-documents: {documents}
-student_answer: {student_answer}
-                                                
-""")
+def route_rewrite(state: AgentState) -> Literal['rewritten', 'unchanged_query']:
+    return state['route']
+
 
-hallucination_llm = ChatOpenAI(model='gpt-4o', temperature=0)
-def check_hallucination(state: AgentState) -> Literal['hallucinated', 'not hallucinated']:
+# 답변이 생성되면 hallucination/helpfulness 평가를 동시에 실행하고(fan-out), join_grades에서 결과를 합친다.
+def check_hallucination(state: AgentState, hallucination_chain):
     answer = state['answer']
     context = state['context']
     context = [doc.page_content for doc in context]
-    print(f'context = {context}')
-    hallucination_chain = hallucination_prompt | hallucination_llm # | StrOutputParser
     response = hallucination_chain.invoke({'student_answer': answer, 'documents': context})
-    print(f'hallucination response: {response}')
-    return response.content
+    logger.debug('hallucination response: %s', response)
+    return {'hallucination': response.content, 'tokens_used': _used_tokens(response, answer, *context)}
 
-# %%
-# set the LANGSMITH_API_KEY environment variable (create key in settings)
-from langchain import hub
-helpfulness_prompt = hub.pull("langchain-ai/rag-answer-helpfulness") 
 
-def check_helpfulness_grader(state: AgentState) :
+def check_helpfulness(state: AgentState, helpfulness_chain):
     query = state['query']
     answer = state['answer']
-    helpfulness_chain = helpfulness_prompt | llm
     response = helpfulness_chain.invoke({'question': query, 'student_answer': answer})
-    print(f'helpfulness response: {response}')
+    logger.debug('helpfulness response: %s', response)
+    tokens = _used_tokens(None, query, answer)
     if response['Score'] == 1:
-        return 'helpful'
-    return 'unhelpful'
+        return {'helpfulness': 'helpful', 'tokens_used': tokens}
+    return {'helpfulness': 'unhelpful', 'tokens_used': tokens}
 
-def check_helpfulness(state: AgentState) :
-    return state 
 
-# %%
-query = "Bean Factory와 Application Context의 차이는 무엇인가요?"
-context = retriever.invoke(query)
-generate_state = {'query': query, 'context': context}
-answer = generate(generate_state)
-print(f'answer == {answer}')
-# hallucination_state = {'answer': answer, 'context': context}
+def join_grades(state: AgentState, metrics):
+    """
+    두 평가 node가 모두 끝난 뒤에 실행되는 합류 지점.
+    평가 결과와 남은 예산으로 다음 경로(route)를 정하고, loop를 다시 돌 때는 시작 시각을 기록합니다.
+    """
+    now = time.time()
+    _close_loop(state, metrics, now)
+    update = {'loop': '', 'loop_started': 0.0}
+    hallucinated = state['hallucination'] == 'hallucinated'
+    if not hallucinated:
+        update['best_answer'] = state['answer']
+        if state['helpfulness'] == 'helpful':
+            return {**update, 'route': 'helpful'}
 
-helpfulness_state = {'query': query, 'answer': answer}
-# check_hallucination(hallucination_state)
-check_helpfulness(helpfulness_state)
+    if budget_exhausted(state, now):
+        return {**update, 'route': 'exhausted'}
 
-# %%
-graph_builder.add_node('retrieve', retrieve)
-graph_builder.add_node('generate', generate)
-# graph_builder.add_node('check_doc_relevance', check_doc_relevance)
-graph_builder.add_node('rewrite', rewrite)
-# graph_builder.add_node('check_hallucination', check_hallucination)
-graph_builder.add_node('check_helpfulness', check_helpfulness)
+    # hallucination이면 helpfulness 결과와 관계없이 다시 생성
+    loop = 'regenerate' if hallucinated else 'rewrite'
+    metrics.record_loop(loop)
+    return {'route': 'hallucinated' if hallucinated else 'unhelpful', 'loop': loop, 'loop_started': now}
 
-# %%
-from langgraph.graph import START, END
-
-graph_builder.add_edge(START, 'retrieve')
-graph_builder.add_conditional_edges(
-    'retrieve',
-    check_doc_relevance, {
-        'relevant': 'generate',
-        'irrelevant': END
-    }
-)
-graph_builder.add_conditional_edges(
-    'generate',
-    check_hallucination, {
-        'not hallucinated': 'check_helpfulness',
-        'hallucinated': 'generate'
-    }
-)
-graph_builder.add_conditional_edges(
-    'check_helpfulness',
-    check_helpfulness_grader, {
-        'helpful': END,
-        'unhelpful': 'rewrite'
+
+def route_grades(state: AgentState) -> Literal['hallucinated', 'helpful', 'unhelpful', 'exhausted']:
+    return state['route']
+
+
+def degrade(state: AgentState, metrics):
+    # 예산을 다 썼거나, 다시 검색해도 관련 문서가 없거나, 다시 쓴 질문이 그대로이면
+    # 지금까지 가장 나은 답변을 degraded로 표시해 반환
+    now = time.time()
+    _close_loop(state, metrics, now)
+    reason = budget_exhausted(state, now)
+    if reason is None:
+        reason = 'unchanged_query' if state.get('route') == 'unchanged_query' else 'no_relevant_documents'
+    metrics.record_degraded(reason)
+    return {
+        'answer': state.get('best_answer') or state['answer'],
+        'degraded': True,
+        'degraded_reason': reason,
+        'loop': '',
     }
-)
-graph_builder.add_edge('rewrite', 'retrieve')
 
 # %%
-graph = graph_builder.compile()
+def build_graph(retriever=None, llms=None, prompts=None, time_limit=30.0, max_iterations=3, token_budget=20000,
+                metrics=None, context_packer=None, callbacks=None, checkpointer=None, memoize=None, memo=None):
+    """
+    self-RAG 그래프를 만들어 compile한 결과를 반환합니다.
+    인자를 생략하면 get_retriever/get_llms/get_prompts로 실제 구성 요소를 만들고,
+    테스트나 벤치마크에서는 가짜 retriever/LLM/프롬프트를 넘길 수 있습니다.
+
+    time_limit(초), max_iterations(답변 생성 횟수), token_budget은 입력 state에
+    deadline/max_iterations/token_budget이 없을 때 쓰는 질의별 기본 예산입니다.
+    예산이 끝나면 loop를 더 돌지 않고 지금까지의 답변을 degraded=True로 반환합니다.
+
+    callbacks를 생략하면 instrumentation이 켜져 있을 때 node별 계측 callback을 붙입니다.
+
+    checkpointer를 생략하면 config.graph_checkpoint_enabled일 때 SQLite checkpointer(graph_checkpoint.py)를 붙입니다.
+    checkpointer가 있으면 실행마다 config의 configurable.thread_id가 필요하고, 실패한 실행은
+    graph.invoke(None, config)로 마지막 checkpoint부터 이어서 실행합니다.
+    memoize는 결과를 재사용할 node 이름 목록(생략하면 config.graph_memo_nodes)이고, memo(NodeMemo)를 생략하면
+    get_node_memo()를 사용합니다. 재사용한 평가 결과는 토큰 예산에 다시 더하지 않습니다.
+    """
+    from config import (
+        context_max_tokens, context_mmr_lambda, context_near_duplicate_threshold, graph_checkpoint_enabled,
+        graph_memo_nodes,
+    )
+    from graph_checkpoint import get_checkpointer, get_node_memo, memoize_node
+
+    metrics = metrics or loop_metrics
+    callbacks = get_callbacks('spring_doc_graph') if callbacks is None else callbacks
+    # llm.get_context_packer()와 같은 설정(config.context_*)으로 프롬프트에 넣을 문서를 정리
+    context_packer = context_packer or ContextPacker(
+        max_tokens=context_max_tokens,
+        mmr_lambda=context_mmr_lambda,
+        near_duplicate_threshold=context_near_duplicate_threshold,
+    )
+    retriever = retriever or get_retriever()
+    llms = llms or get_llms()
+    prompts = prompts or get_prompts()
+
+    # 사전은 로컬에서 바로 적용하고, 모호한 표현이 있을 때만 LLM(rewrite_prompt)을 사용
+    rewrite_chain = prompts['rewrite'] | llms['rewrite_llm'] | StrOutputParser()
+    query_rewriter = QueryRewriter(
+        parse_dictionary(dictionary),
+        fallback=RunnableLambda(lambda query: {'query': query}) | rewrite_chain,
+    )
+    generate_chain = prompts['generate'] | llms['generate_llm'] # | StrOutputParser
+    doc_relevance_chain = prompts['doc_relevance'] | llms['doc_relevance_llm']
+    hallucination_chain = prompts['hallucination'] | llms['hallucination_llm'] # | StrOutputParser
+    helpfulness_chain = prompts['helpfulness'] | llms['helpfulness_llm']
+
+    if checkpointer is None and graph_checkpoint_enabled:
+        checkpointer = get_checkpointer()
+    memoize = set(graph_memo_nodes if memoize is None else memoize)
+    if memoize and memo is None:
+        memo = get_node_memo()
+
+    def node(name, keys, func, afunc=None):
+        # 결정적인 node는 선택적으로 memoize: node가 읽는 state(keys)가 같으면 이전 결과를 재사용
+        if name in memoize:
+            return memoize_node(memo, name, keys, func, afunc, on_hit={'tokens_used': 0})
+        return RunnableLambda(func, afunc=afunc) if afunc else func
+
+    graph_builder = StateGraph(AgentState)
+
+    graph_builder.add_node('init_budget', partial(
+        init_budget, time_limit=time_limit, max_iterations=max_iterations, token_budget=token_budget, metrics=metrics
+    ))
+    graph_builder.add_node('retrieve', node('retrieve', ('query',), partial(retrieve, retriever=retriever)))
+    graph_builder.add_node('grade_documents', node(
+        'grade_documents', ('query', 'context'),
+        partial(grade_documents, doc_relevance_chain=doc_relevance_chain),
+        afunc=partial(agrade_documents, doc_relevance_chain=doc_relevance_chain),
+    ))
+    graph_builder.add_node('generate', partial(generate, generate_chain=generate_chain, context_packer=context_packer))
+    graph_builder.add_node('rewrite', partial(rewrite, query_rewriter=query_rewriter, rewrite_chain=rewrite_chain))
+    graph_builder.add_node('check_hallucination', node(
+        'check_hallucination', ('answer', 'context'), partial(check_hallucination, hallucination_chain=hallucination_chain)
+    ))
+    graph_builder.add_node('check_helpfulness', node(
+        'check_helpfulness', ('query', 'answer'), partial(check_helpfulness, helpfulness_chain=helpfulness_chain)
+    ))
+    graph_builder.add_node('join_grades', partial(join_grades, metrics=metrics))
+    graph_builder.add_node('degrade', partial(degrade, metrics=metrics))
+
+    graph_builder.add_edge(START, 'init_budget')
+    graph_builder.add_edge('init_budget', 'retrieve')
+    graph_builder.add_edge('retrieve', 'grade_documents')
+    graph_builder.add_conditional_edges(
+        'grade_documents',
+        check_doc_relevance, {
+            'relevant': 'generate',
+            'irrelevant': END,
+            'degrade': 'degrade'
+        }
+    )
+    # generate -> (check_hallucination, check_helpfulness) 병렬 실행 -> join_grades
+    graph_builder.add_edge('generate', 'check_hallucination')
+    graph_builder.add_edge('generate', 'check_helpfulness')
+    graph_builder.add_edge(['check_hallucination', 'check_helpfulness'], 'join_grades')
+    graph_builder.add_conditional_edges(
+        'join_grades',
+        route_grades, {
+            'hallucinated': 'generate',
+            'helpful': END,
+            'unhelpful': 'rewrite',
+            'exhausted': 'degrade'
+        }
+    )
+    # 다시 쓴 질문이 그대로이면 같은 입력으로 검색/생성을 반복하지 않고 지금까지의 답변을 반환
+    graph_builder.add_conditional_edges(
+        'rewrite',
+        route_rewrite, {
+            'rewritten': 'retrieve',
+            'unchanged_query': 'degrade'
+        }
+    )
+    graph_builder.add_edge('degrade', END)
+
+    # loop 한 번(rewrite -> retrieve -> grade_documents -> generate -> 평가 -> join_grades)은 최대 6 step이므로
+    # LangGraph의 recursion_limit보다 예산(max_iterations)이 먼저 loop를 멈추도록 한도를 맞춤
+    # (입력 state로 더 큰 max_iterations를 넘길 때는 config의 recursion_limit도 함께 늘려야 함)
+    config = {'recursion_limit': 6 * max_iterations + 10}
+    if callbacks:
+        config['callbacks'] = callbacks
+    return graph_builder.compile(checkpointer=checkpointer).with_config(config)
+
+
+@lru_cache(maxsize=None)
+def get_graph():
+    # 실제 구성 요소로 만든 그래프를 프로세스당 한 번만 생성
+    return build_graph()
+
+# %%
+if __name__ == '__main__':
+    import uuid
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
 
+    query = "Bean Factory와 Application Context의 차이는 무엇인가요?"
+    graph = get_graph()
+    # checkpointer(config.graph_checkpoint_enabled)가 붙어 있으면 thread_id가 필요하므로 실행마다 새 thread_id를 사용
+    result = graph.invoke({'query': query}, {'configurable': {'thread_id': str(uuid.uuid4())}})
+    print(f'answer == {result.get("answer")}')
+    print(f'degraded == {result.get("degraded")} ({result.get("degraded_reason")})')
+    print(f'loop metrics == {loop_metrics.report()}')
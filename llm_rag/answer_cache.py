@@ -0,0 +1,140 @@
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+def stream_cached_answer(answer):
+    """
+    캐시에 저장된 답변을 get_ai_response와 같은 generator 형태로 흘려보냅니다.
+    단어(공백 포함) 단위로 잘라서 내보내므로 화면에서는 스트리밍처럼 보입니다.
+    """
+    for token in re.findall(r'\S+\s*|\s+', answer):
+        yield token
+
+
+class SemanticAnswerCache:
+    """
+    질문 임베딩을 key로 사용하는 의미 기반 답변 캐시.
+
+    "스프링이란?"과 "스프링이 뭐예요"처럼 표현만 다른 질문은 임베딩의 cosine 유사도가 높으므로,
+    threshold 이상이면 이전 답변을 그대로 재사용해 RAG 파이프라인 전체를 건너뜁니다.
+
+    - 저장소: SQLite 파일 (프로세스를 재시작해도 유지)
+    - 만료: ttl_seconds가 지난 답변은 사용하지 않고 삭제
+    - 용량: max_entries를 넘으면 가장 오래 사용되지 않은 답변부터 삭제 (LRU)
+    - 무효화: fingerprint(인덱스 이름 + 프롬프트의 hash)가 바뀌면 이전 답변을 모두 삭제
+    """
+
+    def __init__(self, path, embedding, fingerprint, threshold=0.92, ttl_seconds=60 * 60 * 24, max_entries=1000):
+        self.embedding = embedding
+        self.fingerprint = fingerprint
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fingerprint TEXT NOT NULL,
+                question TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        # 인덱스나 프롬프트가 바뀌었다면 이전 답변은 더 이상 유효하지 않다.
+        self._conn.execute("DELETE FROM answers WHERE fingerprint != ?", (fingerprint,))
+        self._conn.commit()
+
+        # 유사도 계산은 메모리에 올려둔 정규화된 행렬로 한 번에 수행
+        self._ids = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._load()
+
+    def _load(self):
+        self._expire()
+        rows = self._conn.execute("SELECT id, embedding FROM answers ORDER BY id").fetchall()
+        self._ids = [row[0] for row in rows]
+        if rows:
+            self._matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        else:
+            self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    def _expire(self):
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM answers WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        self._conn.commit()
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, question):
+        """
+        질문과 가장 비슷한 캐시 답변을 찾습니다.
+
+        Returns:
+            tuple: (답변 또는 None, 질문의 정규화된 임베딩). 임베딩은 put에서 재사용합니다.
+        """
+        vector = self._normalize(self.embedding.embed_query(question))
+        with self._lock:
+            if not self._ids:
+                return None, vector
+            scores = self._matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None, vector
+
+            row = self._conn.execute(
+                "SELECT answer, created_at FROM answers WHERE id = ?", (self._ids[best],)
+            ).fetchone()
+            now = time.time()
+            if row is None or (self.ttl_seconds is not None and row[1] < now - self.ttl_seconds):
+                self._load()
+                return None, vector
+
+            self._conn.execute("UPDATE answers SET last_access = ? WHERE id = ?", (now, self._ids[best]))
+            self._conn.commit()
+            return row[0], vector
+
+    def put(self, question, answer, vector=None):
+        if vector is None:
+            vector = self._normalize(self.embedding.embed_query(question))
+        now = time.time()
+        vector = vector.astype(np.float32)
+        with self._lock:
+            row_id = self._conn.execute(
+                "INSERT INTO answers (fingerprint, question, embedding, answer, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.fingerprint, question, vector.tobytes(), answer, now, now),
+            ).lastrowid
+            # 용량을 넘으면 가장 오래 사용되지 않은 답변부터 삭제
+            deleted = self._conn.execute(
+                "DELETE FROM answers WHERE id NOT IN "
+                "(SELECT id FROM answers ORDER BY last_access DESC LIMIT ?)",
+                (self.max_entries,),
+            ).rowcount
+            self._conn.commit()
+            if deleted > 0:
+                # 삭제된 행이 있을 때만 테이블 전체를 다시 읽음
+                self._load()
+                return
+            # 새 답변만 메모리의 행렬과 id 목록에 추가
+            self._ids.append(row_id)
+            self._matrix = vector[None, :] if len(self._ids) == 1 else np.vstack([self._matrix, vector])
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+            self._load()
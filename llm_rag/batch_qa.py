@@ -0,0 +1,279 @@
+"""
+여러 질문을 한 번에 답하는 batch 모드 (야간 평가, answer_examples 회귀 테스트, FAQ 답변 미리 만들기).
+
+- get_batch_chain()(대화 기록 없는 RAG 체인)을 abatch_as_completed로 최대 concurrency개씩 동시에 실행
+- 429(rate limit)/timeout/5xx 오류는 지수 backoff + jitter로 다시 시도하고, 429 응답의 retry-after가 있으면
+  그 시간만큼은 모든 요청이 함께 기다림 (같은 API 한도를 공유하므로)
+- 답변이 끝날 때마다 결과를 JSONL에 한 줄씩 바로 기록하고, 다시 실행하면 이미 답한 질문은 건너뜀 (중단 후 이어서 실행)
+
+사용 예:
+    python batch_qa.py --input questions.jsonl --output answers.jsonl --concurrency 8
+    python batch_qa.py --answer-examples --output regression.jsonl
+    python batch_qa.py --input faq.txt --output faq_answers.jsonl --fill-answer-cache
+
+입력 파일은 한 줄에 질문 하나인 텍스트 파일이거나, {"question": ...} (또는 "input", 선택적으로 "id")이 한 줄씩 있는 JSONL입니다.
+"""
+import argparse
+import asyncio
+import email.utils
+import hashlib
+import json
+import os
+import random
+import time
+
+from dotenv import load_dotenv
+from langchain_core.runnables import RunnableLambda
+
+from config import (
+    batch_concurrency, batch_max_attempts, batch_backoff_base_seconds, batch_backoff_max_seconds,
+)
+
+# 다시 시도할 오류 (openai/httpx 예외를 import하지 않고 이름으로 판단)
+_RETRYABLE_ERRORS = {
+    'RateLimitError', 'APITimeoutError', 'APIConnectionError', 'InternalServerError', 'ServiceUnavailableError',
+    'TimeoutError', 'TimeoutException', 'ConnectError', 'ReadTimeout',
+}
+
+
+def _status_code(error):
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+
+def is_retryable(error):
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status == 408 or status >= 500
+    return type(error).__name__ in _RETRYABLE_ERRORS
+
+
+def retry_after_seconds(error):
+    """429 응답의 retry-after-ms / retry-after(초 또는 HTTP 날짜) 헤더 값을 초 단위로 반환합니다. 없으면 None"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    value = headers.get('retry-after-ms')
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def question_id(question):
+    return hashlib.sha256(question.encode('utf-8')).hexdigest()[:16]
+
+
+def load_questions(path):
+    """텍스트(한 줄에 질문 하나) 또는 JSONL 파일에서 {"id", "question"} 목록을 읽습니다."""
+    items = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith('.jsonl'):
+                record = json.loads(line)
+                question = record.get('question') or record['input']
+                items.append({'id': str(record.get('id') or question_id(question)), 'question': question})
+            else:
+                items.append({'id': question_id(line), 'question': line})
+    return items
+
+
+def load_completed(path):
+    """이전 실행의 결과 파일에서 오류 없이 답한 질문 id 목록을 읽습니다 (중간에 끊긴 마지막 줄은 무시)."""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('error') is None:
+                completed.add(record['id'])
+    return completed
+
+
+class BatchAnswerer:
+    """
+    질문 목록을 체인으로 동시에 답하고 결과를 JSONL로 기록합니다.
+
+    chain은 {"question": ...}을 받아 "answer"(와 선택적으로 "input", "context")가 있는 dict 또는 답변 문자열을 반환해야 합니다.
+    """
+
+    def __init__(self, chain, concurrency=batch_concurrency, max_attempts=batch_max_attempts,
+                 backoff_base_seconds=batch_backoff_base_seconds, backoff_max_seconds=batch_backoff_max_seconds,
+                 on_answer=None):
+        self.chain = chain
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.on_answer = on_answer
+
+        # 429의 retry-after가 끝나는 시각 (event loop 시간 기준). 모든 요청이 이 시각까지 새 호출을 미룸
+        self._paused_until = 0.0
+        # 이번 arun 실행의 재시도 통계 (arun을 시작할 때마다 초기화)
+        # waited_seconds: 요청별로 retry-after 때문에 기다린 시간의 합
+        self.stats = {'retries': 0, 'rate_limited': 0, 'waited_seconds': 0.0}
+
+    def backoff_seconds(self, attempt, error):
+        """
+        attempt번째(1부터) 실패 후 기다릴 시간.
+        retry-after가 있으면 그 시간 + 작은 jitter, 없으면 full jitter (0 ~ base * 2^(attempt-1), 최대 backoff_max_seconds)
+        """
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base_seconds)
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** (attempt - 1)))
+
+    async def _wait_for_pause(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            remaining = self._paused_until - loop.time()
+            if remaining <= 0:
+                return
+            self.stats['waited_seconds'] += remaining
+            await asyncio.sleep(remaining)
+
+    async def _answer(self, item):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        for attempt in range(1, self.max_attempts + 1):
+            await self._wait_for_pause()
+            try:
+                output = await self.chain.ainvoke({'question': item['question']})
+                return output, attempt, time.perf_counter() - started
+            except Exception as error:
+                if attempt == self.max_attempts or not is_retryable(error):
+                    error.attempts = attempt
+                    raise
+                delay = self.backoff_seconds(attempt, error)
+                self.stats['retries'] += 1
+                if _status_code(error) == 429 or type(error).__name__ == 'RateLimitError':
+                    self.stats['rate_limited'] += 1
+                    self._paused_until = max(self._paused_until, loop.time() + delay)
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _record(item, output, attempts, seconds):
+        if isinstance(output, str):
+            output = {'answer': output}
+        return {
+            'id': item['id'],
+            'question': item['question'],
+            'rewritten': output.get('input'),
+            'answer': output['answer'],
+            'sources': [
+                document.metadata.get('source') for document in output.get('context') or []
+            ],
+            'attempts': attempts,
+            'seconds': round(seconds, 3),
+            'error': None,
+        }
+
+    async def arun(self, items, output_path):
+        """
+        items를 답하고 결과를 output_path(JSONL)에 이어서 기록합니다. 이미 답한 질문(같은 id)은 건너뜁니다.
+
+        Returns:
+            dict: 전체/건너뜀/성공/실패 수, 재시도 수, 걸린 시간, 초당 답변 수
+        """
+        started = time.perf_counter()
+        # 같은 answerer로 다시 실행해도 이전 실행의 재시도 통계와 대기 시각이 섞이지 않도록 초기화
+        self._paused_until = 0.0
+        self.stats = {'retries': 0, 'rate_limited': 0, 'waited_seconds': 0.0}
+        completed = load_completed(output_path)
+        # 같은 질문(id)이 여러 번 들어 있으면 한 번만 답함
+        pending = list({item['id']: item for item in items if item['id'] not in completed}.values())
+        summary = {'total': len(items), 'skipped': len(items) - len(pending), 'answered': 0, 'failed': 0}
+
+        runnable = RunnableLambda(self._answer)
+        with open(output_path, 'a+', encoding='utf-8') as f:
+            # 이전 실행이 줄 중간에서 끊겼으면 새 기록이 그 줄에 이어 붙지 않도록 줄을 바꿈
+            if f.tell() > 0:
+                f.seek(f.tell() - 1)
+                if f.read(1) != '\n':
+                    f.write('\n')
+            async for index, result in runnable.abatch_as_completed(
+                pending, config={'max_concurrency': self.concurrency}, return_exceptions=True,
+            ):
+                item = pending[index]
+                if isinstance(result, Exception):
+                    record = {
+                        'id': item['id'], 'question': item['question'], 'answer': None,
+                        'attempts': getattr(result, 'attempts', 1), 'error': f'{type(result).__name__}: {result}',
+                    }
+                    summary['failed'] += 1
+                else:
+                    record = self._record(item, *result)
+                    summary['answered'] += 1
+                    if self.on_answer is not None:
+                        await asyncio.to_thread(self.on_answer, record)
+                # 한 줄씩 바로 기록해 중간에 끊겨도 이미 답한 질문은 다시 실행하지 않음
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+
+        seconds = time.perf_counter() - started
+        return {
+            **summary,
+            **self.stats,
+            'seconds': seconds,
+            'answers_per_second': summary['answered'] / seconds if seconds else None,
+        }
+
+    def run(self, items, output_path):
+        return asyncio.run(self.arun(items, output_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='여러 질문을 동시에 답하고 결과를 JSONL로 기록합니다.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='질문 파일 (.txt: 한 줄에 질문 하나, .jsonl: {"question": ...})')
+    source.add_argument('--answer-examples', action='store_true', help='config.answer_examples의 질문을 사용')
+    parser.add_argument('--output', required=True, help='결과 JSONL 파일 (있으면 이어서 실행)')
+    parser.add_argument('--concurrency', type=int, default=batch_concurrency, help='동시에 실행할 질문 수')
+    parser.add_argument('--max-attempts', type=int, default=batch_max_attempts, help='질문당 최대 시도 횟수')
+    parser.add_argument('--fill-answer-cache', action='store_true',
+                        help='답변을 의미 기반 답변 캐시(answer_cache.py)에 저장 (FAQ 미리 만들기)')
+    args = parser.parse_args()
+
+    load_dotenv()
+    import llm
+
+    if args.answer_examples:
+        from config import answer_examples
+
+        items = [{'id': question_id(example['input']), 'question': example['input']} for example in answer_examples]
+    else:
+        items = load_questions(args.input)
+
+    on_answer = None
+    if args.fill_answer_cache:
+        answer_cache = llm.get_answer_cache()
+        on_answer = lambda record: answer_cache.put(record['question'], record['answer'])  # noqa: E731
+
+    answerer = BatchAnswerer(
+        llm.get_batch_chain(), concurrency=args.concurrency, max_attempts=args.max_attempts, on_answer=on_answer,
+    )
+    print(json.dumps(answerer.run(items, args.output), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,49 +1,51 @@
+import logging
+
 import streamlit as st
 
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains import RetrievalQA
-from langchain import hub
+from langchain_core.runnables import RunnableLambda
 from dotenv import load_dotenv
 from langchain_openai import OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
-from langchain_openai import ChatOpenAI
-from deep_translator import GoogleTranslator
+
+from config import embedding_cache_dir, dictionary_path, translation_cache_path
+from config import hub_cache_dir, relevance_threshold
+from embedding_cache import CachedEmbeddings
+from hub_cache import pull_prompt
+from instrumentation import instrument, measure
+from model_router import get_model_router
+from query_rewriter import QueryRewriter, load_dictionary_lines, parse_dictionary
+from translation import GoogleTranslatorBackend, TranslationService
 
 load_dotenv()
 
-def translate_text(text, source, target):
-    return GoogleTranslator(source=source, target=target).translate(text)
+logger = logging.getLogger(__name__)
 
-def get_ai_message(user_message):
-    translator = GoogleTranslator(source="ko", target="en")
-    translated_message = translator.translate(user_message)
-    print(translated_message)
+# streamlit은 메시지마다 스크립트를 다시 실행하므로, 클라이언트/프롬프트/캐시는 st.cache_resource로 프로세스당 한 번만 만든다.
+
+@st.cache_resource
+def get_translation_service():
+    return TranslationService(GoogleTranslatorBackend(), translation_cache_path)
 
-    if translated_message.lower() in ["안녕하세요", "반갑습니다"]:
-        return {"result": "안녕하세요! 무엇을 도와드릴까요?"}
 
-    embedding = OpenAIEmbeddings(model="text-embedding-3-large")
+@st.cache_resource
+def get_database():
+    embedding = CachedEmbeddings(OpenAIEmbeddings(model="text-embedding-3-large"), embedding_cache_dir)
     index_name = 'spring-index'
-    database = PineconeVectorStore.from_existing_index(index_name=index_name, embedding=embedding)
-    llm = ChatOpenAI(model='gpt-4o')
-    prompt = hub.pull("rlm/rag-prompt")
+    return PineconeVectorStore.from_existing_index(index_name=index_name, embedding=embedding)
 
-    retriever = database.as_retriever()  # VectorStore에서 retriever 생성
-    search_results = retriever.get_relevant_documents(translated_message)
 
-    # 검색 결과가 없을 경우 기본 응답 반환
-    print(search_results)
-    if not search_results or max([doc.metadata.get('score', 0) for doc in search_results]) < 0.8:
-        return {"result": "스프링 프레임워크와 관련된 질문을 요청해주세요!"}
+@st.cache_resource
+def get_answer_chain():
+    # hub 프롬프트는 한 번 받아오면 hub_cache_dir에 저장해 두고 재사용
+    prompt = pull_prompt("rlm/rag-prompt", hub_cache_dir)
+    return instrument(prompt | get_model_router().get('answer') | StrOutputParser(), 'chat', 'answer')
 
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        retriever=retriever,
-        chain_type_kwargs={"prompt": prompt}  # 필요한 경우 추가 인자 설정
-    )
 
-    dictionary = ["언어를 나타내는 표현 -> 자바"]
+@st.cache_resource
+def get_query_rewriter():
+    dictionary = load_dictionary_lines(dictionary_path)
 
     prompt = ChatPromptTemplate.from_template(
         f"""
@@ -58,12 +60,53 @@ def get_ai_message(user_message):
         """
     )
 
-    chain = prompt | llm | StrOutputParser()
-    spring_chain = {"query": chain} | qa_chain
-    ai_message = spring_chain.invoke({"question": user_message})
+    # 사전 표현이 모호할 때만 small tier 모델로 질문을 바꾸고, 나머지는 로컬에서 바로 바꾼다.
+    chain = instrument(prompt | get_model_router().get('rewrite') | StrOutputParser(), 'chat', 'rewrite_llm')
+    return QueryRewriter(
+        parse_dictionary(dictionary),
+        fallback=RunnableLambda(lambda question: {"question": question}) | chain,
+    )
+
+
+def translate_text(text, source, target):
+    return get_translation_service().translate(text, source, target)
+
+
+def format_docs(docs):
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+def get_ai_message(user_message):
+    # 인사말은 번역하기 전에 바로 응답
+    if user_message.strip() in ["안녕하세요", "반갑습니다"]:
+        return {"result": "안녕하세요! 무엇을 도와드릴까요?"}
+
+    # 사전으로 질문을 바꾼 뒤 영어로 번역해서 검색과 답변 생성에 같은 질문을 사용
+    # 단계별 시간과 검색 문서 수는 instrumentation(config.instrumentation_enabled)으로 기록
+    with measure('chat', 'rewrite'):
+        rewritten_message = get_query_rewriter().rewrite(user_message)
+    with measure('chat', 'translate_question'):
+        translated_message = translate_text(rewritten_message, "ko", "en")
+    logger.debug('translated question: %s', translated_message)
+
+    # Pinecone에는 한 번만 질의하고, 실제 관련도 점수(0~1)로 스프링과 관련 없는 질문을 걸러냄
+    with measure('chat', 'retrieve') as stage:
+        search_results = get_database().similarity_search_with_relevance_scores(translated_message, k=4)
+        stage['retriever_calls'] = 1
+        stage['retriever_hits'] = len(search_results)
+
+    # 검색 결과가 없을 경우 기본 응답 반환
+    logger.debug('search results: %s', search_results)
+    if not search_results or max(score for _, score in search_results) < relevance_threshold:
+        return {"result": "스프링 프레임워크와 관련된 질문을 요청해주세요!"}
+
+    # 검색한 문서를 그대로 답변 생성에 사용 (다시 검색하지 않음)
+    docs = [doc for doc, _ in search_results]
+    ai_message = get_answer_chain().invoke({"question": translated_message, "context": format_docs(docs)})
 
-    translator = GoogleTranslator(source="en", target="ko")
-    translated_response = translator.translate(ai_message)
+    # 여러 문장으로 된 답변은 캐시에 없는 문장만 한 번에 번역
+    with measure('chat', 'translate_answer'):
+        translated_response = translate_text(ai_message, "en", "ko")
 
     return {"result": translated_response}
 
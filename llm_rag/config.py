@@ -1,3 +1,5 @@
+import os
+
 answer_examples = [
     {
         "input": "스프링이란 무엇인가요?",
@@ -24,3 +26,129 @@ answer_examples = [
 ]
 # 예제는 많이 넣을수록 정확도가 매우 향상된다고 한다.
 # 하지만 많이 넣을수록 토큰 사용량이 올라가기 때문에 1개부터 넣어보며 만족스러운 정확도를 위해 하나씩 늘러보는 것을 추천
+
+# 의미 기반 답변 캐시 설정
+# threshold: 질문 임베딩의 cosine 유사도가 이 값 이상이면 같은 질문으로 보고 캐시된 답변을 반환
+answer_cache_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'answer_cache.sqlite3')
+answer_cache_threshold = 0.92
+answer_cache_ttl_seconds = 60 * 60 * 24
+answer_cache_max_entries = 1000
+
+# 임베딩 캐시 디렉터리 (llm.py, chat.py, spring_doc_graph.py가 함께 사용)
+embedding_cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'embedding_cache')
+
+# 대화 기록 저장소 설정
+# history_backend: 'sqlite'이면 디스크에 저장해 메모리 사용량을 일정하게 유지, 'memory'이면 프로세스 메모리에 저장
+history_backend = 'sqlite'
+history_store_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.sqlite3')
+history_max_sessions = 1000
+history_idle_seconds = 60 * 60 * 24
+# 프롬프트에 넣을 대화 기록의 최대 토큰 수와 세션당 저장할 최대 메시지 수
+history_max_tokens = 2000
+history_max_messages = 100
+
+# 질문을 로컬에서 바꿀 때 사용하는 사전 파일 (형식: 표현1, 표현2 -> 바꿀 단어)
+dictionary_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dictionary.txt')
+
+# 답변 파이프라인 모드
+# 'speculative': rewrite와 retrieval을 겹쳐 실행하고 단계별 시간을 기록 (speculative.py)
+# 'chain': 기존 {"input": dictionary_chain} | rag_chain 체인을 순서대로 실행
+pipeline_mode = 'speculative'
+# rewrite 결과가 원래 질문과 이 값 이상 비슷하면 미리 검색한 문서를 그대로 사용
+speculative_similarity_threshold = 0.9
+
+# SSE 서버(server.py) 설정
+# 동시에 생성하는 최대 답변 수와, 자리가 날 때까지 기다릴 수 있는 최대 요청 수
+server_max_concurrency = 32
+server_max_waiting = 64
+
+# 로컬 BM25 + vector 하이브리드 검색 설정
+# BM25 색인은 ingest.py가 vector store에 넣는 것과 같은 documents_pattern의 chunk로 만듦
+# (Pinecone 인덱스를 ingest.py로 이 문서들로 채운 뒤에 켜야 두 검색 결과가 같은 문서 집합을 가리킴)
+# lexical_fast_path = True이면 BM25 1등 점수가 lexical_min_score 이상이고 2등보다 lexical_margin배 이상 높을 때
+# 임베딩 없이 BM25 결과만 사용. 점수는 정규화되지 않은 BM25 값이라 문서 집합에 따라 달라지므로
+# 실제 질문으로 값을 맞춰 보기 전까지는 끔
+hybrid_retrieval = True
+documents_pattern = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'langgraph-lecture', 'documents', '*.md')
+lexical_fast_path = False
+lexical_min_score = 4.0
+lexical_margin = 1.5
+
+# 프롬프트 {context}에 넣을 문서 정리(context_packer.py) 설정
+# 겹치거나 거의 같은 chunk를 제거하고, MMR(mmr_lambda가 클수록 관련도 우선)로 고른 문서를 context_max_tokens까지만 담음
+context_max_tokens = 3000
+context_mmr_lambda = 0.7
+context_near_duplicate_threshold = 0.85
+
+# 번역 결과를 문장 단위로 저장해 두는 캐시 파일 (chat.py)
+translation_cache_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'translation_cache.sqlite3')
+
+# hub.pull로 받아온 프롬프트를 저장해 두는 디렉터리 (chat.py, spring_doc_graph.py가 함께 사용, 한 번 받아오면 오프라인에서도 사용 가능)
+hub_cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hub_prompts')
+# chat.py에서 검색 결과의 최고 관련도 점수(similarity_search_with_relevance_scores, 0~1)가 이 값보다 낮으면
+# 스프링과 관련 없는 질문으로 보고 답변을 생성하지 않음
+relevance_threshold = 0.8
+
+# 단계별 실행 시간/첫 토큰 시간/토큰 수/검색 문서 수 계측(instrumentation.py)
+# 켜면 체인과 그래프 node에 callback이 붙고, 단계가 끝날 때마다 instrumentation_jsonl_path에 한 줄씩 기록
+# (server.py의 /metrics에서 Prometheus text format으로도 확인). 끄면 callback을 붙이지 않아 추가 비용이 없음
+instrumentation_enabled = False
+instrumentation_jsonl_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stage_metrics.jsonl')
+
+# 역할(role)별 모델 tier 설정 (model_router.py)
+# rewrite/contextualize/평가처럼 가벼운 단계는 small tier(gpt-4o-mini), 답변 생성만 large tier(gpt-4o)를 사용하고,
+# 기본 모델이 오류를 내거나 latency_threshold보다 느리면 model_cooldown_seconds 동안 같은 tier의 대체 모델을 먼저 사용
+model_routing_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_routing.json')
+# role별 설정 덮어쓰기. 예: {'answer': {'tier': 'small'}}, {'rewrite': {'models': ['gpt-4o']}}
+model_role_overrides = {}
+model_cooldown_seconds = 60.0
+
+# 음성 입력(speech.py) 설정
+# 음성을 발화 단위로 잘라 speech_max_workers개까지 동시에 인식하고, 인식이 끝난 발화로 검색을 미리 시작
+# speech_end_silence_seconds: 마이크 입력(ui_with-recording.py)에서 말이 끝났다고 보고 녹음을 멈추는 무음 길이
+speech_language = 'ko-KR'
+speech_max_workers = 4
+speech_min_silence_ms = 500
+speech_end_silence_seconds = 1.5
+speech_max_record_seconds = 30
+
+# spring_doc_graph.py가 검색하는 Chroma 저장소 (ingest.py --target chroma의 기본 저장 위치)
+chroma_persist_directory = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'langgraph-lecture', 'spring_framework_docs'
+)
+
+# 로컬 vector 인덱스(quantized_index.py) 설정 (spring_doc_graph.py)
+# vector_index_mode = 'quantized'이면 Chroma 대신 앞쪽 일부 차원만 남겨 int8/binary로 양자화한
+# 인덱스(quantized_index_dir)에서 후보를 고르고, 후보만 원래 벡터로 다시 점수를 매김
+# 인덱스는 python quantized_index.py --persist-directory ... --output ... --dim 1024로 Chroma 저장소에서 만들며,
+# 남길 차원 수와 양자화 방식은 만들 때(--dim, --quantization) 정해짐
+# ingest.py로 같은 Chroma collection을 갱신하면 인덱스도 같은 설정으로 다시 만듦 (다른 방법으로 Chroma를 바꿨으면
+# 위 명령을 다시 실행해야 함)
+vector_index_mode = 'chroma'
+quantized_index_dir = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'langgraph-lecture', 'spring_framework_docs_quantized'
+)
+quantized_index_oversample = 10
+
+# 여러 질문을 한 번에 답하는 batch 모드(batch_qa.py) 설정
+# 최대 batch_concurrency개의 질문을 동시에 실행하고, rate limit(429)/timeout 오류는 batch_max_attempts번까지
+# 지수 backoff(batch_backoff_base_seconds * 2^n, 최대 batch_backoff_max_seconds) + jitter로 다시 시도
+batch_concurrency = 8
+batch_max_attempts = 6
+batch_backoff_base_seconds = 1.0
+batch_backoff_max_seconds = 60.0
+
+# LangGraph 그래프(spring_doc_graph.py, stock-multi-agent.py)의 checkpoint / node memoization(graph_checkpoint.py) 설정
+# graph_checkpoint_enabled = True이면 step마다 실행 상태를 graph_checkpoint_path에 저장하고, 실패한 실행은 같은 thread_id로
+# graph.invoke(None, config)를 호출해 마지막 checkpoint부터 이어서 실행 (이때는 실행마다 configurable.thread_id가 필요)
+# thread(와 namespace)마다 최근 graph_checkpoint_max_per_thread개의 checkpoint만 남김 (None이면 모두 유지)
+graph_checkpoint_enabled = False
+graph_checkpoint_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'graph_checkpoints.sqlite3')
+graph_checkpoint_max_per_thread = 50
+# graph_memo_nodes에 적은 node는 node가 읽는 state 값의 hash가 같으면 이전 결과를 재사용 (기본값: 사용 안 함)
+# 예: ('retrieve', 'grade_documents', 'check_hallucination', 'check_helpfulness')
+# 평가 node는 temperature 0 모델처럼 같은 입력에 같은 결과를 낼 때만 켜는 것이 좋음
+graph_memo_nodes = ()
+graph_memo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'graph_memo.sqlite3')
+graph_memo_ttl_seconds = 60 * 60
+graph_memo_max_entries = 5000
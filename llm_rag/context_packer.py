@@ -0,0 +1,151 @@
+import threading
+from collections import deque
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+
+from token_counter import count_tokens
+
+
+def _shingles(text, size=5):
+    # 공백을 무시한 글자 n-gram (한국어/영어가 섞인 문서에서도 동작)
+    text = ''.join(text.split())
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def text_similarity(a_shingles, b_shingles):
+    """두 문서의 글자 n-gram 집합 Jaccard 유사도 (0~1)"""
+    if not a_shingles or not b_shingles:
+        return 0.0
+    return len(a_shingles & b_shingles) / len(a_shingles | b_shingles)
+
+
+def trim_overlap(text, kept_texts, min_overlap=50, window=400):
+    """
+    text의 앞/뒤가 이미 선택된 chunk의 뒤/앞과 겹치면(chunk_overlap으로 생긴 중복) 겹친 부분을 잘라냅니다.
+    """
+    for kept in kept_texts:
+        # kept의 끝부분 == text의 앞부분
+        tail = kept[-window:]
+        index = tail.find(text[:min_overlap])
+        if index >= 0 and text.startswith(tail[index:]):
+            text = text[len(tail) - index:]
+        # text의 끝부분 == kept의 앞부분
+        head = kept[:window]
+        index = text.rfind(head[:min_overlap], max(0, len(text) - window))
+        if index >= 0 and head.startswith(text[index:]):
+            text = text[:index]
+        if len(text) < min_overlap:
+            break
+    return text.strip()
+
+
+class ContextPacker:
+    """
+    검색된 문서를 프롬프트의 {context}에 넣기 전에 정리합니다.
+
+    1. 완전히 포함되거나 거의 같은 chunk(near-duplicate)를 제거하고, chunk 사이에 겹친 부분을 잘라냄
+    2. MMR로 관련도가 높으면서 서로 다른 내용을 가진 문서를 순서대로 선택
+    3. tokenizer로 센 토큰 수가 max_tokens를 넘지 않을 때까지만 담음
+    4. 선택된 문서를 관련도(검색 순위) 순서로 정렬
+
+    retriever는 관련도 순으로 문서를 반환하므로 관련도는 검색 순위로 계산하고,
+    문서 사이의 유사도는 글자 n-gram으로 계산해 임베딩 API를 추가로 호출하지 않습니다.
+    요청마다 줄어든 토큰 수를 reports에 기록합니다.
+    """
+
+    def __init__(self, max_tokens=3000, mmr_lambda=0.7, near_duplicate_threshold=0.85,
+                 encoding_name='o200k_base'):
+        self.max_tokens = max_tokens
+        self.mmr_lambda = mmr_lambda
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.encoding_name = encoding_name
+
+        self._lock = threading.Lock()
+        self.reports = deque(maxlen=1000)
+
+    def _deduplicate(self, docs):
+        # (검색 순위, 문서, n-gram 집합) 목록. 순위가 높은 문서를 먼저 남기고 뒤에 나온 중복을 버림
+        candidates = []
+        for rank, doc in enumerate(docs):
+            content = doc.page_content.strip()
+            if not content or any(content in kept.page_content for _, kept, _ in candidates):
+                continue
+            shingles = _shingles(content)
+            if any(text_similarity(shingles, kept_shingles) >= self.near_duplicate_threshold
+                   for _, _, kept_shingles in candidates):
+                continue
+            candidates.append((rank, doc, shingles))
+        return candidates
+
+    def _mmr_order(self, candidates, total):
+        # 관련도: 검색 순위가 높을수록 1에 가까움
+        relevance = {rank: 1 - rank / total for rank, _, _ in candidates}
+        remaining = list(candidates)
+        selected = []
+        while remaining:
+            def mmr_score(candidate):
+                rank, _, shingles = candidate
+                redundancy = max((text_similarity(shingles, chosen[2]) for chosen in selected), default=0.0)
+                return self.mmr_lambda * relevance[rank] - (1 - self.mmr_lambda) * redundancy
+
+            best = max(remaining, key=mmr_score)
+            remaining.remove(best)
+            selected.append(best)
+        return selected
+
+    def pack(self, docs):
+        """
+        문서를 정리해 (정리된 문서 목록, 요청 보고서)를 반환합니다.
+
+        Args:
+            docs (list[Document]): retriever가 관련도 순으로 반환한 문서
+
+        Returns:
+            tuple: (list[Document], dict) 보고서에는 원래/정리 후 문서 수와 토큰 수, 줄어든 토큰 수가 들어 있습니다.
+        """
+        tokens_in = sum(count_tokens(doc.page_content, self.encoding_name) for doc in docs)
+        candidates = self._deduplicate(docs)
+
+        packed = []
+        kept_texts = []
+        used_tokens = 0
+        for rank, doc, _ in self._mmr_order(candidates, len(docs)):
+            content = trim_overlap(doc.page_content.strip(), kept_texts)
+            if not content:
+                continue
+            tokens = count_tokens(content, self.encoding_name)
+            if used_tokens + tokens > self.max_tokens:
+                continue
+            used_tokens += tokens
+            kept_texts.append(content)
+            packed.append((rank, Document(page_content=content, metadata=doc.metadata)))
+
+        packed.sort(key=lambda item: item[0])
+        report = {
+            'documents_in': len(docs),
+            'documents_out': len(packed),
+            'tokens_in': tokens_in,
+            'tokens_out': used_tokens,
+            'tokens_saved': tokens_in - used_tokens,
+        }
+        with self._lock:
+            self.reports.append(report)
+        return [doc for _, doc in packed], report
+
+    def as_runnable(self, context_key='context'):
+        """입력 dict의 context_key 문서를 정리된 문서로 바꿔서 다음 체인에 넘기는 Runnable"""
+        return RunnablePassthrough.assign(**{context_key: RunnableLambda(lambda x: self.pack(x[context_key])[0])})
+
+    def report(self):
+        """지금까지 처리한 요청 수와 요청당 평균/전체 줄어든 토큰 수를 반환합니다."""
+        with self._lock:
+            reports = list(self.reports)
+        saved = [report['tokens_saved'] for report in reports]
+        return {
+            'requests': len(reports),
+            'avg_tokens_saved': sum(saved) / len(saved) if saved else None,
+            'total_tokens_saved': sum(saved),
+        }
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    임베딩 결과를 디스크에 저장해 두고 재사용하는 Embeddings wrapper.
+
+    key는 (모델 이름 + 텍스트)의 sha256 hash이므로 같은 텍스트는 어느 retriever에서 요청하든
+    한 번만 임베딩 API를 호출합니다. OpenAIEmbeddings 대신 이 객체를 넘기기만 하면 됩니다.
+
+        embedding = CachedEmbeddings(OpenAIEmbeddings(model="text-embedding-3-large"), cache_dir)
+
+    - vectors.bin: float 배열을 행 단위로 이어 붙인 파일 (np.memmap으로 읽음)
+    - index.sqlite3: key -> 행 번호(offset) 인덱스
+    - 캐시에 없는 텍스트만 모아서 한 번의 embed_documents 호출로 계산
+    """
+
+    def __init__(self, underlying, cache_dir, model_name=None, dtype=np.float32):
+        self.underlying = underlying
+        self.model_name = model_name or getattr(underlying, 'model', type(underlying).__name__)
+        self.dtype = np.dtype(dtype)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._vectors_path = os.path.join(cache_dir, 'vectors.bin')
+        open(self._vectors_path, 'ab').close()
+
+        self._lock = threading.Lock()
+        # 여러 프로세스(Streamlit, 그래프 스크립트 등)가 같은 캐시를 공유할 수 있도록
+        # 행 번호 할당은 SQLite 트랜잭션 안에서 수행
+        self._conn = sqlite3.connect(
+            os.path.join(cache_dir, 'index.sqlite3'), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+
+        self._dim = self._read_dim()
+        self._mmap = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text):
+        return hashlib.sha256(f'{self.model_name}\0{text}'.encode('utf-8')).hexdigest()
+
+    def _read_dim(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        return int(row[0]) if row else None
+
+    def _read_rows(self, rows):
+        if self._dim is None:
+            # 처음 연 뒤에 다른 프로세스가 첫 벡터를 저장했으면 그때 기록된 차원을 사용
+            self._dim = self._read_dim()
+        row_bytes = self._dim * self.dtype.itemsize
+        needed = max(rows) + 1
+        if self._mmap is None or self._mmap.shape[0] < needed:
+            # 다른 프로세스가 파일 뒤에 행을 추가했을 수 있으므로 필요할 때만 다시 매핑
+            total = os.path.getsize(self._vectors_path) // row_bytes
+            self._mmap = np.memmap(self._vectors_path, dtype=self.dtype, mode='r', shape=(total, self._dim))
+        return np.asarray(self._mmap[rows], dtype=np.float32)
+
+    def _lookup(self, keys):
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        # SQLite의 파라미터 개수 제한을 피하기 위해 나눠서 조회
+        for start in range(0, len(unique_keys), 500):
+            batch = unique_keys[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            found.update(self._conn.execute(
+                f"SELECT key, row FROM vectors WHERE key IN ({placeholders})", batch
+            ).fetchall())
+        return found
+
+    def _store(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=self.dtype)
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self._dim is None:
+                self._dim = self._read_dim() or vectors.shape[1]
+                self._conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('dim', ?)", (str(self._dim),))
+            if vectors.shape[1] != self._dim:
+                raise ValueError(f'embedding dimension {vectors.shape[1]} does not match cache dimension {self._dim}')
+
+            next_row = self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM vectors").fetchone()[0]
+            with open(self._vectors_path, 'r+b') as f:
+                f.seek(next_row * self._dim * self.dtype.itemsize)
+                f.write(vectors.tobytes())
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO vectors (key, row) VALUES (?, ?)",
+                [(key, next_row + i) for i, key in enumerate(keys)],
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def embed_documents(self, texts):
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            found = self._lookup(keys)
+
+        # 캐시에 없는 텍스트만 중복 없이 모아서 한 번에 임베딩
+        # API 호출 중에는 lock을 잡지 않으므로 여러 스레드가 동시에 다른 batch를 임베딩할 수 있다.
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            new_vectors = self.underlying.embed_documents(list(missing.values()))
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+            if missing:
+                self._store(list(missing.keys()), new_vectors)
+                found = self._lookup(keys)
+            if not texts:
+                return []
+            vectors = self._read_rows([found[key] for key in keys])
+        return vectors.tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
@@ -0,0 +1,252 @@
+"""
+LangGraph 그래프(spring_doc_graph.py, stock-multi-agent.py)의 실행 상태를 SQLite에 저장하는 checkpointer와
+결정적인(같은 입력이면 같은 결과인) node의 결과를 재사용하는 memoization.
+
+- SQLiteCheckpointSaver: langgraph-checkpoint-sqlite의 SqliteSaver로 step마다 checkpoint와 끝난 task의 결과
+  (pending writes)를 SQLite 파일에 저장합니다.
+  실행 중에 프로세스가 죽거나 timeout/오류가 나도 같은 thread_id로 graph.invoke(None, config)를 호출하면
+  마지막 checkpoint부터 이어서 실행하고, 같은 step에서 이미 끝난 node(병렬 worker 등)는 다시 실행하지 않습니다.
+- NodeMemo / memoize_node: retrieve, 평가 node처럼 입력이 같으면 결과가 같은 node를 감싸
+  node가 읽는 state 값의 hash를 key로 결과를 저장합니다 (TTL, 최대 개수(LRU), node별 hit rate).
+
+사용 예:
+    graph = build_graph(checkpointer=get_checkpointer())
+    config = {'configurable': {'thread_id': 'question-1'}}
+    graph.invoke({'query': '...'}, config)
+    graph.invoke(None, config)  # 중간에 실패했으면 마지막 checkpoint부터 이어서 실행
+
+checkpointer를 붙인 그래프는 실행할 때마다 config의 configurable.thread_id가 필요합니다.
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+
+class SQLiteCheckpointSaver(SqliteSaver):
+    """
+    langgraph-checkpoint-sqlite의 SqliteSaver에 아래 두 가지를 더한 checkpointer.
+
+    - async 메서드(graph.ainvoke/astream): SqliteSaver는 지원하지 않고, AsyncSqliteSaver는 event loop에 묶인 연결을
+      사용해 sync/async 실행을 함께 하는 그래프에 쓰기 어려우므로 같은 연결의 sync 메서드를 thread pool에서 실행
+    - max_checkpoints_per_thread를 넘으면 thread(와 namespace)별로 가장 오래된 checkpoint부터 삭제
+    """
+
+    def __init__(self, path, max_checkpoints_per_thread=None, serde=None):
+        super().__init__(sqlite3.connect(path, check_same_thread=False), serde=serde)
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        if self.max_checkpoints_per_thread is not None:
+            self._prune(next_config['configurable']['thread_id'], next_config['configurable']['checkpoint_ns'])
+        return next_config
+
+    def _prune(self, thread_id, checkpoint_ns):
+        # checkpoint id(uuid6)는 시간 순서대로 정렬됨
+        with self.cursor() as cur:
+            old = cur.execute(
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+                (thread_id, checkpoint_ns, self.max_checkpoints_per_thread),
+            ).fetchall()
+            for table in ('checkpoints', 'writes'):
+                cur.executemany(
+                    f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    [(thread_id, checkpoint_ns, checkpoint_id) for (checkpoint_id,) in old],
+                )
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=''):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def _stable(value):
+    # json.dumps가 직접 바꾸지 못하는 값을 내용이 같으면 항상 같은 형태로 변환
+    if isinstance(value, Document):
+        return {'page_content': value.page_content, 'metadata': value.metadata}
+    if isinstance(value, BaseMessage):
+        return {'type': value.type, 'name': value.name, 'content': value.content}
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    if hasattr(value, 'model_dump'):
+        return value.model_dump()
+    return repr(value)
+
+
+def state_key(node, state, keys):
+    """node 이름과 state 중 keys 값으로 만든 hash. 나머지 state(예산, 시각 등)는 key에 들어가지 않습니다."""
+    inputs = {key: state.get(key) for key in keys}
+    payload = json.dumps({'node': node, 'inputs': inputs}, sort_keys=True, ensure_ascii=False, default=_stable)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class NodeMemo:
+    """
+    node 결과(state 업데이트 dict)를 입력 hash로 저장하는 캐시.
+
+    - 저장소: SQLite 파일 (':memory:'이면 프로세스 안에서만 유지)
+    - 만료: ttl_seconds가 지난 결과는 사용하지 않고 삭제
+    - 용량: max_entries를 넘으면 가장 오래 사용되지 않은 결과부터 삭제 (LRU)
+    - 통계: node별 hit/miss 수와 hit rate (report())
+    """
+
+    def __init__(self, path=':memory:', ttl_seconds=60 * 60, max_entries=5000, serde=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.serde = serde or JsonPlusSerializer()
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS node_results (
+                key TEXT PRIMARY KEY,
+                node TEXT NOT NULL,
+                value_type TEXT NOT NULL,
+                value BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, node, key):
+        """저장된 결과를 반환합니다. 없거나 만료되었으면 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value_type, value, created_at FROM node_results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds is not None and row[2] < now - self.ttl_seconds:
+                self._conn.execute("DELETE FROM node_results WHERE key = ?", (key,))
+                self._conn.commit()
+                self.expired += 1
+                row = None
+            if row is None:
+                self.misses[node] += 1
+                return None
+            self._conn.execute("UPDATE node_results SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits[node] += 1
+        return self.serde.loads_typed((row[0], row[1]))
+
+    def put(self, node, key, value):
+        value_type, value_blob = self.serde.dumps_typed(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO node_results (key, node, value_type, value, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, node, value_type, value_blob, now, now),
+            )
+            # 용량을 넘으면 가장 오래 사용되지 않은 결과부터 삭제
+            deleted = self._conn.execute(
+                "DELETE FROM node_results WHERE key NOT IN "
+                "(SELECT key FROM node_results ORDER BY last_access DESC LIMIT ?)",
+                (self.max_entries,),
+            ).rowcount
+            self.evictions += max(deleted, 0)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM node_results")
+            self._conn.commit()
+
+    def report(self):
+        """node별 hit/miss 수와 hit rate, 저장된 결과 수, LRU로 삭제된 수, 만료된 수를 반환합니다."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM node_results").fetchone()[0]
+            nodes = {}
+            for node in sorted(set(self.hits) | set(self.misses)):
+                hits, misses = self.hits[node], self.misses[node]
+                nodes[node] = {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses)}
+            hits, misses = sum(self.hits.values()), sum(self.misses.values())
+            return {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else None,
+                'nodes': nodes,
+                'entries': entries,
+                'evictions': self.evictions,
+                'expired': self.expired,
+            }
+
+
+def memoize_node(memo, name, keys, func, afunc=None, on_hit=None):
+    """
+    node 함수를 memo로 감싼 Runnable을 반환합니다.
+
+    Args:
+        memo (NodeMemo): 결과를 저장할 캐시
+        name (str): node 이름 (key와 통계에 사용)
+        keys (tuple): node가 읽는 state key. 이 값들이 같으면 같은 결과를 재사용
+        func, afunc: node의 sync/async 함수 (afunc가 없으면 async 실행에서도 func를 사용)
+        on_hit (dict): 재사용할 때 결과에서 덮어쓸 값. 예: {'tokens_used': 0} (LLM을 다시 호출하지 않았으므로)
+    """
+    on_hit = on_hit or {}
+
+    def cached(state):
+        key = state_key(name, state, keys)
+        result = memo.get(name, key)
+        return key, None if result is None else {**result, **on_hit}
+
+    def run(state):
+        key, result = cached(state)
+        if result is None:
+            result = func(state)
+            memo.put(name, key, result)
+        return result
+
+    async def arun(state):
+        key, result = await asyncio.to_thread(cached, state)
+        if result is None:
+            result = await afunc(state) if afunc else await asyncio.to_thread(func, state)
+            await asyncio.to_thread(memo.put, name, key, result)
+        return result
+
+    return RunnableLambda(run, afunc=arun, name=name)
+
+
+@lru_cache(maxsize=None)
+def get_checkpointer():
+    # config.graph_checkpoint_path의 checkpointer를 프로세스당 하나만 만들어 두 그래프가 함께 사용
+    from config import graph_checkpoint_path, graph_checkpoint_max_per_thread
+
+    return SQLiteCheckpointSaver(graph_checkpoint_path, max_checkpoints_per_thread=graph_checkpoint_max_per_thread)
+
+
+@lru_cache(maxsize=None)
+def get_node_memo():
+    from config import graph_memo_path, graph_memo_ttl_seconds, graph_memo_max_entries
+
+    return NodeMemo(graph_memo_path, ttl_seconds=graph_memo_ttl_seconds, max_entries=graph_memo_max_entries)
@@ -0,0 +1,195 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import message_to_dict, messages_from_dict, trim_messages
+
+from token_counter import count_message_tokens
+
+
+def trim_to_token_window(messages, max_tokens):
+    """
+    프롬프트에 넣을 대화 기록을 최근 메시지 위주로 max_tokens 이내가 되도록 자릅니다.
+    질문-답변 쌍이 깨지지 않도록 human 메시지부터 시작하게 맞춥니다.
+    """
+    if max_tokens is None:
+        return messages
+    return trim_messages(
+        messages,
+        max_tokens=max_tokens,
+        token_counter=count_message_tokens,
+        strategy='last',
+        start_on='human',
+    )
+
+
+class InMemoryChatMessageHistory(BaseChatMessageHistory):
+    """메모리에 저장하되, 읽을 때는 토큰 윈도우만큼만 돌려주는 대화 기록"""
+
+    def __init__(self, max_tokens=None, max_messages=None):
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+        self._messages = []
+
+    @property
+    def messages(self):
+        return trim_to_token_window(list(self._messages), self.max_tokens)
+
+    def add_messages(self, messages):
+        self._messages.extend(messages)
+        if self.max_messages is not None and len(self._messages) > self.max_messages:
+            del self._messages[:-self.max_messages]
+
+    def clear(self):
+        self._messages = []
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """SQLite에 저장된 한 세션의 대화 기록. 객체 자체는 상태를 거의 갖지 않습니다."""
+
+    def __init__(self, store, session_id):
+        self.store = store
+        self.session_id = session_id
+
+    @property
+    def messages(self):
+        return trim_to_token_window(self.store.load_messages(self.session_id), self.store.max_tokens)
+
+    def add_messages(self, messages):
+        self.store.append_messages(self.session_id, messages)
+
+    def clear(self):
+        self.store.delete_session(self.session_id)
+
+
+class InMemoryHistoryStore:
+    """
+    세션별 대화 기록을 메모리에 보관하는 저장소.
+    max_sessions를 넘으면 가장 오래 사용되지 않은 세션부터 삭제합니다 (LRU).
+    """
+
+    def __init__(self, max_sessions=1000, max_tokens=2000, max_messages=100):
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_session_history(self, session_id):
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None:
+                history = InMemoryChatMessageHistory(self.max_tokens, self.max_messages)
+                self._sessions[session_id] = history
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return history
+
+
+class SQLiteHistoryStore:
+    """
+    세션별 대화 기록을 SQLite에 보관하는 저장소.
+    프로세스 메모리에는 기록을 올려두지 않으므로 대화가 길어져도 메모리 사용량이 일정합니다.
+
+    - max_sessions: 세션 수가 이보다 많아지면 가장 오래 사용되지 않은 세션부터 삭제 (LRU)
+    - idle_seconds: 이 시간 동안 사용되지 않은 세션 삭제
+    - max_messages: 세션당 저장하는 최대 메시지 수
+    - max_tokens: 프롬프트에 넣을 대화 기록의 최대 토큰 수
+
+    세션 정리(_evict)는 메시지마다 하지 않고, 새 세션으로 max_sessions를 넘었을 때나
+    마지막 정리 후 evict_interval_seconds가 지났을 때만 합니다.
+    """
+
+    def __init__(self, path, max_sessions=1000, idle_seconds=60 * 60 * 24, max_tokens=2000, max_messages=100,
+                 evict_interval_seconds=60.0):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+        self.evict_interval_seconds = evict_interval_seconds
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                message TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+        self._conn.commit()
+        self._session_count = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        self._last_evict = 0.0
+
+    def get_session_history(self, session_id):
+        now = time.time()
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id)
+            ).rowcount
+            if not updated:
+                self._conn.execute("INSERT INTO sessions (session_id, last_access) VALUES (?, ?)", (session_id, now))
+                self._session_count += 1
+            if self._session_count > self.max_sessions or now - self._last_evict >= self.evict_interval_seconds:
+                self._evict(now)
+            self._conn.commit()
+        return SQLiteChatMessageHistory(self, session_id)
+
+    def _evict(self, now):
+        # 오래 사용되지 않은 세션과, 세션 수가 max_sessions를 넘은 만큼 가장 오래된 세션을 삭제 (last_access 인덱스 사용)
+        self._last_evict = now
+        stale = [row[0] for row in self._conn.execute(
+            "SELECT session_id FROM sessions WHERE last_access < ?", (now - self.idle_seconds,)
+        )]
+        # 다른 프로세스가 같은 파일에 세션을 추가했을 수 있으므로 정리할 때는 실제 세션 수를 다시 셈
+        count = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        overflow = count - len(stale) - self.max_sessions
+        if overflow > 0:
+            stale += [row[0] for row in self._conn.execute(
+                "SELECT session_id FROM sessions WHERE last_access >= ? ORDER BY last_access LIMIT ?",
+                (now - self.idle_seconds, overflow),
+            )]
+        self._conn.executemany("DELETE FROM messages WHERE session_id = ?", [(session_id,) for session_id in stale])
+        self._conn.executemany("DELETE FROM sessions WHERE session_id = ?", [(session_id,) for session_id in stale])
+        self._session_count = count - len(stale)
+
+    def _delete(self, session_id):
+        self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def load_messages(self, session_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message FROM messages WHERE session_id = ? ORDER BY id", (session_id,)
+            ).fetchall()
+        return messages_from_dict([json.loads(row[0]) for row in rows])
+
+    def append_messages(self, session_id, messages):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO messages (session_id, message) VALUES (?, ?)",
+                [(session_id, json.dumps(message_to_dict(message), ensure_ascii=False)) for message in messages],
+            )
+            self._conn.execute(
+                "DELETE FROM messages WHERE session_id = ? AND id NOT IN "
+                "(SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                (session_id, session_id, self.max_messages),
+            )
+            self._conn.commit()
+
+    def delete_session(self, session_id):
+        with self._lock:
+            self._delete(session_id)
+            self._conn.commit()
+            self._session_count = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
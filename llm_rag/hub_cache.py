@@ -0,0 +1,33 @@
+import os
+
+from langchain_core.load import dumps, loads
+
+
+def _cache_path(name, cache_dir):
+    # "langchain-ai/rag-answer-helpfulness" -> langchain-ai__rag-answer-helpfulness.json
+    return os.path.join(cache_dir, name.replace('/', '__').replace(':', '@') + '.json')
+
+
+def pull_prompt(name, cache_dir, refresh=False):
+    """
+    hub.pull과 같지만, 한 번 받아온 프롬프트는 cache_dir에 JSON으로 저장해 두고 재사용합니다.
+    네트워크 없이도 프롬프트를 읽을 수 있고, 매번 hub에 요청하지 않아 시작 속도가 빨라집니다.
+
+    Args:
+        name (str): hub 프롬프트 이름 (예: "rlm/rag-prompt")
+        cache_dir (str): 프롬프트를 저장할 디렉터리
+        refresh (bool): True이면 캐시를 무시하고 hub에서 다시 받아옵니다.
+    """
+    path = _cache_path(name, cache_dir)
+    if not refresh and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return loads(f.read())
+
+    # langchain hub 클라이언트는 import 자체가 무거우므로 캐시에 없을 때만 불러온다.
+    from langchain import hub
+
+    prompt = hub.pull(name)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(dumps(prompt, pretty=True))
+    return prompt
@@ -0,0 +1,170 @@
+import glob
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Any
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+_TOKEN_PATTERN = re.compile(r'@?[0-9A-Za-z_]+|[가-힣]+')
+_HANGUL_PATTERN = re.compile(r'[가-힣]+')
+_CAMEL_PATTERN = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+
+
+def korean_tokenize(text):
+    """
+    BM25용 토큰화.
+    - 영문/숫자 단어(BeanFactory, @Transactional 등)는 소문자로 바꿔 단어 그대로 사용하고,
+      "Bean Factory"처럼 띄어 쓴 문서와도 매칭되도록 camelCase 조각(bean, factory)을 함께 추가
+    - 한글은 조사가 붙어도("스프링은", "스프링이") 매칭되도록 글자 bigram으로 분리
+    """
+    tokens = []
+    for word in _TOKEN_PATTERN.findall(text):
+        if _HANGUL_PATTERN.fullmatch(word):
+            if len(word) <= 2:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word.lower())
+            if word.startswith('@'):
+                tokens.append(word[1:].lower())
+            parts = _CAMEL_PATTERN.findall(word)
+            if len(parts) > 1:
+                tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+def load_documents(pattern, chunk_size=1000, chunk_overlap=100):
+    """
+    pattern에 맞는 파일(예: documents/*.md)을 읽어 chunk 단위 Document 목록으로 반환합니다.
+    ingest.py가 vector store에 upsert하는 것과 같은 chunk(내용, metadata, chunk id)이므로
+    BM25 결과와 vector 검색 결과가 같은 문서 집합을 가리킵니다.
+    """
+    from ingest import chunk_file
+
+    documents = []
+    for path in sorted(glob.glob(pattern)):
+        for chunk_id, _, content, metadata in chunk_file(path, chunk_size, chunk_overlap):
+            documents.append(Document(id=chunk_id, page_content=content, metadata={**metadata, 'chunk_id': chunk_id}))
+    return documents
+
+
+class BM25Index:
+    """메모리 위의 역색인(inverted index)과 BM25 점수 계산"""
+
+    def __init__(self, documents, k1=1.5, b=0.75, tokenizer=korean_tokenize):
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self.tokenizer = tokenizer
+
+        self._postings = defaultdict(list)
+        self._lengths = []
+        for doc_id, document in enumerate(documents):
+            counts = Counter(tokenizer(document.page_content))
+            self._lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self._postings[term].append((doc_id, tf))
+
+        n = len(documents)
+        self._avg_length = sum(self._lengths) / n if n else 0.0
+        self._idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def search(self, query, k=4):
+        """(Document, 점수) 목록을 점수가 높은 순으로 반환합니다."""
+        scores = defaultdict(float)
+        for term in set(self.tokenizer(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self._postings[term]:
+                length_norm = 1 - self.b + self.b * self._lengths[doc_id] / self._avg_length
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.documents[doc_id], score) for doc_id, score in ranked]
+
+
+def reciprocal_rank_fusion(result_lists, k=4, rrf_k=60):
+    """
+    여러 검색 결과 목록을 순위만으로 합칩니다 (RRF). 같은 내용의 문서는 하나로 합쳐집니다.
+    점수 = sum(1 / (rrf_k + 순위))
+    """
+    scores = defaultdict(float)
+    documents = {}
+    for results in result_lists:
+        for rank, document in enumerate(results, start=1):
+            key = document.page_content
+            scores[key] += 1 / (rrf_k + rank)
+            documents.setdefault(key, document)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+    fused = []
+    for key, score in ranked:
+        document = documents[key]
+        fused.append(Document(page_content=document.page_content,
+                              metadata={**document.metadata, 'rrf_score': score}))
+    return fused
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    로컬 BM25 검색과 기존 vector retriever(Chroma/Pinecone) 결과를 RRF로 합치는 retriever.
+
+    lexical_fast_path가 True이고 BM25 1등 점수가 lexical_min_score 이상이며 2등보다 lexical_margin배 이상 높으면
+    키워드 검색 결과만으로 충분하다고 보고 임베딩 호출과 vector 검색을 건너뜁니다 (lexical fast path).
+    BM25 점수는 정규화되지 않아 문서 집합마다 범위가 다르므로, fast path는 기본적으로 꺼져 있습니다.
+    """
+
+    index: Any
+    vector_retriever: BaseRetriever
+    k: int = 4
+    rrf_k: int = 60
+    lexical_fast_path: bool = False
+    lexical_min_score: float = 4.0
+    lexical_margin: float = 1.5
+
+    _stats: dict = PrivateAttr(default_factory=lambda: {'queries': 0, 'lexical_only': 0})
+
+    def _lexical(self, query):
+        # 색인에 들어 있는 Document는 공유되므로 점수는 복사본에 기록
+        return [
+            (Document(page_content=document.page_content, metadata={**document.metadata, 'bm25_score': score}), score)
+            for document, score in self.index.search(query, self.k)
+        ]
+
+    def _is_confident(self, results):
+        if not self.lexical_fast_path or not results or results[0][1] < self.lexical_min_score:
+            return False
+        if len(results) == 1:
+            return True
+        return results[0][1] >= self.lexical_margin * results[1][1]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        self._stats['queries'] += 1
+        lexical = self._lexical(query)
+        if self._is_confident(lexical):
+            self._stats['lexical_only'] += 1
+            return [document for document, _ in lexical]
+        # vector 검색을 이 retriever run의 하위 run으로 기록 (callback이 검색 문서 수를 두 번 세지 않도록)
+        vector = self.vector_retriever.invoke(query, config={'callbacks': run_manager.get_child()})
+        return reciprocal_rank_fusion([[document for document, _ in lexical], vector], self.k, self.rrf_k)
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        self._stats['queries'] += 1
+        lexical = self._lexical(query)
+        if self._is_confident(lexical):
+            self._stats['lexical_only'] += 1
+            return [document for document, _ in lexical]
+        vector = await self.vector_retriever.ainvoke(query, config={'callbacks': run_manager.get_child()})
+        return reciprocal_rank_fusion([[document for document, _ in lexical], vector], self.k, self.rrf_k)
+
+    def stats(self):
+        """전체 검색 수와 임베딩 없이 BM25만으로 응답한 비율을 반환합니다."""
+        stats = dict(self._stats)
+        stats['lexical_only_rate'] = stats['lexical_only'] / stats['queries'] if stats['queries'] else None
+        return stats
@@ -0,0 +1,265 @@
+"""
+langgraph-lecture/documents의 문서를 chunk로 나눠 Chroma 또는 Pinecone 인덱스에 증분(incremental) 반영합니다.
+
+- 파일별 chunk 분할은 process pool에서 병렬로 수행
+- chunk 내용의 hash를 manifest(SQLite)에 저장해 두고, 바뀌지 않은 chunk는 건너뜀
+- 새로 임베딩할 chunk는 토큰 수 기준으로 크기를 맞춘 batch로 나눠 동시에(제한된 개수만큼) 임베딩
+- 안정적인 chunk id로 upsert하고, 문서에서 사라진 chunk는 id로 삭제
+- Chroma를 갱신하면 그 collection에서 만든 양자화 인덱스(config.quantized_index_dir)도 다시 만듦
+- 처음 실행할 때(manifest가 비어 있을 때)는 upsert만 하고, manifest에 없는 기존 vector(노트북에서 uuid id로 넣은
+  PDF chunk 등) 수만 출력. --prune-unmanaged를 주고 실행하면(첫 실행이 아니어도) 그 vector를 삭제
+  (Pinecone pod 인덱스처럼 id 목록을 가져올 수 없으면 --rebuild로 인덱스를 비운 뒤 다시 반영)
+
+사용 예:
+    python ingest.py --target chroma  # config.chroma_persist_directory의 spring_framework_docs collection
+    python ingest.py --target pinecone --index spring-index
+    python ingest.py --target pinecone --index spring-index --prune-unmanaged
+    python ingest.py --target pinecone --index spring-index --rebuild
+"""
+import argparse
+import glob
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from langchain_openai import OpenAIEmbeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from config import chroma_persist_directory, documents_pattern, embedding_cache_dir, quantized_index_dir
+from embedding_cache import CachedEmbeddings
+from token_counter import count_tokens
+
+MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ingest_manifest.sqlite3')
+
+
+def chunk_file(path, chunk_size=1000, chunk_overlap=100):
+    """
+    파일 하나를 chunk로 나눠 (chunk id, 내용 hash, 내용, metadata) 목록을 반환합니다.
+    process pool에서 실행되므로 모듈 최상위 함수여야 합니다.
+
+    chunk id는 (파일 이름, 내용, 같은 내용이 몇 번째로 나왔는지)로 만들기 때문에
+    문서의 다른 부분을 고쳐도 바뀌지 않은 chunk의 id는 그대로 유지됩니다.
+    """
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    source = os.path.basename(path)
+
+    chunks = []
+    seen = {}
+    for content in splitter.split_text(text):
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        occurrence = seen.get(content_hash, 0)
+        seen[content_hash] = occurrence + 1
+        chunk_id = hashlib.sha256(f'{source}\0{content_hash}\0{occurrence}'.encode('utf-8')).hexdigest()[:32]
+        chunks.append((chunk_id, content_hash, content, {'source': source}))
+    return chunks
+
+
+def chunk_files(paths, chunk_size, chunk_overlap, max_workers=None):
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(chunk_file, paths, [chunk_size] * len(paths), [chunk_overlap] * len(paths))
+        return [chunk for chunks in results for chunk in chunks]
+
+
+def make_batches(texts, max_tokens=8000, max_texts=256):
+    """임베딩 API 한 번에 보낼 batch를 토큰 수(max_tokens)와 개수(max_texts) 기준으로 나눕니다."""
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for text in texts:
+        tokens = count_tokens(text, 'cl100k_base')
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_texts):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class Manifest:
+    """인덱스(target)별로 이미 반영한 chunk id와 내용 hash를 기록"""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "target TEXT NOT NULL, chunk_id TEXT NOT NULL, content_hash TEXT NOT NULL, "
+            "PRIMARY KEY (target, chunk_id))"
+        )
+        self._conn.commit()
+
+    def load(self, target):
+        rows = self._conn.execute("SELECT chunk_id, content_hash FROM chunks WHERE target = ?", (target,))
+        return dict(rows.fetchall())
+
+    def clear(self, target):
+        self._conn.execute("DELETE FROM chunks WHERE target = ?", (target,))
+        self._conn.commit()
+
+    def update(self, target, upserted, deleted):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO chunks (target, chunk_id, content_hash) VALUES (?, ?, ?)",
+            [(target, chunk_id, content_hash) for chunk_id, content_hash in upserted],
+        )
+        self._conn.executemany(
+            "DELETE FROM chunks WHERE target = ? AND chunk_id = ?", [(target, chunk_id) for chunk_id in deleted]
+        )
+        self._conn.commit()
+
+
+def open_vector_store(args, embedding):
+    """
+    (manifest에 쓸 target 이름, vector store, 저장된 모든 id를 반환하는 함수)를 반환합니다.
+    id 목록을 가져올 수 없는 인덱스(Pinecone pod 인덱스)이면 함수는 None을 반환합니다.
+    """
+    if args.target == 'chroma':
+        from langchain_chroma import Chroma
+
+        persist_directory = os.path.abspath(args.persist_directory)
+        vector_store = Chroma(
+            embedding_function=embedding,
+            collection_name=args.collection,
+            persist_directory=persist_directory,
+        )
+        target = f'chroma:{persist_directory}:{args.collection}'
+        return target, vector_store, lambda: vector_store.get(include=[])['ids']
+
+    from langchain_pinecone import PineconeVectorStore
+
+    vector_store = PineconeVectorStore.from_existing_index(index_name=args.index, embedding=embedding)
+
+    def list_ids():
+        # index.list()는 serverless 인덱스에서만 지원
+        try:
+            return [vector_id for ids in vector_store.index.list() for vector_id in ids]
+        except Exception:
+            return None
+    return f'pinecone:{args.index}', vector_store, list_ids
+
+
+def clear_vector_store(args, vector_store, list_ids, batch_size=1000):
+    """--rebuild: 인덱스에 저장된 vector를 모두 삭제합니다."""
+    if args.target == 'pinecone':
+        vector_store.delete(delete_all=True)
+        return
+    ids = list_ids()
+    for start in range(0, len(ids), batch_size):
+        vector_store.delete(ids=ids[start:start + batch_size])
+
+
+def ingest(vector_store, target, chunks, embedding, manifest, batch_tokens=8000, concurrency=4, upsert_batch_size=100,
+           list_ids=None, prune_unmanaged=False):
+    """
+    chunks를 vector store에 증분 반영하고, 처리 결과 요약을 반환합니다.
+
+    manifest에 target 기록이 없거나(처음 실행) prune_unmanaged=True이면 list_ids()로 가져온 기존 vector 중
+    manifest에도 현재 chunk에도 없는 것(노트북에서 uuid id로 넣은 vector 등)의 수를 요약의 'unmanaged'에 담습니다.
+    prune_unmanaged=True일 때만 그 vector를 삭제합니다 (기본값은 upsert만 하고 기존 vector는 그대로 둠).
+    """
+    started = time.perf_counter()
+    indexed = manifest.load(target)
+    current = {chunk_id: (content_hash, content, metadata) for chunk_id, content_hash, content, metadata in chunks}
+
+    changed = [chunk_id for chunk_id, (content_hash, _, _) in current.items() if indexed.get(chunk_id) != content_hash]
+    deleted = [chunk_id for chunk_id in indexed if chunk_id not in current]
+    unmanaged = None
+    pruned = 0
+    if list_ids is not None and (not indexed or prune_unmanaged):
+        existing = list_ids()
+        if existing is not None:
+            stale = [vector_id for vector_id in existing if vector_id not in current and vector_id not in indexed]
+            unmanaged = len(stale)
+            if prune_unmanaged:
+                deleted += stale
+                pruned = len(stale)
+        elif prune_unmanaged:
+            raise RuntimeError(
+                f'{target}: 기존 vector의 id 목록을 가져올 수 없습니다. --rebuild로 인덱스를 비운 뒤 다시 실행하세요.'
+            )
+
+    # 1) 바뀐 chunk만 batch로 나눠 동시에 임베딩 (결과는 CachedEmbeddings에 저장됨)
+    texts = [current[chunk_id][1] for chunk_id in changed]
+    batches = make_batches(texts, max_tokens=batch_tokens)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(embedding.embed_documents, batches))
+
+    # 2) 안정적인 id로 upsert. 임베딩은 1)에서 캐시에 저장되었으므로 다시 API를 호출하지 않는다.
+    for start in range(0, len(changed), upsert_batch_size):
+        batch_ids = changed[start:start + upsert_batch_size]
+        vector_store.add_texts(
+            texts=[current[chunk_id][1] for chunk_id in batch_ids],
+            metadatas=[{**current[chunk_id][2], 'chunk_id': chunk_id} for chunk_id in batch_ids],
+            ids=batch_ids,
+        )
+
+    # 3) 문서에서 사라진 chunk 삭제
+    for start in range(0, len(deleted), upsert_batch_size):
+        vector_store.delete(ids=deleted[start:start + upsert_batch_size])
+
+    manifest.update(target, [(chunk_id, current[chunk_id][0]) for chunk_id in changed], deleted)
+    return {
+        'chunks': len(current),
+        'unchanged': len(current) - len(changed),
+        'upserted': len(changed),
+        'deleted': len(deleted),
+        'unmanaged': unmanaged,
+        'pruned': pruned,
+        'embedding_batches': len(batches),
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='문서를 chunk로 나눠 vector store에 증분 반영합니다.')
+    parser.add_argument('--target', choices=['chroma', 'pinecone'], required=True)
+    parser.add_argument('--pattern', default=documents_pattern, help='읽어올 문서 파일 패턴')
+    parser.add_argument('--persist-directory', default=chroma_persist_directory, help='Chroma 저장 디렉터리')
+    parser.add_argument('--collection', default='spring_framework_docs', help='Chroma collection 이름')
+    parser.add_argument('--index', default='spring-index', help='Pinecone 인덱스 이름')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--chunk-overlap', type=int, default=100)
+    parser.add_argument('--batch-tokens', type=int, default=8000, help='임베딩 batch 하나의 최대 토큰 수')
+    parser.add_argument('--concurrency', type=int, default=4, help='동시에 보낼 임베딩 요청 수')
+    parser.add_argument('--workers', type=int, default=None, help='chunk 분할에 사용할 프로세스 수')
+    parser.add_argument('--rebuild', action='store_true', help='인덱스와 manifest를 비우고 모든 chunk를 다시 반영')
+    parser.add_argument('--prune-unmanaged', action='store_true',
+                        help='처음 실행할 때 manifest에 없는 기존 vector(노트북에서 넣은 vector 등)를 삭제')
+    args = parser.parse_args()
+
+    load_dotenv()
+    paths = sorted(glob.glob(args.pattern))
+    chunks = chunk_files(paths, args.chunk_size, args.chunk_overlap, args.workers)
+
+    embedding = CachedEmbeddings(OpenAIEmbeddings(model='text-embedding-3-large'), embedding_cache_dir)
+    target, vector_store, list_ids = open_vector_store(args, embedding)
+    manifest = Manifest()
+    if args.rebuild:
+        clear_vector_store(args, vector_store, list_ids)
+        manifest.clear(target)
+    summary = ingest(
+        vector_store, target, chunks, embedding, manifest,
+        batch_tokens=args.batch_tokens, concurrency=args.concurrency, list_ids=list_ids,
+        prune_unmanaged=args.prune_unmanaged,
+    )
+    print(f'files: {len(paths)}, {summary}')
+    if summary['unmanaged'] and not args.prune_unmanaged:
+        print(f"{target}에 manifest에 없는 vector {summary['unmanaged']}개가 남아 있습니다 (dry-run). "
+              f"삭제하려면 --prune-unmanaged를 주고 다시 실행하세요.")
+
+    # Chroma에서 만든 양자화 인덱스(quantized_index.py)는 Chroma 내용을 복사한 것이므로 바뀐 내용이 있으면 다시 만듦
+    if args.target == 'chroma' and (summary['upserted'] or summary['deleted']):
+        from quantized_index import rebuild_if_source
+
+        if rebuild_if_source(quantized_index_dir, args.persist_directory, args.collection):
+            print(f'rebuilt quantized index: {quantized_index_dir}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# 단계별 실행 시간 histogram의 bucket 경계(초)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_COUNTERS = ('prompt_tokens', 'completion_tokens', 'llm_calls', 'retriever_calls', 'retriever_hits')
+
+
+def _new_record(pipeline, stage):
+    return {
+        'pipeline': pipeline,
+        'stage': stage,
+        'started': time.perf_counter(),
+        'first_token': None,
+        'prompt_tokens': 0,
+        'completion_tokens': 0,
+        'llm_calls': 0,
+        'retriever_calls': 0,
+        'retriever_hits': 0,
+    }
+
+
+def _token_usage(response):
+    """LLMResult에서 (prompt 토큰 수, completion 토큰 수)를 꺼냅니다. 모델이 알려주지 않으면 (0, 0)"""
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None)
+            if usage:
+                prompt_tokens += usage.get('input_tokens', 0)
+                completion_tokens += usage.get('output_tokens', 0)
+    if not prompt_tokens and not completion_tokens:
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        prompt_tokens = usage.get('prompt_tokens', 0)
+        completion_tokens = usage.get('completion_tokens', 0)
+    return prompt_tokens, completion_tokens
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class StageCallbackHandler(BaseCallbackHandler):
+    """
+    체인/그래프 실행 중에 단계(stage)별 실행 시간, 첫 토큰까지의 시간, 토큰 수, 검색 문서 수를 모으는 callback.
+
+    단계로 기록하는 run:
+    - stages에 들어 있는 이름으로 실행된 체인/retriever (with_config(run_name=...)으로 이름을 붙임)
+    - LangGraph 그래프의 최상위 node (metadata의 langgraph_node가 run 이름과 같은 run)
+
+    단계 안에서 실행된 LLM/retriever/tool 호출은 parent_run_id를 따라 가장 가까운 단계에 합산하고,
+    단계가 끝나면 Instrumentation.record로 한 건의 기록을 넘깁니다.
+    """
+
+    # 별도 스레드로 넘기지 않고 호출한 쪽에서 바로 실행 (dict 갱신뿐이라 짧음)
+    run_inline = True
+
+    def __init__(self, instrumentation, pipeline, stages=()):
+        self.instrumentation = instrumentation
+        self.pipeline = pipeline
+        self.stages = set(stages)
+        self._lock = threading.Lock()
+        # 단계 run_id -> 기록, 모든 run_id -> 그 run이 속한 단계의 run_id
+        self._records = {}
+        self._owners = {}
+        # 다른 retriever 안에서 호출된 retriever(예: HybridRetriever의 vector 검색)는 검색 문서 수에서 제외
+        self._retrievers = set()
+        self._nested_retrievers = set()
+
+    def _is_stage(self, name, metadata):
+        if name in self.stages:
+            return True
+        if not name or not metadata or metadata.get('langgraph_node') != name or name.startswith('__'):
+            return False
+        # subgraph(예: create_react_agent) 안쪽 node는 checkpoint_ns에 '|'가 들어 있으므로 제외
+        return '|' not in metadata.get('langgraph_checkpoint_ns', '')
+
+    def _start(self, run_id, parent_run_id, name=None, metadata=None):
+        with self._lock:
+            owner = self._owners.get(parent_run_id)
+            if self._is_stage(name, metadata):
+                # node 함수가 node와 같은 이름의 Runnable이면 같은 단계를 두 번 세지 않음
+                if owner is None or self._records[owner]['stage'] != name:
+                    self._records[run_id] = _new_record(self.pipeline, name)
+                    owner = run_id
+            if owner is not None:
+                self._owners[run_id] = owner
+
+    def _stage_of(self, run_id):
+        owner = self._owners.get(run_id)
+        return self._records.get(owner) if owner is not None else None
+
+    def _end(self, run_id, error=None):
+        with self._lock:
+            self._owners.pop(run_id, None)
+            record = self._records.pop(run_id, None)
+        if record is None:
+            return
+        finished = time.perf_counter()
+        started = record.pop('started')
+        first_token = record.pop('first_token')
+        record['wall_seconds'] = finished - started
+        record['ttft_seconds'] = first_token - started if first_token is not None else None
+        record['error'] = type(error).__name__ if error is not None else None
+        self.instrumentation.record(record)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = kwargs.get('name') or (serialized or {}).get('name')
+        self._start(run_id, parent_run_id, name, metadata)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            record = self._stage_of(run_id)
+            if record is not None and record['first_token'] is None:
+                record['first_token'] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens, completion_tokens = _token_usage(response)
+        with self._lock:
+            record = self._stage_of(run_id)
+            if record is not None:
+                record['llm_calls'] += 1
+                record['prompt_tokens'] += prompt_tokens
+                record['completion_tokens'] += completion_tokens
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = kwargs.get('name') or (serialized or {}).get('name')
+        with self._lock:
+            self._retrievers.add(run_id)
+            if parent_run_id in self._retrievers:
+                self._nested_retrievers.add(run_id)
+        self._start(run_id, parent_run_id, name, metadata)
+
+    def _retriever_done(self, run_id):
+        with self._lock:
+            self._retrievers.discard(run_id)
+            if run_id in self._nested_retrievers:
+                self._nested_retrievers.discard(run_id)
+                return True
+        return False
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        if not self._retriever_done(run_id):
+            with self._lock:
+                record = self._stage_of(run_id)
+                if record is not None:
+                    record['retriever_calls'] += 1
+                    record['retriever_hits'] += len(documents)
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._retriever_done(run_id)
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+
+class Instrumentation:
+    """
+    단계별 기록을 모아 JSON lines 파일과 Prometheus text format으로 내보냅니다.
+
+    - handler(pipeline, stages): 체인/그래프의 config callbacks에 넣을 StageCallbackHandler
+    - instrument(runnable, pipeline, stage): runnable에 단계 이름과 handler를 붙임
+    - stage(pipeline, stage): Runnable이 아닌 코드(번역, vector store 직접 검색 등)를 단계로 기록하는 context manager
+    - prometheus_text(): /metrics 응답 본문
+
+    꺼져 있을 때는 get_instrumentation()이 None을 반환하고, 체인에 callback을 붙이지 않으므로
+    실행 경로에 추가되는 비용이 없습니다.
+    """
+
+    def __init__(self, jsonl_path=None, buckets=DEFAULT_BUCKETS, max_records=1000):
+        self.buckets = tuple(buckets)
+        self.records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._handlers = {}
+        self._file = open(jsonl_path, 'a', encoding='utf-8') if jsonl_path else None
+
+    def handler(self, pipeline, stages=()):
+        # pipeline마다 handler 하나를 공유하고, 새로 붙는 단계 이름만 추가
+        with self._lock:
+            handler = self._handlers.get(pipeline)
+            if handler is None:
+                handler = self._handlers[pipeline] = StageCallbackHandler(self, pipeline)
+            handler.stages.update(stages)
+        return handler
+
+    def callbacks(self, pipeline, stages=()):
+        return [self.handler(pipeline, stages)]
+
+    def instrument(self, runnable, pipeline, stage):
+        """
+        runnable을 stage라는 이름의 단계로 기록합니다.
+
+        Args:
+            runnable: 체인, retriever 등 Runnable
+            pipeline (str): 기록에 붙일 파이프라인 이름 (예: 'llm_rag')
+            stage (str): 단계 이름 (run_name으로도 사용)
+
+        Returns:
+            Runnable: run_name과 callback이 붙은 runnable
+        """
+        return runnable.with_config(run_name=stage, callbacks=self.callbacks(pipeline, [stage]))
+
+    @contextmanager
+    def stage(self, pipeline, stage):
+        record = _new_record(pipeline, stage)
+        error = None
+        try:
+            yield record
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            started = record.pop('started')
+            record.pop('first_token')
+            record['wall_seconds'] = time.perf_counter() - started
+            record['ttft_seconds'] = None
+            record['error'] = type(error).__name__ if error is not None else None
+            self.record(record)
+
+    def record(self, record):
+        record['timestamp'] = time.time()
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self.records.append(record)
+            key = (record['pipeline'], record['stage'])
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {
+                    'count': 0, 'wall_sum': 0.0, 'buckets': [0] * len(self.buckets),
+                    'ttft_count': 0, 'ttft_sum': 0.0, 'errors': 0, **{name: 0 for name in _COUNTERS},
+                }
+            stats['count'] += 1
+            stats['wall_sum'] += record['wall_seconds']
+            for i, bound in enumerate(self.buckets):
+                if record['wall_seconds'] <= bound:
+                    stats['buckets'][i] += 1
+            if record['ttft_seconds'] is not None:
+                stats['ttft_count'] += 1
+                stats['ttft_sum'] += record['ttft_seconds']
+            if record['error']:
+                stats['errors'] += 1
+            for name in _COUNTERS:
+                stats[name] += record[name]
+            if self._file is not None:
+                self._file.write(line + '\n')
+                self._file.flush()
+
+    def report(self):
+        """(pipeline, stage)별 실행 횟수, 평균 실행 시간/첫 토큰 시간, 누적 토큰 수와 검색 문서 수를 반환합니다."""
+        with self._lock:
+            items = [(key, dict(stats)) for key, stats in self._stats.items()]
+        report = {}
+        for (pipeline, stage), stats in items:
+            report.setdefault(pipeline, {})[stage] = {
+                'count': stats['count'],
+                'avg_wall_seconds': stats['wall_sum'] / stats['count'],
+                'avg_ttft_seconds': stats['ttft_sum'] / stats['ttft_count'] if stats['ttft_count'] else None,
+                'errors': stats['errors'],
+                **{name: stats[name] for name in _COUNTERS},
+            }
+        return report
+
+    def prometheus_text(self):
+        """지금까지의 기록을 Prometheus text format(0.0.4)으로 반환합니다."""
+        with self._lock:
+            items = sorted((key, dict(stats, buckets=list(stats['buckets']))) for key, stats in self._stats.items())
+
+        lines = [
+            '# HELP llm_stage_duration_seconds Wall time of each pipeline stage.',
+            '# TYPE llm_stage_duration_seconds histogram',
+        ]
+        for (pipeline, stage), stats in items:
+            labels = f'pipeline="{_label(pipeline)}",stage="{_label(stage)}"'
+            for bound, count in zip(self.buckets, stats['buckets']):
+                lines.append(f'llm_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'llm_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {stats["count"]}')
+            lines.append(f'llm_stage_duration_seconds_sum{{{labels}}} {stats["wall_sum"]}')
+            lines.append(f'llm_stage_duration_seconds_count{{{labels}}} {stats["count"]}')
+
+        lines += [
+            '# HELP llm_stage_time_to_first_token_seconds Time from stage start to the first streamed token.',
+            '# TYPE llm_stage_time_to_first_token_seconds summary',
+        ]
+        for (pipeline, stage), stats in items:
+            if stats['ttft_count']:
+                labels = f'pipeline="{_label(pipeline)}",stage="{_label(stage)}"'
+                lines.append(f'llm_stage_time_to_first_token_seconds_sum{{{labels}}} {stats["ttft_sum"]}')
+                lines.append(f'llm_stage_time_to_first_token_seconds_count{{{labels}}} {stats["ttft_count"]}')
+
+        lines += [
+            '# HELP llm_stage_tokens_total LLM tokens used by each pipeline stage.',
+            '# TYPE llm_stage_tokens_total counter',
+        ]
+        for (pipeline, stage), stats in items:
+            labels = f'pipeline="{_label(pipeline)}",stage="{_label(stage)}"'
+            lines.append(f'llm_stage_tokens_total{{{labels},type="prompt"}} {stats["prompt_tokens"]}')
+            lines.append(f'llm_stage_tokens_total{{{labels},type="completion"}} {stats["completion_tokens"]}')
+
+        for name, key, help_text in (
+            ('llm_stage_llm_calls_total', 'llm_calls', 'LLM calls made by each pipeline stage.'),
+            ('llm_stage_retriever_calls_total', 'retriever_calls', 'Retriever calls made by each pipeline stage.'),
+            ('llm_stage_retriever_hits_total', 'retriever_hits', 'Documents returned to each pipeline stage.'),
+            ('llm_stage_errors_total', 'errors', 'Pipeline stages that raised an exception.'),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for (pipeline, stage), stats in items:
+                lines.append(f'{name}{{pipeline="{_label(pipeline)}",stage="{_label(stage)}"}} {stats[key]}')
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_instrumentation():
+    """config.instrumentation_enabled가 True이면 프로세스 공용 Instrumentation을, 아니면 None을 반환합니다."""
+    global _default
+    from config import instrumentation_enabled, instrumentation_jsonl_path
+
+    if not instrumentation_enabled:
+        return None
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = Instrumentation(instrumentation_jsonl_path)
+    return _default
+
+
+def instrument(runnable, pipeline, stage):
+    """계측이 꺼져 있으면 runnable을 그대로 반환합니다."""
+    instrumentation = get_instrumentation()
+    if instrumentation is None:
+        return runnable
+    return instrumentation.instrument(runnable, pipeline, stage)
+
+
+def get_callbacks(pipeline):
+    """그래프 config에 넣을 callback 목록. 계측이 꺼져 있으면 빈 목록"""
+    instrumentation = get_instrumentation()
+    if instrumentation is None:
+        return []
+    return instrumentation.callbacks(pipeline)
+
+
+def measure(pipeline, stage):
+    """
+    Runnable이 아닌 코드 블록을 단계로 기록하는 context manager. 꺼져 있으면 아무것도 기록하지 않습니다.
+    with 블록 안에서 yield된 dict에 retriever_hits 등을 채우면 함께 기록됩니다.
+    """
+    instrumentation = get_instrumentation()
+    if instrumentation is None:
+        return nullcontext({})
+    return instrumentation.stage(pipeline, stage)
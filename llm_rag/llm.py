@@ -1,3 +1,10 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, FewShotChatMessagePromptTemplate, PromptTemplate
 
@@ -6,73 +13,174 @@ from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, FewS
 
 from langchain_openai import OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
-from langchain_openai import ChatOpenAI
 from langchain.chains import create_history_aware_retriever
 from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_core.runnables.history import RunnableWithMessageHistory
 
 from config import answer_examples
+from config import answer_cache_path, answer_cache_threshold, answer_cache_ttl_seconds, answer_cache_max_entries
+from config import embedding_cache_dir, dictionary_path
+from config import pipeline_mode, speculative_similarity_threshold
+from config import hybrid_retrieval, documents_pattern, lexical_fast_path, lexical_min_score, lexical_margin
+from config import context_max_tokens, context_mmr_lambda, context_near_duplicate_threshold
+from config import history_backend, history_store_path, history_max_sessions, history_idle_seconds
+from config import history_max_tokens, history_max_messages
+from answer_cache import SemanticAnswerCache, stream_cached_answer
+from context_packer import ContextPacker
+from embedding_cache import CachedEmbeddings
+from hybrid_retriever import BM25Index, HybridRetriever, load_documents
+from history_store import InMemoryHistoryStore, SQLiteHistoryStore
+from instrumentation import instrument
+from model_router import get_model_router
+from query_rewriter import QueryRewriter, load_dictionary_lines, parse_dictionary
+from speculative import SpeculativeRagPipeline
+
+INDEX_NAME = 'spring-index'
+
+# 사용자의 질문을 수정(혹은 보정)할 때 참고할 수 있는 '사전' 데이터.
+# 예: "언어"라는 표현이 들어오면 "자바"를 의미한다고 해석할 수 있게끔 사전을 두는 식의 예시
+# 사전은 dictionary.txt에서 읽어오며, 로컬 rewriter와 LLM fallback 프롬프트가 함께 사용
+DICTIONARY = load_dictionary_lines(dictionary_path)
+
+CONTEXTUALIZE_Q_SYSTEM_PROMPT = """Given a chat history and the latest user question \
+    which might reference context in the chat history, formulate a standalone question \
+    which can be understood without the chat history. Do NOT answer the question, \
+    just reformulate it if needed and otherwise return it as is."""
+
+QA_SYSTEM_PROMPT = """
+    You are an expert Spring Framework backend developer. \
+    Please refer to the provided documentation to answer the question. \
+    If you do not know the answer, simply say you do not know. \
+    Provide a concise, key-point answer in no more than three sentences. \
+
+    {context}
+"""
+
+# 프로세스 단위로 한 번만 만들어 재사용하는 체인/클라이언트 저장소
+# 체인을 만드는 도중 get_llm이 다시 레지스트리를 사용하므로 RLock을 사용
+_chain_registry = {}
+_registry_lock = threading.RLock()
+
+# 요청마다 체인 준비(setup)에 걸린 시간(초)을 기록
+_setup_timings = deque(maxlen=1000)
+_warm_up_seconds = None
+
+def _build_history_store():
+    if history_backend == 'memory':
+        return InMemoryHistoryStore(
+            max_sessions=history_max_sessions,
+            max_tokens=history_max_tokens,
+            max_messages=history_max_messages,
+        )
+    return SQLiteHistoryStore(
+        history_store_path,
+        max_sessions=history_max_sessions,
+        idle_seconds=history_idle_seconds,
+        max_tokens=history_max_tokens,
+        max_messages=history_max_messages,
+    )
+
+
+def get_history_store():
+    return _get_or_create('history_store', _build_history_store)
 
-store = {}
 
 def get_session_history(session_id: str) -> BaseChatMessageHistory:
-    if session_id not in store:
-        store[session_id] = ChatMessageHistory()
-    return store[session_id]
+    # 세션별 대화 기록. 프롬프트에는 history_max_tokens 이내의 최근 기록만 들어간다.
+    return get_history_store().get_session_history(session_id)
 
 
 
-def get_retriever():
+def get_embedding():
     # OpenAIEmbeddings: OpenAI Embedding 모델 "text-embedding-3-large"로 텍스트를 벡터화
-    embedding = OpenAIEmbeddings(model="text-embedding-3-large")
-    index_name = 'spring-index'
+    # retriever와 답변 캐시가 같은 임베딩 클라이언트를 공유하고, 계산된 벡터는 디스크 캐시에서 재사용
+    return _get_or_create('embedding', lambda: CachedEmbeddings(
+        OpenAIEmbeddings(model="text-embedding-3-large"), embedding_cache_dir
+    ))
+
+
+def get_retriever():
+    embedding = get_embedding()
     #Pinecone에 이미 만들어진 인덱스('spring-index')를 불러옵니다. 이 인덱스에는 스프링 관련 문서(문서의 벡터)가 저장되어 있다고 가정
-    database = PineconeVectorStore.from_existing_index(index_name=index_name, embedding=embedding)
+    database = PineconeVectorStore.from_existing_index(index_name=INDEX_NAME, embedding=embedding)
     # PineconeVectorStore로부터 문서를 가져올 수 있는 Retriever 객체
     retriever = database.as_retriever()  # VectorStore에서 retriever 생성
-    return retriever
+    if hybrid_retrieval:
+        # ingest.py가 넣은 것과 같은 chunk의 로컬 BM25 결과와 합치고,
+        # fast path를 켜 두었으면 키워드 검색이 확실할 때 임베딩 호출 없이 바로 반환
+        retriever = HybridRetriever(
+            index=get_bm25_index(),
+            vector_retriever=retriever,
+            lexical_fast_path=lexical_fast_path,
+            lexical_min_score=lexical_min_score,
+            lexical_margin=lexical_margin,
+        )
+    return _instrument(retriever, 'retrieve')
 
 
-def get_history_retriever():
-    llm = get_llm()
-    retriever = get_retriever()
+def get_bm25_index():
+    return _get_or_create('bm25_index', lambda: BM25Index(load_documents(documents_pattern)))
 
-    # langchain 내부적으로 효율성이 좋은 프롬포트를 모아 hub에 저장, 이후 그것을 가져와 사용
-    # prompt = hub.pull("rlm/rag-prompt")
 
-    contextualize_q_system_prompt = """Given a chat history and the latest user question \
-        which might reference context in the chat history, formulate a standalone question \
-        which can be understood without the chat history. Do NOT answer the question, \
-        just reformulate it if needed and otherwise return it as is."""
-    
-    contextualize_q_prompt = ChatPromptTemplate.from_messages(
+def get_contextualize_q_prompt():
+    return ChatPromptTemplate.from_messages(
         [
-            ("system", contextualize_q_system_prompt),
+            ("system", CONTEXTUALIZE_Q_SYSTEM_PROMPT),
             MessagesPlaceholder("chat_history"),
             ("human", "{input}"),
         ]
     )
 
+
+def get_history_retriever():
+    llm = get_llm('contextualize')
+    retriever = _get_or_create('retriever', get_retriever)
+
+    # langchain 내부적으로 효율성이 좋은 프롬포트를 모아 hub에 저장, 이후 그것을 가져와 사용
+    # prompt = hub.pull("rlm/rag-prompt")
+
+    contextualize_q_prompt = get_contextualize_q_prompt()
+
     history_aware_retriever = create_history_aware_retriever(
         llm, retriever, contextualize_q_prompt
     )
-    return history_aware_retriever
+    return _instrument(history_aware_retriever, 'history_retrieve')
 
 
-def get_llm(model='gpt-4o'):
-    llm = ChatOpenAI(model=model)
-    return llm
+def _get_or_create(name, factory):
+    # 이미 만들어진 객체가 있으면 lock 없이 바로 반환하고,
+    # 없을 때만 lock을 잡고 한 번 더 확인한 뒤 생성 (double-checked locking)
+    component = _chain_registry.get(name)
+    if component is not None:
+        return component
+    with _registry_lock:
+        component = _chain_registry.get(name)
+        if component is None:
+            component = factory()
+            _chain_registry[name] = component
+    return component
 
 
-def get_dictionary_chain():
-    llm = get_llm()
+def _instrument(runnable, stage):
+    # config.instrumentation_enabled가 꺼져 있으면 runnable을 그대로 반환 (callback이 붙지 않음)
+    return instrument(runnable, 'llm_rag', stage)
+
+
+def get_llm(role='answer'):
+    # 역할(role)별 모델은 model_routing.json에서 정함 (rewrite/contextualize는 small tier, answer는 large tier)
+    # ChatOpenAI는 내부에 HTTP connection pool을 가지고 있으므로
+    # 역할별로 하나만 만들어 공유하면 매 요청마다 새 연결을 맺지 않아도 된다.
+    return _get_or_create(f'llm:{role}', lambda: get_model_router().get(role))
+
+
+def get_dictionary_llm_chain():
+    # 사전 표현이 모호할 때만 사용하는 LLM rewrite 체인
+    llm = get_llm('rewrite')
 
-    # 사용자의 질문을 수정(혹은 보정)할 때 참고할 수 있는 '사전' 데이터.
-    # 예: "언어"라는 표현이 들어오면 "자바"를 의미한다고 해석할 수 있게끔 사전을 두는 식의 예시
-    dictionary = ["언어를 나타내는 표현 -> 자바"]
     prompt = ChatPromptTemplate.from_template(
     f"""
     사용자의 질문을 보고, 우리의 사전을 참고해서 사용자의 질문을 변경해주세요.
@@ -80,7 +188,7 @@ def get_dictionary_chain():
 
     당신의 답변은 Korean(한글)으로 말해주세요.
 
-    사전: {dictionary}
+    사전: {DICTIONARY}
 
     질문: {{question}}
     """)
@@ -98,20 +206,24 @@ def get_dictionary_chain():
         3. 검색된 문서를 바탕으로 GPT-4가 최종 답변
     """
     chain = prompt | llm | StrOutputParser()
-    return chain
+    return _instrument(chain, 'rewrite_llm')
 
 
-def get_rag_chain():
-    llm = get_llm()
+def get_query_rewriter():
+    # 대부분의 질문은 사전을 로컬에서 적용해 LLM 호출 없이 바로 바꾸고,
+    # 모호한 표현이 있을 때만 get_dictionary_llm_chain으로 넘긴다.
+    return _get_or_create('query_rewriter', lambda: QueryRewriter(
+        parse_dictionary(DICTIONARY),
+        fallback=RunnableLambda(lambda question: {"question": question}) | get_dictionary_llm_chain(),
+    ))
 
-    # 사용자의 질의에 맞춰 retriever를 통해 문서를 찾아보고, 그 문서를 참고해 LLM(GPT-4)을 사용하여 답변을 생성
-    # qa_chain = RetrievalQA.from_chain_type(
-    #     llm=llm,
-    #     retriever=retriever,
-    #     chain_type_kwargs={"prompt": prompt}  # 필요한 경우 추가 인자 설정
-    # )
-    # return qa_chain
-    
+
+def get_dictionary_chain():
+    # {"question": ...}을 받아 바뀐 질문 문자열을 반환 (rewrite 시간 통계는 get_query_rewriter().stats())
+    return _instrument(get_query_rewriter().as_runnable(), 'rewrite')
+
+
+def get_qa_prompt():
     example_prompt = ChatPromptTemplate.from_messages(
         [
             ("human", "{input}"),
@@ -125,26 +237,44 @@ def get_rag_chain():
         examples=answer_examples,
     )
 
-    qa_system_prompt = """
-        You are an expert Spring Framework backend developer. \
-        Please refer to the provided documentation to answer the question. \
-        If you do not know the answer, simply say you do not know. \
-        Provide a concise, key-point answer in no more than three sentences. \
-
-        {context}
-    """
-
     qa_prompt = ChatPromptTemplate.from_messages(
         [
-            ("system", qa_system_prompt),
+            ("system", QA_SYSTEM_PROMPT),
             few_shot_prompt,
             MessagesPlaceholder("chat_history"),
             ("human", "{input}"),
         ]
     )
+    return qa_prompt
+
+
+def get_context_packer():
+    return _get_or_create('context_packer', lambda: ContextPacker(
+        max_tokens=context_max_tokens,
+        mmr_lambda=context_mmr_lambda,
+        near_duplicate_threshold=context_near_duplicate_threshold,
+    ))
+
+
+def get_question_answer_chain():
+    # 검색된 문서(context)를 토큰 예산에 맞게 정리한 뒤, 대화 기록과 함께 받아 답변을 생성하는 체인
+    # 요청마다 줄어든 토큰 수는 get_context_packer().report()로 확인
+    return _instrument(
+        get_context_packer().as_runnable() | create_stuff_documents_chain(get_llm('answer'), get_qa_prompt()), 'answer'
+    )
+
+
+def get_rag_chain():
+    # 사용자의 질의에 맞춰 retriever를 통해 문서를 찾아보고, 그 문서를 참고해 LLM(GPT-4)을 사용하여 답변을 생성
+    # qa_chain = RetrievalQA.from_chain_type(
+    #     llm=llm,
+    #     retriever=retriever,
+    #     chain_type_kwargs={"prompt": prompt}  # 필요한 경우 추가 인자 설정
+    # )
+    # return qa_chain
 
     history_aware_retriever = get_history_retriever()
-    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
+    question_answer_chain = get_question_answer_chain()
     rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
 
     conversational_rag_chain = RunnableWithMessageHistory(
@@ -156,21 +286,203 @@ def get_rag_chain():
     ).pick("answer")
     # 이때 answer와 같은 결과는 변수명을 맞춰주어야함. ex) result, output, answer 등
 
-    return conversational_rag_chain
+    return _instrument(conversational_rag_chain, 'rag')
 
 
-def get_ai_response(user_message):
+def _build_spring_chain():
     dictionary_chain = get_dictionary_chain()
     rag_chain = get_rag_chain()
+    return _instrument({"input": dictionary_chain} | rag_chain, 'spring_chain')
+
+
+def get_spring_chain():
+    # 사전 체인 + RAG 체인을 합친 최종 체인을 프로세스당 한 번만 생성
+    return _get_or_create('spring_chain', _build_spring_chain)
 
-    spring_chain = {"input": dictionary_chain} | rag_chain
-    ai_response = spring_chain.stream(
-        {
-            "question": user_message
-        },
-        config={
-            "configurable": {"session_id": "abc123"}
-        },
+
+def _build_batch_chain():
+    # 사전 rewrite → 검색 → 답변 순서는 spring_chain과 같지만, 질문마다 독립적으로 답하므로 대화 기록을 사용하지 않음
+    # (수천 개의 질문을 처리해도 대화 기록 저장소에 세션이 쌓이지 않음)
+    retriever = _get_or_create('retriever', get_retriever)
+    return _instrument(
+        RunnablePassthrough.assign(input=get_dictionary_chain())
+        | RunnablePassthrough.assign(context=RunnableLambda(lambda inputs: inputs['input']) | retriever,
+                                     chat_history=lambda inputs: [])
+        | RunnablePassthrough.assign(answer=get_question_answer_chain()),
+        'batch_chain',
     )
-    return ai_response
 
+
+def get_batch_chain():
+    """
+    {"question": ...}을 받아 {"question", "input"(바뀐 질문), "context"(검색 문서), "answer"}를 반환하는 체인.
+    batch_qa.py가 abatch로 여러 질문을 동시에 실행할 때 사용합니다.
+    """
+    return _get_or_create('batch_chain', _build_batch_chain)
+
+
+def _build_speculative_pipeline():
+    return SpeculativeRagPipeline(
+        rewriter=get_query_rewriter(),
+        retriever=_get_or_create('retriever', get_retriever),
+        contextualize_chain=_instrument(
+            get_contextualize_q_prompt() | get_llm('contextualize') | StrOutputParser(), 'contextualize'
+        ),
+        question_answer_chain=get_question_answer_chain(),
+        get_session_history=get_session_history,
+        similarity_threshold=speculative_similarity_threshold,
+    )
+
+
+def get_speculative_pipeline():
+    # 단계별 시간은 get_speculative_pipeline().report()로 확인
+    return _get_or_create('speculative_pipeline', _build_speculative_pipeline)
+
+
+def warm_up(ping=False):
+    """
+    서버 시작 시 체인과 클라이언트를 미리 만들어 첫 요청의 지연을 없앱니다.
+
+    Args:
+        ping (bool): True이면 임베딩 API를 한 번 호출해 HTTP 연결까지 미리 맺어둡니다.
+
+    Returns:
+        float: 워밍업에 걸린 시간(초)
+    """
+    global _warm_up_seconds
+    started = time.perf_counter()
+    if pipeline_mode == 'speculative':
+        get_speculative_pipeline()
+    else:
+        get_spring_chain()
+    if ping:
+        get_embedding().embed_query("warm-up")
+    _warm_up_seconds = time.perf_counter() - started
+    return _warm_up_seconds
+
+
+def get_setup_report():
+    """첫 요청과 이후 요청에서 체인 준비에 걸린 시간을 비교한 결과를 반환합니다."""
+    timings = list(_setup_timings)
+    later = timings[1:]
+    return {
+        'warm_up_seconds': _warm_up_seconds,
+        'first_request_setup_seconds': timings[0] if timings else None,
+        'later_request_setup_seconds_avg': sum(later) / len(later) if later else None,
+        'requests': len(timings),
+    }
+
+
+def get_cache_fingerprint():
+    # 인덱스 이름이나 프롬프트(사전, few-shot 예제 포함)가 바뀌면 fingerprint가 달라져 캐시가 무효화된다.
+    source = json.dumps(
+        [INDEX_NAME, DICTIONARY, CONTEXTUALIZE_Q_SYSTEM_PROMPT, QA_SYSTEM_PROMPT, answer_examples,
+         context_max_tokens, context_mmr_lambda, context_near_duplicate_threshold],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def get_answer_cache():
+    return _get_or_create('answer_cache', lambda: SemanticAnswerCache(
+        path=answer_cache_path,
+        embedding=get_embedding(),
+        fingerprint=get_cache_fingerprint(),
+        threshold=answer_cache_threshold,
+        ttl_seconds=answer_cache_ttl_seconds,
+        max_entries=answer_cache_max_entries,
+    ))
+
+
+def prefetch_documents(segment):
+    """
+    음성 입력의 인식이 끝난 일부(segment)로 rewrite/retrieval을 미리 시작합니다 (speech.py).
+    speculative 모드에서만 동작하며, 반환된 Future 목록을 get_ai_response(prefetched=...)로 넘깁니다.
+
+    Returns:
+        Future | None: 검색된 문서 목록 (chain 모드이면 None)
+    """
+    if pipeline_mode != 'speculative':
+        return None
+    return get_speculative_pipeline().prefetch(segment)
+
+
+def _use_answer_cache(session_id):
+    # 캐시 key는 질문 임베딩뿐이므로, 이전 대화 맥락에 기대는 후속 질문("그럼 그건 어떻게 설정해?")은
+    # 다른 대화(다른 사용자)의 답변이 재사용되지 않도록 대화 기록이 없는 세션에서만 캐시를 조회/저장
+    return not get_session_history(session_id).messages
+
+
+def get_ai_response(user_message, session_id, prefetched=None):
+    answer_cache = get_answer_cache() if _use_answer_cache(session_id) else None
+    cached_answer, question_vector = answer_cache.lookup(user_message) if answer_cache else (None, None)
+    if cached_answer is not None:
+        # 캐시에서 답변했더라도 이후 질문이 맥락을 이어갈 수 있도록 대화 기록에는 남긴다.
+        history = get_session_history(session_id)
+        history.add_messages([HumanMessage(user_message), AIMessage(cached_answer)])
+        yield from stream_cached_answer(cached_answer)
+        return
+
+    started = time.perf_counter()
+    if pipeline_mode == 'speculative':
+        pipeline = get_speculative_pipeline()
+        _setup_timings.append(time.perf_counter() - started)
+        ai_response = pipeline.stream(user_message, session_id,
+                                      prefetched=[future for future in prefetched or () if future is not None])
+    else:
+        spring_chain = get_spring_chain()
+        _setup_timings.append(time.perf_counter() - started)
+        ai_response = spring_chain.stream(
+            {
+                "question": user_message
+            },
+            config={
+                "configurable": {"session_id": session_id}
+            },
+        )
+    chunks = []
+    for chunk in ai_response:
+        chunks.append(chunk)
+        yield chunk
+    if chunks and answer_cache is not None:
+        answer_cache.put(user_message, ''.join(chunks), question_vector)
+
+
+async def aget_ai_response(user_message, session_id):
+    """
+    get_ai_response의 asyncio 버전. 답변 토큰을 async generator로 흘려보냅니다.
+    임베딩/SQLite처럼 동기 방식인 캐시 접근은 별도 스레드에서 실행해 event loop를 막지 않습니다.
+    """
+    answer_cache = get_answer_cache() if await asyncio.to_thread(_use_answer_cache, session_id) else None
+    cached_answer, question_vector = (
+        await asyncio.to_thread(answer_cache.lookup, user_message) if answer_cache else (None, None)
+    )
+    if cached_answer is not None:
+        history = await asyncio.to_thread(get_session_history, session_id)
+        await asyncio.to_thread(history.add_messages, [HumanMessage(user_message), AIMessage(cached_answer)])
+        for token in stream_cached_answer(cached_answer):
+            yield token
+        return
+
+    started = time.perf_counter()
+    if pipeline_mode == 'speculative':
+        pipeline = get_speculative_pipeline()
+        _setup_timings.append(time.perf_counter() - started)
+        ai_response = pipeline.astream(user_message, session_id)
+    else:
+        spring_chain = get_spring_chain()
+        _setup_timings.append(time.perf_counter() - started)
+        ai_response = spring_chain.astream(
+            {
+                "question": user_message
+            },
+            config={
+                "configurable": {"session_id": session_id}
+            },
+        )
+    chunks = []
+    async for chunk in ai_response:
+        chunks.append(chunk)
+        yield chunk
+    if chunks and answer_cache is not None:
+        await asyncio.to_thread(answer_cache.put, user_message, ''.join(chunks), question_vector)
@@ -0,0 +1,242 @@
+import json
+import threading
+import time
+from typing import Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.fallbacks import RunnableWithFallbacks
+
+# 모델 생성 시 넘기지 않고 router가 사용하는 설정
+_ROUTING_KEYS = ('tier', 'models', 'timeout', 'max_retries', 'latency_threshold')
+
+
+def create_openai_chat(model, **kwargs):
+    from langchain_openai import ChatOpenAI
+
+    # stream_usage: 스트리밍 답변에서도 실제 토큰 수를 받음 (instrumentation.py)
+    return ChatOpenAI(model=model, stream_usage=True, **kwargs)
+
+
+class ModelHealth(BaseCallbackHandler):
+    """
+    (role, model)별 최근 응답 시간과 오류를 기록하는 callback.
+
+    - 오류가 나거나 응답 시간이 role의 latency_threshold를 넘으면 cooldown_seconds 동안 '느림'으로 표시
+    - 응답 시간은 스트리밍이면 첫 토큰까지, 아니면 응답 전체까지의 시간
+    - cooldown이 지나면 다시 원래 순서로 시도 (그 사이 정상 응답이 오면 바로 해제)
+    """
+
+    run_inline = True
+
+    def __init__(self, cooldown_seconds=60.0, clock=time.monotonic):
+        self.cooldown_seconds = cooldown_seconds
+        self.clock = clock
+        self.thresholds = {}
+        self._lock = threading.Lock()
+        self._runs = {}
+        self._stats = {}
+
+    def _key(self, metadata):
+        metadata = metadata or {}
+        return metadata.get('model_role'), metadata.get('routed_model')
+
+    def _stat(self, key):
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = {
+                'calls': 0, 'errors': 0, 'slow': 0, 'latency_sum': 0.0, 'last_latency': None, 'unhealthy_until': 0.0,
+            }
+        return stats
+
+    def is_healthy(self, role, model):
+        with self._lock:
+            stats = self._stats.get((role, model))
+            return stats is None or stats['unhealthy_until'] <= self.clock()
+
+    def _finish(self, run_id, error=None):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+            if run is None:
+                return
+            key, started, latency = run
+            now = self.clock()
+            stats = self._stat(key)
+            stats['calls'] += 1
+            if error is not None:
+                stats['errors'] += 1
+                stats['unhealthy_until'] = now + self.cooldown_seconds
+                return
+            latency = latency if latency is not None else now - started
+            stats['latency_sum'] += latency
+            stats['last_latency'] = latency
+            threshold = self.thresholds.get(key[0])
+            if threshold is not None and latency > threshold:
+                stats['slow'] += 1
+                stats['unhealthy_until'] = now + self.cooldown_seconds
+            else:
+                stats['unhealthy_until'] = 0.0
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        key = self._key(metadata)
+        if key[0] is not None:
+            with self._lock:
+                self._runs[run_id] = (key, self.clock(), None)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is not None and run[2] is None:
+                self._runs[run_id] = (run[0], run[1], self.clock() - run[1])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, error)
+
+    def report(self):
+        with self._lock:
+            items = [(key, dict(stats)) for key, stats in self._stats.items()]
+        now = self.clock()
+        report = {}
+        for (role, model), stats in items:
+            succeeded = stats['calls'] - stats['errors']
+            report.setdefault(role, {})[model] = {
+                'calls': stats['calls'],
+                'errors': stats['errors'],
+                'slow': stats['slow'],
+                'avg_latency_seconds': stats['latency_sum'] / succeeded if succeeded else None,
+                'last_latency_seconds': stats['last_latency'],
+                'healthy': stats['unhealthy_until'] <= now,
+            }
+        return report
+
+
+class RoutedChatModel(RunnableWithFallbacks):
+    """
+    role에 정해진 모델 목록(첫 번째가 기본 모델)을 순서대로 시도하는 chat model.
+
+    RunnableWithFallbacks와 같이 오류(timeout 포함)가 나면 다음 모델로 넘어가고,
+    ModelHealth가 최근에 느리거나 오류가 난 모델을 뒤로 미뤄 다음 요청부터는 대체 모델을 먼저 사용합니다.
+    bind_tools/with_structured_output은 모든 후보 모델에 똑같이 적용됩니다.
+    """
+
+    role: str = ''
+    models: list = []
+    health: Any = None
+
+    @property
+    def runnables(self):
+        candidates = list(zip(self.models, [self.runnable, *self.fallbacks]))
+        if self.health is None:
+            return [runnable for _, runnable in candidates]
+        healthy = [runnable for model, runnable in candidates if self.health.is_healthy(self.role, model)]
+        delayed = [runnable for model, runnable in candidates if not self.health.is_healthy(self.role, model)]
+        return healthy + delayed
+
+
+class ModelRouter:
+    """
+    파이프라인의 역할(role)마다 모델 tier를 정하고, tier의 모델 목록으로 RoutedChatModel을 만듭니다.
+
+    설정 파일(model_routing.json) 형식:
+        tiers: tier 이름 -> {models: [기본 모델, 대체 모델...], timeout, max_retries, latency_threshold}
+        roles: role 이름 -> {tier, (선택) models/timeout/latency_threshold, 나머지는 모델 생성 인자(temperature 등)}
+
+    overrides로 role별 설정을 덮어쓸 수 있습니다. (예: {'answer': {'tier': 'small'}})
+    """
+
+    def __init__(self, tiers, roles, overrides=None, model_factory=create_openai_chat, cooldown_seconds=60.0):
+        self.tiers = tiers
+        self.roles = {role: dict(spec) for role, spec in roles.items()}
+        for role, spec in (overrides or {}).items():
+            self.roles.setdefault(role, {}).update(spec)
+        self.model_factory = model_factory
+        self.health = ModelHealth(cooldown_seconds)
+        self._lock = threading.Lock()
+        self._models = {}
+
+    @classmethod
+    def from_file(cls, path, overrides=None, **kwargs):
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(config['tiers'], config['roles'], overrides=overrides, **kwargs)
+
+    def resolve(self, role):
+        """
+        role의 tier 설정과 role별 설정을 합친 결과를 반환합니다.
+
+        Args:
+            role (str): 파이프라인 역할 (예: 'rewrite', 'answer')
+
+        Returns:
+            dict: tier, models, timeout, max_retries, latency_threshold와 모델 생성 인자(model_kwargs)
+        """
+        spec = self.roles.get(role)
+        if spec is None:
+            raise KeyError(f'unknown model role: {role}')
+        tier = self.tiers[spec['tier']]
+        resolved = {key: spec.get(key, tier.get(key)) for key in _ROUTING_KEYS}
+        resolved['tier'] = spec['tier']
+        resolved['model_kwargs'] = {key: value for key, value in spec.items() if key not in _ROUTING_KEYS}
+        return resolved
+
+    def _build(self, role):
+        spec = self.resolve(role)
+        self.health.thresholds[role] = spec['latency_threshold']
+        client_kwargs = {key: spec[key] for key in ('timeout', 'max_retries') if spec[key] is not None}
+        candidates = [
+            self.model_factory(
+                model,
+                **client_kwargs,
+                **spec['model_kwargs'],
+                callbacks=[self.health],
+                metadata={'model_role': role, 'model_tier': spec['tier'], 'routed_model': model},
+            )
+            for model in spec['models']
+        ]
+        return RoutedChatModel(
+            runnable=candidates[0], fallbacks=candidates[1:], role=role, models=list(spec['models']),
+            health=self.health,
+        )
+
+    def get(self, role):
+        """role에 맞는 chat model을 반환합니다. 같은 role은 프로세스당 한 번만 만들어 HTTP 연결을 공유합니다."""
+        model = self._models.get(role)
+        if model is not None:
+            return model
+        with self._lock:
+            model = self._models.get(role)
+            if model is None:
+                model = self._models[role] = self._build(role)
+        return model
+
+    def report(self):
+        """role별 tier/모델 목록과 모델별 호출 수, 오류 수, 평균 응답 시간을 반환합니다."""
+        health = self.health.report()
+        return {
+            role: {
+                'tier': self.resolve(role)['tier'],
+                'models': self.resolve(role)['models'],
+                'health': health.get(role, {}),
+            }
+            for role in self.roles
+        }
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_model_router():
+    """config.py의 model_routing_path와 model_role_overrides로 만든 프로세스 공용 ModelRouter를 반환합니다."""
+    global _default
+    from config import model_routing_path, model_role_overrides, model_cooldown_seconds
+
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = ModelRouter.from_file(
+                    model_routing_path, overrides=model_role_overrides, cooldown_seconds=model_cooldown_seconds,
+                )
+    return _default
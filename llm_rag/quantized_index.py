@@ -0,0 +1,325 @@
+"""
+text-embedding-3-large 벡터(3072차원 float32, chunk당 12KB)를 작게 줄인 로컬 vector 인덱스.
+
+- Matryoshka 방식으로 앞쪽 dim개 차원만 남기고 다시 정규화 (text-embedding-3 계열은 앞 차원일수록 정보가 많음)
+- 줄인 벡터를 int8(차원별 scale) 또는 binary(부호 1bit) 코드로 양자화해 np.memmap 파일로 저장
+- 검색은 코드로 후보(k * oversample개)를 빠르게 고른 뒤, 후보만 원래 float32 벡터로 다시 점수를 매김(rescoring)
+
+원래 벡터(full.f32.npy)도 memmap으로 열기 때문에 메모리에 올라오는 것은 코드 전체와 rescoring한 후보 행뿐입니다.
+
+인덱스 디렉터리 구성:
+    meta.json: 차원, 양자화 방식, int8 scale, 문서 수, 만든 Chroma 저장소(source)
+    documents.jsonl: 행 번호 순서의 (id, page_content, metadata)
+    codes.npy: 양자화 코드 (int8: 차원당 1byte, binary: 8차원당 1byte)
+    full.f32.npy: 원래 차원의 정규화된 float32 벡터
+
+기존 Chroma 저장소에서 만들기:
+    python quantized_index.py --persist-directory ../langgraph-lecture/spring_framework_docs \\
+        --collection spring_framework_docs --output ../langgraph-lecture/spring_framework_docs_quantized
+
+인덱스는 만든 시점의 Chroma 내용을 복사한 것이므로, ingest.py가 그 Chroma collection을 바꾸면
+(meta.json의 source가 같을 때) 같은 dim/양자화 방식으로 다시 만듭니다 (rebuild_if_source).
+새 인덱스는 옆의 임시 디렉터리에 다 만든 뒤 디렉터리를 바꿔치기하므로, 이미 인덱스를 memmap으로 연 프로세스는
+이전 파일을 그대로 읽고, 만드는 도중에 실패해도 기존 인덱스는 바뀌지 않습니다.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+QUANTIZATIONS = ('int8', 'binary')
+# binary 코드의 hamming 거리 계산용: 0~255의 1bit 개수
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def _replace_directory(source, directory):
+    # directory를 source로 바꿈. 이전 디렉터리는 이름을 바꿔 둔 뒤 지우므로(POSIX에서는 이미 memmap으로 연 파일을
+    # 지워도 연 쪽은 계속 읽을 수 있음) 읽는 쪽이 새 파일과 이전 파일이 섞인 인덱스를 보지 않음
+    backup = None
+    if os.path.exists(directory):
+        backup = tempfile.mkdtemp(dir=os.path.dirname(directory), prefix=f'.{os.path.basename(directory)}.old-')
+        os.replace(directory, os.path.join(backup, 'index'))
+    os.replace(source, directory)
+    if backup is not None:
+        shutil.rmtree(backup, ignore_errors=True)
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def truncate(vectors, dim):
+    """앞쪽 dim개 차원만 남기고 다시 정규화합니다 (Matryoshka)."""
+    return normalize(np.asarray(vectors, dtype=np.float32)[..., :dim])
+
+
+def quantize(vectors, quantization, scales=None):
+    """
+    정규화된 벡터를 양자화합니다.
+
+    Returns:
+        tuple: (코드 배열, int8 차원별 scale 또는 None)
+    """
+    if quantization == 'int8':
+        if scales is None:
+            scales = np.abs(vectors).max(axis=0) / 127
+            scales = np.where(scales == 0, 1, scales).astype(np.float32)
+        return np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8), scales
+    if quantization == 'binary':
+        return np.packbits(vectors > 0, axis=-1), None
+    raise ValueError(f'unsupported quantization: {quantization}')
+
+
+class QuantizedIndex:
+    """
+    양자화 코드로 후보를 고르고 원래 벡터로 다시 점수를 매기는 vector 인덱스.
+
+        index = QuantizedIndex.build(directory, ids, texts, metadatas, vectors, dim=1024)
+        index = QuantizedIndex.open(directory)
+        index.search(query_vector, k=3)
+    """
+
+    def __init__(self, directory, meta, documents, codes, full):
+        self.directory = directory
+        self.dim = meta['dim']
+        self.full_dim = meta['full_dim']
+        self.quantization = meta['quantization']
+        self.scales = np.asarray(meta['scales'], dtype=np.float32) if meta.get('scales') else None
+        self.documents = documents
+        self.codes = codes
+        self.full = full
+
+    @classmethod
+    def build(cls, directory, ids, texts, metadatas, vectors, dim=1024, quantization='int8', block_size=4096,
+              source=None):
+        """
+        벡터와 문서로 인덱스 파일을 만들고 연 인덱스를 반환합니다.
+
+        Args:
+            directory (str): 인덱스를 저장할 디렉터리
+            ids, texts, metadatas (list): 문서 id, 내용, metadata (vectors와 같은 순서)
+            vectors: (문서 수, 원래 차원) 임베딩 배열
+            dim (int): 남길 차원 수 (원래 차원보다 크면 원래 차원 사용)
+            quantization (str): 'int8' 또는 'binary'
+            block_size (int): 한 번에 변환할 행 수 (메모리 사용량 제한)
+            source (dict): 벡터를 가져온 Chroma 저장소 {'persist_directory', 'collection'} (meta.json에 기록)
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f'unsupported quantization: {quantization}')
+        vectors = np.asarray(vectors, dtype=np.float32)
+        count, full_dim = vectors.shape
+        dim = min(dim, full_dim)
+
+        # 같은 파일 시스템의 임시 디렉터리에 모두 쓴 뒤 directory와 바꿈 (_replace_directory)
+        directory = os.path.abspath(directory)
+        parent = os.path.dirname(directory)
+        os.makedirs(parent, exist_ok=True)
+        workdir = tempfile.mkdtemp(dir=parent, prefix=f'.{os.path.basename(directory)}.new-')
+        try:
+            cls._write(workdir, ids, texts, metadatas, vectors, dim, quantization, block_size, source)
+            _replace_directory(workdir, directory)
+        except BaseException:
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise
+        return cls.open(directory)
+
+    @staticmethod
+    def _write(directory, ids, texts, metadatas, vectors, dim, quantization, block_size, source):
+        count, full_dim = vectors.shape
+
+        full = np.lib.format.open_memmap(
+            os.path.join(directory, 'full.f32.npy'), mode='w+', dtype=np.float32, shape=(count, full_dim)
+        )
+        for start in range(0, count, block_size):
+            full[start:start + block_size] = normalize(vectors[start:start + block_size])
+        full.flush()
+
+        # int8 scale은 전체 벡터 기준으로 한 번만 계산 (block마다 다르면 점수를 비교할 수 없음)
+        scales = None
+        if quantization == 'int8':
+            scales = np.zeros(dim, dtype=np.float32)
+            for start in range(0, count, block_size):
+                block = truncate(full[start:start + block_size], dim)
+                scales = np.maximum(scales, np.abs(block).max(axis=0) / 127)
+            scales = np.where(scales == 0, 1, scales).astype(np.float32)
+
+        code_width = dim if quantization == 'int8' else (dim + 7) // 8
+        code_dtype = np.int8 if quantization == 'int8' else np.uint8
+        codes = np.lib.format.open_memmap(
+            os.path.join(directory, 'codes.npy'), mode='w+', dtype=code_dtype, shape=(count, code_width)
+        )
+        for start in range(0, count, block_size):
+            block = truncate(full[start:start + block_size], dim)
+            codes[start:start + block_size] = quantize(block, quantization, scales)[0]
+        codes.flush()
+        del full, codes
+
+        with open(os.path.join(directory, 'documents.jsonl'), 'w', encoding='utf-8') as f:
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                f.write(json.dumps({'id': doc_id, 'page_content': text, 'metadata': metadata or {}},
+                                   ensure_ascii=False) + '\n')
+        meta = {
+            'count': count,
+            'dim': dim,
+            'full_dim': full_dim,
+            'quantization': quantization,
+            'scales': scales.tolist() if scales is not None else None,
+            'source': source,
+        }
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def open(cls, directory):
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(os.path.join(directory, 'documents.jsonl'), encoding='utf-8') as f:
+            documents = [json.loads(line) for line in f]
+        codes = np.load(os.path.join(directory, 'codes.npy'), mmap_mode='r')
+        full = np.load(os.path.join(directory, 'full.f32.npy'), mmap_mode='r')
+        return cls(directory, meta, documents, codes, full)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def memory_bytes(self):
+        """검색할 때마다 전부 읽는 부분(코드 + scale)의 크기. 원래 벡터는 후보 행만 읽음"""
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def approximate_scores(self, query_vector, block_size=8192):
+        """양자화 코드로 계산한 근사 점수 (int8: 내적, binary: -hamming 거리)"""
+        query = truncate(query_vector, self.dim)
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        if self.quantization == 'int8':
+            # scale을 query 쪽에 곱해 두면 코드는 변환 없이 한 번의 행렬 곱으로 계산
+            weighted = query * self.scales
+            for start in range(0, len(self.codes), block_size):
+                scores[start:start + block_size] = self.codes[start:start + block_size] @ weighted
+        else:
+            query_bits = np.packbits(query > 0)
+            for start in range(0, len(self.codes), block_size):
+                block = np.bitwise_xor(self.codes[start:start + block_size], query_bits)
+                scores[start:start + block_size] = -_POPCOUNT[block].sum(axis=1, dtype=np.int32)
+        return scores
+
+    def search(self, query_vector, k=4, oversample=10):
+        """
+        근사 점수로 k * oversample개의 후보를 고르고, 후보만 원래 벡터의 cosine 유사도로 다시 정렬합니다.
+
+        Returns:
+            list: (행 번호, cosine 유사도) 목록 (유사도 내림차순)
+        """
+        if not len(self):
+            return []
+        scores = self.approximate_scores(query_vector)
+        candidates = min(len(scores), max(k, k * oversample))
+        shortlist = np.argpartition(-scores, candidates - 1)[:candidates]
+        # memmap에서 후보 행만 읽도록 행 번호를 정렬해서 접근
+        shortlist.sort()
+        exact = self.full[shortlist] @ normalize(query_vector)
+        order = np.argsort(-exact)[:k]
+        return [(int(shortlist[i]), float(exact[i])) for i in order]
+
+    def document(self, row, score=None):
+        record = self.documents[row]
+        metadata = dict(record['metadata'])
+        if score is not None:
+            metadata['score'] = score
+        return Document(id=record['id'], page_content=record['page_content'], metadata=metadata)
+
+
+class QuantizedRetriever(BaseRetriever):
+    """
+    QuantizedIndex로 검색하는 retriever. vector_store.as_retriever(search_kwargs={'k': 3}) 대신 사용합니다.
+    질문 임베딩은 embedding(CachedEmbeddings 등)으로 계산합니다.
+    """
+
+    index: Any
+    embedding: Any
+    k: int = 4
+    oversample: int = 10
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        query_vector = self.embedding.embed_query(query)
+        return [self.index.document(row, score) for row, score in self.index.search(query_vector, self.k, self.oversample)]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def open_index(directory):
+    """같은 디렉터리의 인덱스는 프로세스당 한 번만 엽니다."""
+    directory = os.path.abspath(directory)
+    with _indexes_lock:
+        index = _indexes.get(directory)
+        if index is None:
+            index = _indexes[directory] = QuantizedIndex.open(directory)
+        return index
+
+
+def build_from_chroma(persist_directory, collection_name, output, dim=1024, quantization='int8'):
+    """Chroma collection에 저장된 벡터와 문서로 QuantizedIndex를 만듭니다 (임베딩 API를 다시 호출하지 않음)."""
+    import chromadb
+
+    # chromadb는 저장소를 열 때 HNSW segment 파일을 다시 쓰므로 원본 대신 임시 복사본에서 읽음
+    with tempfile.TemporaryDirectory() as workdir:
+        copy = os.path.join(workdir, 'chroma')
+        shutil.copytree(persist_directory, copy)
+        client = chromadb.PersistentClient(path=copy)
+        records = client.get_collection(collection_name).get(include=['embeddings', 'documents', 'metadatas'])
+    return QuantizedIndex.build(
+        output, records['ids'], records['documents'], records['metadatas'], np.asarray(records['embeddings']),
+        dim=dim, quantization=quantization,
+        source={'persist_directory': os.path.abspath(persist_directory), 'collection': collection_name},
+    )
+
+
+def rebuild_if_source(directory, persist_directory, collection_name):
+    """
+    directory의 인덱스가 이 Chroma collection에서 만든 것이면 같은 dim/양자화 방식으로 다시 만듭니다.
+
+    Returns:
+        bool: 다시 만들었으면 True (인덱스가 없거나 다른 저장소에서 만든 것이면 False)
+    """
+    meta_path = os.path.join(directory, 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    source = meta.get('source') or {}
+    expected = (os.path.abspath(persist_directory), collection_name)
+    if (source.get('persist_directory'), source.get('collection')) != expected:
+        return False
+    build_from_chroma(persist_directory, collection_name, directory, meta['dim'], meta['quantization'])
+    # 새 인덱스로 바꾼 뒤에, 같은 프로세스에서 이미 연 인덱스는 다음 open_index에서 새 파일을 읽도록 버림
+    with _indexes_lock:
+        _indexes.pop(os.path.abspath(directory), None)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chroma collection의 벡터로 양자화된 로컬 vector 인덱스를 만듭니다.')
+    parser.add_argument('--persist-directory', required=True, help='Chroma 저장 디렉터리')
+    parser.add_argument('--collection', default='spring_framework_docs', help='Chroma collection 이름')
+    parser.add_argument('--output', required=True, help='인덱스를 저장할 디렉터리')
+    parser.add_argument('--dim', type=int, default=1024, help='남길 차원 수 (Matryoshka)')
+    parser.add_argument('--quantization', choices=QUANTIZATIONS, default='int8')
+    args = parser.parse_args()
+
+    index = build_from_chroma(args.persist_directory, args.collection, args.output, args.dim, args.quantization)
+    print(f'documents: {len(index)}, dim: {index.dim}/{index.full_dim}, quantization: {index.quantization}, '
+          f'code bytes: {index.memory_bytes()}')
+
+
+if __name__ == '__main__':
+    main()
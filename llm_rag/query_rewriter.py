@@ -0,0 +1,223 @@
+import threading
+import time
+from collections import deque
+
+from langchain_core.runnables import RunnableLambda
+
+# 사전 표현 바로 뒤에 붙어도 단어가 끝난 것으로 보는 조사 (긴 것부터 확인)
+_PARTICLES = sorted([
+    '은', '는', '이', '가', '을', '를', '의', '에', '에서', '에게', '으로', '로', '와', '과', '도', '만', '까지', '부터',
+    '란', '이란', '라는', '이라는', '랑', '이랑', '하고', '보다', '처럼', '이나', '나', '들',
+], key=len, reverse=True)
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == '_'
+
+
+def _is_token_boundary(text, start, stop):
+    """
+    text[start:stop]이 다른 단어의 일부가 아닌지 확인합니다.
+    앞은 문자열 시작이거나 공백/문장 부호여야 하고, 뒤는 문자열 끝, 공백/문장 부호 또는 조사(+ 공백/문장 부호)여야 합니다.
+    예: "언어는"의 "언어"는 매칭, "프로그래밍언어", "언어학"의 "언어"는 매칭하지 않음
+    """
+    if start > 0 and _is_word_char(text[start - 1]):
+        return False
+    if stop == len(text) or not _is_word_char(text[stop]):
+        return True
+    for particle in _PARTICLES:
+        end = stop + len(particle)
+        if text.startswith(particle, stop) and (end == len(text) or not _is_word_char(text[end])):
+            return True
+    return False
+
+
+def parse_dictionary(lines):
+    """
+    "표현1, 표현2 -> 바꿀 단어" 형식의 줄들을 {표현: {바꿀 단어, ...}}로 변환합니다.
+    빈 줄과 #으로 시작하는 줄은 무시합니다.
+    """
+    synonyms = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#') or '->' not in line:
+            continue
+        sources, target = line.rsplit('->', 1)
+        target = target.strip()
+        for source in sources.split(','):
+            source = source.strip()
+            if source:
+                synonyms.setdefault(source, set()).add(target)
+    return synonyms
+
+
+def load_dictionary_lines(path):
+    # LLM 프롬프트에도 그대로 넣을 수 있도록 주석과 빈 줄을 뺀 사전 줄 목록을 반환
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+
+def load_dictionary(path):
+    return parse_dictionary(load_dictionary_lines(path))
+
+
+class AhoCorasick:
+    """여러 개의 패턴을 문자열 한 번 순회로 모두 찾는 Aho-Corasick 매처"""
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for pattern in patterns:
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(pattern)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find_all(self, text):
+        """(시작 위치, 끝 위치, 패턴) 목록을 반환합니다."""
+        matches = []
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for pattern in self._output[state]:
+                matches.append((i - len(pattern) + 1, i + 1, pattern))
+        return matches
+
+
+class QueryRewriter:
+    """
+    사전을 이용해 사용자 질문을 로컬에서 바로 바꿔주는 rewriter.
+
+    - 사전 표현이 없으면 LLM 호출 없이 질문을 그대로 반환
+    - 표현 하나가 여러 단어로 바뀔 수 있는 모호한 경우에만 fallback(LLM 체인)을 호출
+    - fallback이 없으면 모호한 표현은 바꾸지 않음
+
+    fallback은 질문 문자열을 받아 바뀐 질문 문자열을 반환하는 Runnable입니다.
+    """
+
+    def __init__(self, synonyms, fallback=None, estimated_llm_seconds=1.0):
+        self.synonyms = synonyms
+        self.fallback = fallback
+        self._matcher = AhoCorasick(synonyms.keys())
+
+        # LLM을 건너뛴 덕분에 줄어든 시간을 계산하기 위한 통계
+        # LLM 호출 시간은 실제 fallback 호출의 평균을 사용하고, 아직 없으면 estimated_llm_seconds를 사용
+        self.estimated_llm_seconds = estimated_llm_seconds
+        self._lock = threading.Lock()
+        self._stats = {'queries': 0, 'rewritten': 0, 'llm_calls': 0, 'local_seconds': 0.0, 'llm_seconds': 0.0}
+
+    def _select_matches(self, query):
+        # 단어 경계에 있는 표현만, 가장 왼쪽, 가장 긴 표현부터 겹치지 않게 선택
+        matches = sorted(
+            (match for match in self._matcher.find_all(query) if _is_token_boundary(query, match[0], match[1])),
+            key=lambda m: (m[0], -(m[1] - m[0])),
+        )
+        selected = []
+        end = 0
+        for start, stop, pattern in matches:
+            if start >= end:
+                selected.append((start, stop, pattern))
+                end = stop
+        return selected
+
+    def _rewrite_locally(self, query):
+        """(바뀐 질문, 모호한 표현이 있었는지)를 반환합니다."""
+        pieces = []
+        position = 0
+        ambiguous = False
+        for start, stop, pattern in self._select_matches(query):
+            targets = self.synonyms[pattern]
+            if len(targets) > 1:
+                ambiguous = True
+                continue
+            target = next(iter(targets))
+            # "자바 언어"처럼 이미 바꿀 단어가 들어 있으면 중복해서 바꾸지 않음
+            if target in query:
+                continue
+            pieces.append(query[position:start])
+            pieces.append(target)
+            position = stop
+        pieces.append(query[position:])
+        return ''.join(pieces), ambiguous
+
+    def _record(self, rewritten, local_seconds, llm_seconds=None):
+        with self._lock:
+            self._stats['queries'] += 1
+            self._stats['rewritten'] += int(rewritten)
+            self._stats['local_seconds'] += local_seconds
+            if llm_seconds is not None:
+                self._stats['llm_calls'] += 1
+                self._stats['llm_seconds'] += llm_seconds
+
+    def rewrite(self, query):
+        started = time.perf_counter()
+        rewritten, ambiguous = self._rewrite_locally(query)
+        local_seconds = time.perf_counter() - started
+        if not (ambiguous and self.fallback is not None):
+            self._record(rewritten != query, local_seconds)
+            return rewritten
+
+        started = time.perf_counter()
+        rewritten = self.fallback.invoke(query)
+        self._record(rewritten != query, local_seconds, time.perf_counter() - started)
+        return rewritten
+
+    async def arewrite(self, query):
+        started = time.perf_counter()
+        rewritten, ambiguous = self._rewrite_locally(query)
+        local_seconds = time.perf_counter() - started
+        if not (ambiguous and self.fallback is not None):
+            self._record(rewritten != query, local_seconds)
+            return rewritten
+
+        started = time.perf_counter()
+        rewritten = await self.fallback.ainvoke(query)
+        self._record(rewritten != query, local_seconds, time.perf_counter() - started)
+        return rewritten
+
+    def as_runnable(self, input_key='question'):
+        # 기존 dictionary_chain처럼 {"question": ...}을 받아 문자열을 반환하는 Runnable
+        return RunnableLambda(
+            lambda inputs: self.rewrite(inputs[input_key]),
+            afunc=lambda inputs: self.arewrite(inputs[input_key]),
+            name='query_rewriter',
+        )
+
+    def stats(self):
+        """
+        rewrite 통계와 LLM 호출을 건너뛰어 절약한 시간(추정)을 반환합니다.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        skipped = stats['queries'] - stats['llm_calls']
+        llm_avg = stats['llm_seconds'] / stats['llm_calls'] if stats['llm_calls'] else self.estimated_llm_seconds
+        stats['skipped_llm_calls'] = skipped
+        stats['avg_llm_seconds'] = llm_avg
+        stats['saved_seconds'] = skipped * llm_avg - stats['local_seconds']
+        return stats
@@ -0,0 +1,194 @@
+"""
+llm_rag 파이프라인을 SSE(Server-Sent Events)로 스트리밍하는 ASGI 서버.
+
+Streamlit UI는 답변이 끝날 때까지 스크립트 실행 하나를 붙잡고 있지만,
+이 서버는 asyncio 위에서 여러 대화를 동시에 처리합니다.
+
+실행:
+    uvicorn server:create_app --factory --app-dir llm_rag
+
+요청:
+    POST /chat  {"message": "스프링이란?", "session_id": "..."}  (session_id는 생략 가능)
+
+응답 (text/event-stream):
+    event: session  data: {"session_id": "..."}
+    event: token    data: {"token": "..."}   (여러 번)
+    event: done     data: {}
+
+    GET /metrics  단계별 실행 시간/토큰 수 (Prometheus text format, config.instrumentation_enabled가 True일 때)
+"""
+import asyncio
+import json
+import uuid
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from config import server_max_concurrency, server_max_waiting
+from instrumentation import get_instrumentation
+
+
+class ChatRequest(BaseModel):
+    message: str
+    session_id: str | None = None
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class Reservation:
+    """ConcurrencyLimiter.try_reserve가 예약한 대기 자리. release()는 여러 번 호출해도 한 번만 풀립니다."""
+
+    def __init__(self, limiter):
+        self._limiter = limiter
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._limiter.waiting -= 1
+
+
+class ReservedStreamingResponse(StreamingResponse):
+    """
+    응답이 끝나면(body를 보내기 전에 클라이언트가 끊거나 오류가 나도) 대기 자리 예약을 푸는 StreamingResponse.
+    body generator가 한 번도 실행되지 않으면 slot()이 불리지 않으므로 여기서 풀어야 자리가 새지 않습니다.
+    """
+
+    def __init__(self, content, reservation, **kwargs):
+        super().__init__(content, **kwargs)
+        self.reservation = reservation
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.reservation.release()
+
+
+class ConcurrencyLimiter:
+    """
+    동시에 생성하는 답변 수를 max_concurrency로 제한하고,
+    대기 중인 요청이 max_waiting을 넘으면 바로 거절합니다 (backpressure).
+    """
+
+    def __init__(self, max_concurrency, max_waiting):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self.active = 0
+
+    def try_reserve(self):
+        """
+        자리(실행 중 + 대기)가 남아 있으면 대기 자리를 예약한 Reservation을, 다 찼으면 None을 반환합니다.
+        확인과 예약 사이에 await가 없으므로 한꺼번에 들어온 요청도 max_waiting을 넘겨 받지 않습니다.
+        예약은 slot()에서 실행 차례가 되면(또는 기다리다 취소되면) 풀리고,
+        slot()까지 가지 못한 요청은 ReservedStreamingResponse가 응답을 끝낼 때 풉니다.
+        """
+        if self.active + self.waiting >= self.max_concurrency + self.max_waiting:
+            return None
+        self.waiting += 1
+        return Reservation(self)
+
+    @asynccontextmanager
+    async def slot(self, reservation):
+        # try_reserve로 예약한 대기 자리에서 실행할 차례를 기다림
+        try:
+            await self._semaphore.acquire()
+        finally:
+            reservation.release()
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+
+def create_app(response_fn=None, max_concurrency=server_max_concurrency, max_waiting=server_max_waiting,
+               warm_up_fn=None):
+    """
+    Args:
+        response_fn: (message, session_id)를 받아 토큰을 async generator로 내보내는 함수.
+            기본값은 llm.aget_ai_response이며, 테스트에서는 가짜 LLM/retriever로 만든 함수를 넘길 수 있습니다.
+        max_concurrency (int): 동시에 생성할 수 있는 최대 답변 수
+        max_waiting (int): 자리가 날 때까지 기다릴 수 있는 최대 요청 수. 넘으면 503으로 응답
+        warm_up_fn: 서버 시작 시 한 번 호출할 동기 함수 (기본값은 llm.warm_up)
+    """
+    if response_fn is None:
+        from llm import aget_ai_response, warm_up
+        response_fn = aget_ai_response
+        warm_up_fn = warm_up_fn or warm_up
+
+    limiter = ConcurrencyLimiter(max_concurrency, max_waiting)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        if warm_up_fn is not None:
+            # 체인과 HTTP 클라이언트를 미리 만들어 첫 요청이 느려지지 않게 함
+            await asyncio.to_thread(warm_up_fn)
+        yield
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.limiter = limiter
+
+    @app.get("/health")
+    async def health():
+        return {"active": limiter.active, "waiting": limiter.waiting}
+
+    @app.get("/metrics")
+    async def metrics():
+        instrumentation = get_instrumentation()
+        if instrumentation is None:
+            return JSONResponse({"detail": "instrumentation is disabled"}, status_code=404)
+        return PlainTextResponse(instrumentation.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+    @app.post("/chat")
+    async def chat(chat_request: ChatRequest, request: Request):
+        reservation = limiter.try_reserve()
+        if reservation is None:
+            return JSONResponse({"detail": "too many requests"}, status_code=503, headers={"Retry-After": "1"})
+
+        session_id = chat_request.session_id or str(uuid.uuid4())
+
+        async def event_stream():
+            async with limiter.slot(reservation):
+                yield _sse("session", {"session_id": session_id})
+                tokens = response_fn(chat_request.message, session_id)
+                try:
+                    async for token in tokens:
+                        # 클라이언트가 연결을 끊으면 남은 생성을 취소해 LLM 호출 비용을 아낀다.
+                        if await request.is_disconnected():
+                            break
+                        yield _sse("token", {"token": token})
+                    else:
+                        yield _sse("done", {})
+                except Exception as e:
+                    yield _sse("error", {"detail": str(e)})
+                finally:
+                    await tokens.aclose()
+
+        # StreamingResponse는 클라이언트가 토큰을 받아갈 때마다 다음 토큰을 요청하므로
+        # 느린 클라이언트 때문에 서버 메모리에 토큰이 쌓이지 않는다.
+        try:
+            return ReservedStreamingResponse(
+                event_stream(),
+                reservation,
+                media_type="text/event-stream",
+                headers={"X-Session-Id": session_id, "Cache-Control": "no-cache"},
+            )
+        except BaseException:
+            reservation.release()
+            raise
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(create_app(), host="0.0.0.0", port=8000)
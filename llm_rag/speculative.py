@@ -0,0 +1,210 @@
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from hybrid_retriever import reciprocal_rank_fusion
+
+
+def query_similarity(a, b):
+    """두 질문의 글자 bigram Jaccard 유사도 (0~1). 공백은 무시합니다."""
+    a = a.replace(' ', '')
+    b = b.replace(' ', '')
+    if a == b:
+        return 1.0
+    a_grams = {a[i:i + 2] for i in range(len(a) - 1)} or {a}
+    b_grams = {b[i:i + 2] for i in range(len(b) - 1)} or {b}
+    return len(a_grams & b_grams) / len(a_grams | b_grams)
+
+
+class SpeculativeRagPipeline:
+    """
+    rewrite와 retrieval을 겹쳐서 실행하는 RAG 파이프라인.
+
+    기존 체인({"input": dictionary_chain} | rag_chain)은 rewrite → contextualize → retrieve → generate를
+    순서대로 실행하지만, 이 파이프라인은
+
+    - 대화 기록이 없으면 rewrite가 진행되는 동안 원래 질문으로 retrieval을 미리 시작하고,
+      rewrite 결과가 원래 질문과 같거나 충분히 비슷하면(similarity_threshold) 그 결과를 그대로 사용
+    - 대화 기록이 없으면 contextualize LLM 호출을 건너뜀
+    - 대화 기록이 있으면 rewrite → contextualize → retrieve 순서로 실행
+
+    음성 입력(speech.py)처럼 질문이 조각(segment)으로 들어오면 prefetch로 조각마다 rewrite/retrieval을
+    미리 시작하고, stream(prefetched=...)에서 조각별 검색 결과를 합쳐(RRF) 사용할 수 있습니다.
+
+    요청마다 단계별 시간(초)과 첫 토큰까지의 시간(time_to_first_token)을 timings에 기록합니다.
+    """
+
+    def __init__(self, rewriter, retriever, contextualize_chain, question_answer_chain, get_session_history,
+                 similarity_threshold=0.9, max_workers=8):
+        self.rewriter = rewriter
+        self.retriever = retriever
+        self.contextualize_chain = contextualize_chain
+        self.question_answer_chain = question_answer_chain
+        self.get_session_history = get_session_history
+        self.similarity_threshold = similarity_threshold
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='speculative')
+        self.timings = deque(maxlen=1000)
+
+    @staticmethod
+    def _timed(timings, stage, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        timings[stage] = time.perf_counter() - started
+        return result
+
+    def _prepare(self, question, chat_history, timings):
+        """(바뀐 질문, 검색된 문서)를 반환합니다."""
+        if chat_history:
+            rewritten = self._timed(timings, 'rewrite', self.rewriter.rewrite, question)
+            standalone = self._timed(timings, 'contextualize', self.contextualize_chain.invoke,
+                                     {'input': rewritten, 'chat_history': chat_history})
+            docs = self._timed(timings, 'retrieve', self.retriever.invoke, standalone)
+            return rewritten, docs
+
+        speculative = self._executor.submit(self._timed, timings, 'speculative_retrieve',
+                                            self.retriever.invoke, question)
+        rewritten = self._timed(timings, 'rewrite', self.rewriter.rewrite, question)
+        if query_similarity(question, rewritten) >= self.similarity_threshold:
+            timings['speculative_hit'] = True
+            return rewritten, speculative.result()
+
+        timings['speculative_hit'] = False
+        docs = self._timed(timings, 'retrieve', self.retriever.invoke, rewritten)
+        return rewritten, docs
+
+    def _prefetch(self, segment):
+        return self.retriever.invoke(self.rewriter.rewrite(segment))
+
+    def prefetch(self, segment):
+        """
+        질문의 일부(segment)로 rewrite와 retrieval을 미리 시작합니다.
+
+        Returns:
+            Future: 검색된 문서 목록. stream(..., prefetched=[future, ...])으로 넘깁니다.
+        """
+        return self._executor.submit(self._prefetch, segment)
+
+    def _merge_prefetched(self, question, prefetched, timings):
+        # 전체 질문의 rewrite(답변 생성용)는 남은 prefetch를 기다리는 동안 함께 실행
+        rewrite = self._executor.submit(self._timed, timings, 'rewrite', self.rewriter.rewrite, question)
+        started = time.perf_counter()
+        # 실패한 prefetch(일시적인 검색/임베딩 오류)는 버리고 성공한 조각의 결과만 합침
+        results = [future.result() for future in prefetched if future.exception() is None]
+        timings['prefetch_wait'] = time.perf_counter() - started
+        rewritten = rewrite.result()
+        if not results:
+            # 모든 prefetch가 실패했으면 바뀐 전체 질문으로 평소처럼 검색
+            docs = self._timed(timings, 'retrieve', self.retriever.invoke, rewritten)
+            return rewritten, docs
+        docs = reciprocal_rank_fusion(results, k=max(len(result) for result in results))
+        return rewritten, docs
+
+    def stream(self, question, session_id, prefetched=None):
+        """
+        Args:
+            question (str): 질문
+            session_id (str): 대화 기록 id
+            prefetched (list): prefetch가 반환한 Future 목록. 대화 기록이 없을 때만 retrieval 대신 사용
+        """
+        timings = {}
+        started = time.perf_counter()
+        history = self.get_session_history(session_id)
+        chat_history = history.messages
+
+        if prefetched and not chat_history:
+            rewritten, docs = self._merge_prefetched(question, prefetched, timings)
+        else:
+            rewritten, docs = self._prepare(question, chat_history, timings)
+        timings['prepare'] = time.perf_counter() - started
+
+        chunks = []
+        generate_started = time.perf_counter()
+        for chunk in self.question_answer_chain.stream(
+            {'input': rewritten, 'chat_history': chat_history, 'context': docs}
+        ):
+            if not chunks:
+                timings['time_to_first_token'] = time.perf_counter() - started
+            chunks.append(chunk)
+            yield chunk
+        timings['generate'] = time.perf_counter() - generate_started
+        timings['total'] = time.perf_counter() - started
+
+        # 기존 체인(RunnableWithMessageHistory)과 같이 바뀐 질문과 답변을 대화 기록에 남김
+        history.add_messages([HumanMessage(rewritten), AIMessage(''.join(chunks))])
+        self.timings.append(timings)
+
+    @staticmethod
+    async def _atimed(timings, stage, func, *args):
+        started = time.perf_counter()
+        result = await func(*args)
+        timings[stage] = time.perf_counter() - started
+        return result
+
+    async def _aprepare(self, question, chat_history, timings):
+        if chat_history:
+            rewritten = await self._atimed(timings, 'rewrite', self.rewriter.arewrite, question)
+            standalone = await self._atimed(timings, 'contextualize', self.contextualize_chain.ainvoke,
+                                            {'input': rewritten, 'chat_history': chat_history})
+            docs = await self._atimed(timings, 'retrieve', self.retriever.ainvoke, standalone)
+            return rewritten, docs
+
+        speculative = asyncio.create_task(
+            self._atimed(timings, 'speculative_retrieve', self.retriever.ainvoke, question)
+        )
+        try:
+            rewritten = await self._atimed(timings, 'rewrite', self.rewriter.arewrite, question)
+        except BaseException:
+            speculative.cancel()
+            raise
+        if query_similarity(question, rewritten) >= self.similarity_threshold:
+            timings['speculative_hit'] = True
+            return rewritten, await speculative
+
+        timings['speculative_hit'] = False
+        speculative.cancel()
+        docs = await self._atimed(timings, 'retrieve', self.retriever.ainvoke, rewritten)
+        return rewritten, docs
+
+    async def astream(self, question, session_id):
+        """stream과 같지만 asyncio에서 실행되며, 대화 기록 저장소 접근은 별도 스레드에서 수행합니다."""
+        timings = {}
+        started = time.perf_counter()
+        history = await asyncio.to_thread(self.get_session_history, session_id)
+        chat_history = await asyncio.to_thread(lambda: history.messages)
+
+        rewritten, docs = await self._aprepare(question, chat_history, timings)
+        timings['prepare'] = time.perf_counter() - started
+
+        chunks = []
+        generate_started = time.perf_counter()
+        async for chunk in self.question_answer_chain.astream(
+            {'input': rewritten, 'chat_history': chat_history, 'context': docs}
+        ):
+            if not chunks:
+                timings['time_to_first_token'] = time.perf_counter() - started
+            chunks.append(chunk)
+            yield chunk
+        timings['generate'] = time.perf_counter() - generate_started
+        timings['total'] = time.perf_counter() - started
+
+        await asyncio.to_thread(history.add_messages, [HumanMessage(rewritten), AIMessage(''.join(chunks))])
+        self.timings.append(timings)
+
+    def report(self):
+        """단계별 평균 시간(초)과 speculative retrieval 적중률을 반환합니다."""
+        timings = list(self.timings)
+        stages = {}
+        for timing in timings:
+            for stage, value in timing.items():
+                if stage != 'speculative_hit':
+                    stages.setdefault(stage, []).append(value)
+        speculated = [timing['speculative_hit'] for timing in timings if 'speculative_hit' in timing]
+        return {
+            'requests': len(timings),
+            'avg_seconds': {stage: sum(values) / len(values) for stage, values in stages.items()},
+            'speculative_hit_rate': sum(speculated) / len(speculated) if speculated else None,
+        }
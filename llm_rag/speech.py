@@ -0,0 +1,363 @@
+"""
+음성 입력을 발화(utterance) 단위로 나눠 동시에 인식하는 파이프라인 (ui.py, ui_with-recording.py).
+
+기존에는 녹음이 끝난 뒤 전체 음성을 한 번에 인식했기 때문에 녹음이 길수록 답변까지의 시간도 길어졌지만,
+이 파이프라인은
+
+1. 들어오는 음성을 에너지 기반 VAD(EnergyVAD)로 발화 단위로 자르고,
+2. 발화가 끝나는 즉시 recognizer로 보내 여러 발화를 동시에 인식하고,
+3. 앞에서부터 인식이 끝난 발화(안정된 구간)마다 on_segment를 호출해
+   녹음/인식이 진행되는 동안 질문 rewrite와 retrieval을 미리 시작할 수 있게 합니다.
+
+마이크 없이 WAV 파일과 LocalRecognizer로 실행할 수 있습니다.
+    pipeline = SpeechPipeline(LocalRecognizer(['스프링 빈이 뭐야']))
+    result = pipeline.transcribe_wav('question.wav')
+"""
+import io
+import threading
+import time
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def _to_int16(frames, sample_width, channels):
+    # 8/16/32bit PCM을 mono 16bit로 변환
+    if sample_width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.int16) - 128) << 8
+    elif sample_width == 2:
+        samples = np.frombuffer(frames, dtype='<i2')
+    elif sample_width == 4:
+        samples = (np.frombuffer(frames, dtype='<i4') >> 16).astype(np.int16)
+    else:
+        raise ValueError(f'unsupported sample width: {sample_width}')
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples
+
+
+def open_wav(source, chunk_seconds=0.1):
+    """
+    WAV 파일(경로 또는 bytes)을 chunk_seconds 단위의 mono 16bit PCM으로 나눠 읽습니다.
+
+    Returns:
+        tuple: (sample_rate, PCM bytes chunk를 내보내는 generator)
+    """
+    wav = wave.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source, 'rb')
+    sample_rate = wav.getframerate()
+    chunk_frames = max(1, int(sample_rate * chunk_seconds))
+
+    def chunks():
+        with wav:
+            while True:
+                frames = wav.readframes(chunk_frames)
+                if not frames:
+                    return
+                yield _to_int16(frames, wav.getsampwidth(), wav.getnchannels()).tobytes()
+
+    return sample_rate, chunks()
+
+
+def write_wav(samples, sample_rate):
+    """mono 16bit PCM(np.int16 배열 또는 bytes)을 WAV bytes로 만듭니다."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples if isinstance(samples, (bytes, bytearray)) else np.asarray(samples, np.int16).tobytes())
+    return buffer.getvalue()
+
+
+def microphone_chunks(source, max_seconds=30):
+    """speech_recognition.Microphone에서 CHUNK 단위로 PCM bytes를 읽습니다 (최대 max_seconds)."""
+    for _ in range(int(max_seconds * source.SAMPLE_RATE / source.CHUNK)):
+        yield source.stream.read(source.CHUNK)
+
+
+class EnergyVAD:
+    """
+    frame(frame_ms)마다 RMS 에너지를 계산해 발화 구간을 찾는 스트리밍 VAD.
+
+    - 에너지가 max(min_energy, 배경 소음 * energy_ratio)보다 크면 음성 frame
+      (배경 소음은 음성이 아닌 frame의 에너지 이동 평균)
+    - 음성 frame이 나온 뒤 min_silence_ms 동안 조용하면 발화 하나로 자름 (max_utterance_seconds를 넘어도 자름)
+    - min_speech_ms보다 짧은 발화(잡음)는 버리고, 발화 앞뒤로 padding_ms만큼 여유를 둠
+
+    feed(pcm)로 음성을 넣을 때마다 끝난 발화 목록을 반환하고, 입력이 끝나면 flush()로 남은 발화를 받습니다.
+    발화는 {'index', 'start', 'end'(초), 'audio'(mono 16bit PCM bytes), 'sample_rate'} dict입니다.
+    """
+
+    def __init__(self, sample_rate, frame_ms=30, min_energy=300.0, energy_ratio=3.0, min_speech_ms=200,
+                 min_silence_ms=500, padding_ms=150, max_utterance_seconds=15.0, noise_smoothing=0.05):
+        self.sample_rate = sample_rate
+        self.frame_size = int(sample_rate * frame_ms / 1000)
+        self.min_energy = min_energy
+        self.energy_ratio = energy_ratio
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.min_silence_frames = max(1, min_silence_ms // frame_ms)
+        self.padding_frames = padding_ms // frame_ms
+        self.max_frames = int(max_utterance_seconds * 1000 / frame_ms)
+        self.noise_smoothing = noise_smoothing
+
+        self.noise = None
+        self.heard_speech = False
+        self._pending = np.empty(0, dtype=np.int16)
+        self._before = deque(maxlen=self.padding_frames or 1)
+        self._frames = []
+        self._start_frame = 0
+        self._speech_frames = 0
+        self._silence_frames = 0
+        self._frame_index = 0
+        self._index = 0
+
+    @property
+    def trailing_silence_seconds(self):
+        """마지막 음성 frame 이후 조용했던 시간(초). 음성이 아직 없으면 0"""
+        if not self.heard_speech:
+            return 0.0
+        frames = self._silence_frames if self._frames else self._frame_index - self._last_speech_frame
+        return frames * self.frame_size / self.sample_rate
+
+    def _is_speech(self, frame):
+        energy = float(np.sqrt(np.mean(frame.astype(np.float32) ** 2)))
+        threshold = self.min_energy if self.noise is None else max(self.min_energy, self.noise * self.energy_ratio)
+        speech = energy > threshold
+        if not speech:
+            self.noise = energy if self.noise is None else (
+                (1 - self.noise_smoothing) * self.noise + self.noise_smoothing * energy
+            )
+        return speech
+
+    def _emit(self, keep_frames):
+        frames = self._frames[:keep_frames]
+        rest = self._frames[keep_frames:]
+        utterance = None
+        if self._speech_frames >= self.min_speech_frames:
+            audio = np.concatenate(frames)
+            start = self._start_frame * self.frame_size / self.sample_rate
+            utterance = {
+                'index': self._index,
+                'start': start,
+                'end': start + len(audio) / self.sample_rate,
+                'audio': audio.tobytes(),
+                'sample_rate': self.sample_rate,
+            }
+            self._index += 1
+        self._frames = []
+        self._speech_frames = 0
+        self._silence_frames = 0
+        self._before.clear()
+        self._before.extend(rest[-self.padding_frames:] if self.padding_frames else [])
+        return utterance
+
+    def _process(self, frame):
+        speech = self._is_speech(frame)
+        if speech:
+            self.heard_speech = True
+            self._last_speech_frame = self._frame_index + 1
+        if not self._frames:
+            if speech:
+                self._start_frame = self._frame_index - (len(self._before) if self.padding_frames else 0)
+                self._frames = (list(self._before) if self.padding_frames else []) + [frame]
+                self._speech_frames = 1
+                self._before.clear()
+            elif self.padding_frames:
+                self._before.append(frame)
+            self._frame_index += 1
+            return None
+
+        self._frames.append(frame)
+        self._frame_index += 1
+        if speech:
+            self._speech_frames += 1
+            self._silence_frames = 0
+        else:
+            self._silence_frames += 1
+        if self._silence_frames >= self.min_silence_frames:
+            return self._emit(len(self._frames) - self._silence_frames + self.padding_frames)
+        if len(self._frames) >= self.max_frames:
+            return self._emit(len(self._frames))
+        return None
+
+    def feed(self, pcm):
+        """mono 16bit PCM bytes를 넣고, 이번 입력으로 끝난 발화 목록을 반환합니다."""
+        samples = np.frombuffer(pcm, dtype='<i2')
+        if len(self._pending):
+            samples = np.concatenate([self._pending, samples])
+        utterances = []
+        usable = len(samples) - len(samples) % self.frame_size
+        for offset in range(0, usable, self.frame_size):
+            utterance = self._process(samples[offset:offset + self.frame_size])
+            if utterance is not None:
+                utterances.append(utterance)
+        self._pending = samples[usable:].copy()
+        return utterances
+
+    def flush(self):
+        """입력이 끝났을 때 진행 중이던 발화를 반환합니다."""
+        if not self._frames:
+            return []
+        utterance = self._emit(len(self._frames) - self._silence_frames + self.padding_frames)
+        return [utterance] if utterance is not None else []
+
+
+class GoogleRecognizer:
+    """speech_recognition의 recognize_google로 발화 하나를 인식하는 recognizer (네트워크 필요)"""
+
+    def __init__(self, language='ko-KR'):
+        import speech_recognition as sr
+
+        self.language = language
+        self._recognizer = sr.Recognizer()
+
+    def transcribe(self, utterance):
+        import speech_recognition as sr
+
+        audio = sr.AudioData(utterance['audio'], utterance['sample_rate'], 2)
+        try:
+            return self._recognizer.recognize_google(audio, language=self.language)
+        except sr.UnknownValueError:
+            # 알아들을 수 없는 발화는 건너뜀 (다른 발화의 인식 결과는 그대로 사용)
+            return ''
+
+
+class LocalRecognizer:
+    """
+    네트워크 없이 사용하는 recognizer (테스트/벤치마크용).
+    transcripts[발화 번호]를 인식 결과로 반환하고, 음성 1초당 seconds_per_audio_second초를 기다려
+    실제 인식 서비스처럼 발화 길이에 비례하는 처리 시간을 흉내 냅니다.
+    """
+
+    def __init__(self, transcripts=(), seconds_per_audio_second=0.0):
+        self.transcripts = list(transcripts)
+        self.seconds_per_audio_second = seconds_per_audio_second
+        self.calls = 0
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        # 한 줄에 발화 하나씩 적힌 transcript 파일 (예: question.wav 옆의 question.txt)
+        with open(path, encoding='utf-8') as f:
+            return cls([line.strip() for line in f if line.strip()], **kwargs)
+
+    def transcribe(self, utterance):
+        self.calls += 1
+        time.sleep((utterance['end'] - utterance['start']) * self.seconds_per_audio_second)
+        index = utterance['index']
+        return self.transcripts[index] if index < len(self.transcripts) else ''
+
+
+class SpeechPipeline:
+    """
+    EnergyVAD로 자른 발화를 recognizer로 동시에 인식하고, 인식 결과를 발화 순서대로 이어 붙입니다.
+
+    앞에서부터 인식이 끝난 발화는 더 이상 바뀌지 않으므로(안정된 구간) 그때마다
+    on_segment(text, utterance)를 호출합니다. 녹음이 끝나기 전에도 호출될 수 있으며,
+    여기서 질문 rewrite/retrieval을 미리 시작하면 답변까지의 시간이 녹음 길이에 비례해 늘어나지 않습니다.
+    """
+
+    def __init__(self, recognizer, max_workers=4, **vad_options):
+        self.recognizer = recognizer
+        self.vad_options = vad_options
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='speech')
+        self.timings = deque(maxlen=1000)
+
+    def run(self, chunks, sample_rate, on_segment=None, end_silence_seconds=None):
+        """
+        음성 chunk를 읽으면서 발화가 끝날 때마다 인식을 시작합니다.
+
+        Args:
+            chunks: mono 16bit PCM bytes를 내보내는 iterable (open_wav, microphone_chunks)
+            sample_rate (int): 샘플링 주파수
+            on_segment: 안정된 발화마다 (인식 결과, 발화 dict)로 호출할 함수. 인식 결과가 빈 발화는 건너뜀.
+                on_segment에서 난 오류는 인식이 모두 끝난 뒤 다시 발생시킴
+            end_silence_seconds (float): 음성이 나온 뒤 이 시간만큼 조용하면 입력을 그만 읽음 (마이크 입력용)
+
+        Returns:
+            dict: text(전체 인식 결과), segments(발화별 start/end/text/error), timings(초)
+        """
+        started = time.perf_counter()
+        vad = EnergyVAD(sample_rate, **self.vad_options)
+        futures = []
+        utterances = []
+        lock = threading.Lock()
+        # on_segment를 발화 순서대로 한 번에 하나씩 호출하기 위한 lock.
+        # lock과 따로 두어 on_segment가 느려도 녹음 스레드의 submit()은 기다리지 않음
+        deliver_lock = threading.Lock()
+        released = [0]
+        callback_errors = []
+
+        def release(_):
+            # 앞 발화부터 순서대로 인식이 끝난 것만 lock 안에서 모으고, on_segment는 lock 밖에서 호출
+            with deliver_lock:
+                ready = []
+                with lock:
+                    while released[0] < len(futures) and futures[released[0]].done():
+                        index = released[0]
+                        released[0] += 1
+                        if not futures[index].exception():
+                            ready.append((futures[index].result(), utterances[index]))
+                if on_segment is None:
+                    return
+                for text, utterance in ready:
+                    if not text:
+                        continue
+                    try:
+                        on_segment(text, utterance)
+                    except Exception as e:
+                        # done callback에서 난 오류는 concurrent.futures가 로그만 남기고 버리므로 모아 두었다가 다시 발생
+                        callback_errors.append(e)
+
+        def submit(new_utterances):
+            for utterance in new_utterances:
+                with lock:
+                    utterances.append(utterance)
+                    futures.append(self._executor.submit(self.recognizer.transcribe, utterance))
+                futures[-1].add_done_callback(release)
+
+        for chunk in chunks:
+            submit(vad.feed(chunk))
+            if end_silence_seconds is not None and vad.trailing_silence_seconds >= end_silence_seconds:
+                break
+        submit(vad.flush())
+        input_done = time.perf_counter()
+
+        # 발화 하나의 인식 오류(일시적인 sr.RequestError 등)는 그 발화만 비우고 errors에 기록하며,
+        # 모든 발화가 실패했을 때만 첫 오류를 다시 발생시킴
+        errors = [future.exception() for future in futures]
+        # done callback이 아직 실행 중일 수 있으므로 남은 발화를 직접 내보내고 진행 중인 on_segment가 끝날 때까지 기다림
+        release(None)
+        if callback_errors:
+            raise callback_errors[0]
+        if errors and all(errors):
+            raise errors[0]
+        texts = ['' if error else future.result() for future, error in zip(futures, errors)]
+        finished = time.perf_counter()
+        timings = {
+            'audio_seconds': utterances[-1]['end'] if utterances else 0.0,
+            'utterances': len(utterances),
+            'failed': sum(1 for error in errors if error),
+            'input': input_done - started,
+            # 입력이 끝난 뒤 전체 인식 결과가 나올 때까지의 시간 (녹음 길이와 무관하게 마지막 발화의 인식 시간 정도)
+            'after_input': finished - input_done,
+            'total': finished - started,
+        }
+        self.timings.append(timings)
+        return {
+            'text': ' '.join(text for text in texts if text),
+            'segments': [
+                {
+                    'start': utterance['start'], 'end': utterance['end'], 'text': text,
+                    'error': f'{type(error).__name__}: {error}' if error else None,
+                }
+                for utterance, text, error in zip(utterances, texts, errors)
+            ],
+            'timings': timings,
+        }
+
+    def transcribe_wav(self, source, on_segment=None, chunk_seconds=0.1):
+        """WAV 파일(경로 또는 bytes)을 chunk_seconds씩 흘려 넣으며 인식합니다."""
+        sample_rate, chunks = open_wav(source, chunk_seconds)
+        return self.run(chunks, sample_rate, on_segment=on_segment)
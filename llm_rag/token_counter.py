@@ -0,0 +1,19 @@
+from functools import lru_cache
+
+import tiktoken
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(encoding_name):
+    # tiktoken은 처음 사용할 때 BPE 파일을 읽어오므로 import 시점이 아니라 필요할 때 로드
+    return tiktoken.get_encoding(encoding_name)
+
+
+def count_tokens(text, encoding_name='o200k_base'):
+    # o200k_base: gpt-4o 계열이 사용하는 tokenizer
+    return len(_get_encoding(encoding_name).encode(text))
+
+
+def count_message_tokens(messages):
+    # 메시지마다 role 등의 부가 토큰이 붙으므로 대략 4토큰을 더해서 계산
+    return sum(count_tokens(str(message.content)) + 4 for message in messages)
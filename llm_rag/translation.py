@@ -0,0 +1,201 @@
+import hashlib
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# 문장 끝(.!?。) 또는 줄바꿈 뒤의 공백을 기준으로 나누고, 나눈 공백은 그대로 보존
+_SENTENCE_SPLIT = re.compile(r'((?<=[.!?。])\s+|\n+)')
+_HANGUL = re.compile(r'[가-힣ㄱ-ㅎㅏ-ㅣ]')
+_LATIN = re.compile(r'[A-Za-z]')
+_SCRIPTS = {'ko': _HANGUL, 'en': _LATIN}
+
+
+def detect_language(text):
+    """한글/영문 글자 비율로 'ko' 또는 'en'을 추정합니다. 글자가 없으면 None을 반환합니다."""
+    hangul = len(_HANGUL.findall(text))
+    latin = len(_LATIN.findall(text))
+    if not hangul and not latin:
+        return None
+    return 'ko' if hangul >= latin else 'en'
+
+
+def is_target_language(text, source, target):
+    """
+    번역할 필요가 없으면 True를 반환합니다.
+    'Bean Factory와 ApplicationContext'처럼 영어 용어가 섞인 한국어 질문도 번역되도록
+    source 언어의 글자가 하나도 없을 때만 이미 target 언어라고 판단합니다.
+    """
+    pattern = _SCRIPTS.get(source)
+    if pattern is not None:
+        return not pattern.search(text)
+    return detect_language(text) in (None, target)
+
+
+def split_sentences(text):
+    """text를 [문장, 구분자, 문장, ...] 형태로 나눕니다. ''.join(결과) == text"""
+    return _SENTENCE_SPLIT.split(text)
+
+
+class GoogleTranslatorBackend:
+    """
+    deep_translator의 GoogleTranslator를 사용하는 번역 backend.
+    방향(source, target)별로 translator를 한 번만 만들고, 여러 문장은 줄바꿈으로 이어 한 번의 요청으로 번역합니다.
+    """
+
+    max_chars = 4500
+
+    def __init__(self):
+        self._translators = {}
+
+    def _translator(self, source, target):
+        from deep_translator import GoogleTranslator
+
+        if (source, target) not in self._translators:
+            self._translators[(source, target)] = GoogleTranslator(source=source, target=target)
+        return self._translators[(source, target)]
+
+    def translate_batch(self, texts, source, target):
+        translator = self._translator(source, target)
+        results = []
+        # 요청 하나의 글자 수 제한(5000자)을 넘지 않도록 나눠서 요청
+        batch = []
+        for text in texts + [None]:
+            if text is None or (batch and len('\n'.join(batch + [text])) > self.max_chars):
+                translated = translator.translate('\n'.join(batch)).split('\n')
+                if len(translated) != len(batch):
+                    # 번역 결과의 줄 수가 달라지면 문장별로 다시 요청
+                    translated = [translator.translate(item) for item in batch]
+                results.extend(translated)
+                batch = []
+            if text is not None:
+                batch.append(text)
+        return results
+
+
+class LocalTranslatorBackend:
+    """
+    네트워크 없이 사용하는 번역 backend (테스트용).
+    dictionary에 있는 문장은 그 값으로, 없는 문장은 '[target] 문장'으로 바꾸고, 호출 횟수를 calls에 기록합니다.
+    """
+
+    def __init__(self, dictionary=None):
+        self.dictionary = dictionary or {}
+        self.calls = 0
+        self.texts = 0
+
+    def translate_batch(self, texts, source, target):
+        self.calls += 1
+        self.texts += len(texts)
+        return [self.dictionary.get((source, target, text), f'[{target}] {text}') for text in texts]
+
+
+class TranslationService:
+    """
+    번역 결과를 문장 단위로 캐시하는 번역 서비스.
+
+    - 메모리 LRU 캐시(max_entries) + SQLite 캐시(cache_path, 생략하면 메모리 캐시만 사용)
+    - 여러 문장으로 된 답변은 캐시에 없는 문장만 모아 backend를 한 번 호출
+    - text가 이미 target 언어이면 번역하지 않음
+    """
+
+    def __init__(self, backend, cache_path=None, max_entries=2048):
+        self.backend = backend
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._conn = None
+        if cache_path:
+            self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, translation TEXT NOT NULL)"
+            )
+            self._conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.backend_calls = 0
+
+    @staticmethod
+    def _key(text, source, target):
+        return hashlib.sha256(f'{source}\0{target}\0{text}'.encode('utf-8')).hexdigest()
+
+    def _get(self, key):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        if self._conn is not None:
+            row = self._conn.execute("SELECT translation FROM translations WHERE key = ?", (key,)).fetchone()
+            if row:
+                self._remember(key, row[0])
+                return row[0]
+        return None
+
+    def _remember(self, key, translation):
+        self._memory[key] = translation
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _put(self, items):
+        for key, translation in items:
+            self._remember(key, translation)
+        if self._conn is not None:
+            self._conn.executemany("INSERT OR REPLACE INTO translations (key, translation) VALUES (?, ?)", items)
+            self._conn.commit()
+
+    def translate(self, text, source, target):
+        """
+        text를 source 언어에서 target 언어로 번역합니다.
+
+        Args:
+            text (str): 번역할 텍스트 (여러 문장이면 문장별로 캐시)
+            source (str): 원래 언어 코드 (예: 'ko')
+            target (str): 번역할 언어 코드 (예: 'en')
+
+        Returns:
+            str: 번역된 텍스트. 문장 사이의 공백/줄바꿈은 원래대로 유지합니다.
+        """
+        if not text.strip() or is_target_language(text, source, target):
+            self.skipped += 1
+            return text
+
+        parts = split_sentences(text)
+        # 짝수 번째가 문장, 홀수 번째가 구분자
+        sentences = {i: part for i, part in enumerate(parts) if i % 2 == 0 and part.strip()}
+        with self._lock:
+            translated = {}
+            missing = {}
+            for i, sentence in sentences.items():
+                key = self._key(sentence, source, target)
+                cached = self._get(key)
+                if cached is None:
+                    missing.setdefault(sentence, []).append(i)
+                else:
+                    translated[i] = cached
+            self.hits += len(sentences) - sum(len(indexes) for indexes in missing.values())
+            self.misses += len(missing)
+
+        if missing:
+            # 캐시에 없는 문장만 중복 없이 모아 backend를 한 번 호출 (네트워크 호출 중에는 lock을 잡지 않음)
+            results = self.backend.translate_batch(list(missing), source, target)
+            with self._lock:
+                self.backend_calls += 1
+                self._put([(self._key(sentence, source, target), result) for sentence, result in zip(missing, results)])
+            for (sentence, indexes), result in zip(missing.items(), results):
+                for i in indexes:
+                    translated[i] = result
+
+        return ''.join(translated.get(i, part) for i, part in enumerate(parts))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else None,
+            'skipped': self.skipped,
+            'backend_calls': self.backend_calls,
+        }
@@ -1,9 +1,12 @@
+import uuid
+
 import streamlit as st
 from dotenv import load_dotenv
-from llm import get_ai_response
-import io
+from llm import get_ai_response, prefetch_documents
 import speech_recognition as sr
 import streamlit_audiorec  # 음성 녹음을 위한 커스텀 컴포넌트
+from config import speech_language, speech_max_workers, speech_min_silence_ms
+from speech import GoogleRecognizer, SpeechPipeline
 
 load_dotenv()
 
@@ -29,6 +32,17 @@ if 'message_list' not in st.session_state:
     st.session_state.message_list = []
 if 'selected_mode' not in st.session_state:
     st.session_state.selected_mode = None
+# 사용자(브라우저 세션)마다 별도의 대화 기록을 사용하기 위한 session id
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+
+
+@st.cache_resource
+def get_speech_pipeline():
+    # 녹음을 발화 단위로 나눠 동시에 인식하는 파이프라인 (앱 전체에서 하나만 생성)
+    return SpeechPipeline(GoogleRecognizer(speech_language), max_workers=speech_max_workers,
+                          min_silence_ms=speech_min_silence_ms)
+
 
 # 모드 선택 버튼: 정비 과정 문의 / 메일 또는 보고서 작성
 col1, col2 = st.columns(2)
@@ -59,13 +73,15 @@ audio_bytes = streamlit_audiorec.audio_recorder()
 if audio_bytes is not None:
     # 녹음된 음성 재생
     st.audio(audio_bytes, format="audio/wav")
-    recognizer = sr.Recognizer()
-    audio_file = sr.AudioFile(io.BytesIO(audio_bytes))
-    with audio_file as source:
-        audio_data = recognizer.record(source)
+    # 발화마다 인식이 끝나는 대로 검색을 미리 시작하고, 전체 인식 결과로 답변을 생성
+    prefetched = []
     try:
-        # 음성을 텍스트로 변환 (한국어)
-        voice_text = recognizer.recognize_google(audio_data, language="ko-KR")
+        result = get_speech_pipeline().transcribe_wav(
+            audio_bytes, on_segment=lambda text, utterance: prefetched.append(prefetch_documents(text))
+        )
+        voice_text = result['text']
+        if not voice_text:
+            raise sr.UnknownValueError()
         st.write("음성 인식 결과:", voice_text)
         # 음성 인식 결과를 채팅 메시지로 추가
         with st.chat_message("user"):
@@ -73,7 +89,7 @@ if audio_bytes is not None:
         st.session_state.message_list.append({"role": "user", "content": voice_text})
 
         with st.spinner("답변을 생성하는 중입니다."):
-            ai_response = get_ai_response(voice_text)
+            ai_response = get_ai_response(voice_text, st.session_state.session_id, prefetched=prefetched)
             with st.chat_message("ai"):
                 st.write(ai_response)
             st.session_state.message_list.append({"role": "ai", "content": ai_response})
@@ -96,7 +112,7 @@ if user_question := st.chat_input(placeholder=placeholder_text):
     st.session_state.message_list.append({"role": "user", "content": user_question})
 
     with st.spinner("답변을 생성하는 중입니다."):
-        ai_response = get_ai_response(user_question)
+        ai_response = get_ai_response(user_question, st.session_state.session_id)
         with st.chat_message("ai"):
             st.write(ai_response)
         st.session_state.message_list.append({"role": "ai", "content": ai_response})
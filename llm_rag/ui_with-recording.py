@@ -1,27 +1,52 @@
+import uuid
+
 import streamlit as st
 import speech_recognition as sr
 from dotenv import load_dotenv
-from llm import get_ai_response
+from llm import get_ai_response, prefetch_documents
+from config import (
+    speech_language, speech_max_workers, speech_min_silence_ms, speech_end_silence_seconds,
+    speech_max_record_seconds,
+)
+from speech import GoogleRecognizer, SpeechPipeline, microphone_chunks
 
 load_dotenv()
 
+
+@st.cache_resource
+def get_speech_pipeline():
+    # 음성을 발화 단위로 나눠 동시에 인식하는 파이프라인 (앱 전체에서 하나만 생성)
+    return SpeechPipeline(GoogleRecognizer(speech_language), max_workers=speech_max_workers,
+                          min_silence_ms=speech_min_silence_ms)
+
+
 def get_audio_input():
-    # 음성 인식을 수행하고, 텍스트를 반환하는 함수
-    r = sr.Recognizer()
+    """
+    마이크 음성을 발화 단위로 나눠 말하는 동안 인식하고, (텍스트, 미리 시작한 검색 목록)을 반환하는 함수.
+    말이 끝나고 speech_end_silence_seconds 동안 조용하면 녹음을 멈춥니다.
+    """
+    prefetched = []
+
+    def on_segment(text, utterance):
+        # 인식이 끝난 발화로 검색을 미리 시작 (Streamlit 화면은 메인 스레드에서만 갱신하므로 여기서는 출력하지 않음)
+        prefetched.append(prefetch_documents(text))
+
     with sr.Microphone() as source:
         st.write("음성을 듣고 있습니다...")
-        audio = r.listen(source)
-    try:
-        recognized_text = r.recognize_google(audio, language='ko')
-        st.write(f"구글 음성 인식 결과: {recognized_text}")
-        return recognized_text
-    except sr.UnknownValueError:
+        try:
+            result = get_speech_pipeline().run(
+                microphone_chunks(source, speech_max_record_seconds), source.SAMPLE_RATE,
+                on_segment=on_segment, end_silence_seconds=speech_end_silence_seconds,
+            )
+        except sr.RequestError as e:
+            st.write(f"에러가 발생했습니다: {e}")
+            return None, []
+    if not result['text']:
         st.write("인식에 실패했습니다. 다시 시도해주세요.")
-        return None
-    except sr.RequestError as e:
-        st.write(f"에러가 발생했습니다: {e}")
-        return None
-        
+        return None, []
+    st.write(f"구글 음성 인식 결과: {result['text']}")
+    return result['text'], prefetched
+
 # Streamlit 기본 UI 세팅
 st.set_page_config(page_title="스프링 메뉴얼 설명 봇", page_icon="🍃")
 st.title("🍃 스프링 설명 챗봇")
@@ -30,6 +55,9 @@ st.caption("스프링 프레임워크에 관련된 모든 것을 답변해드립
 # 세션에서 채팅 기록 관리
 if "message_list" not in st.session_state:
     st.session_state["message_list"] = []
+# 사용자(브라우저 세션)마다 별도의 대화 기록을 사용하기 위한 session id
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = str(uuid.uuid4())
 
 # 지금까지의 대화 내용 표시
 for message in st.session_state["message_list"]:
@@ -38,7 +66,7 @@ for message in st.session_state["message_list"]:
 
 # 1) 마이크 버튼을 눌러 음성 인식
 if st.button("마이크 켜기"):
-    user_question = get_audio_input()
+    user_question, prefetched = get_audio_input()
     if user_question is not None:
         # 1-1) 음성으로 인식된 텍스트를 "user" 메시지로 추가
         with st.chat_message("user"):
@@ -47,7 +75,7 @@ if st.button("마이크 켜기"):
 
         # 1-2) LLM(또는 RAG 체인)에서 답변 생성
         with st.spinner("답변을 생성하는 중입니다..."):
-            ai_response = get_ai_response(user_question)
+            ai_response = get_ai_response(user_question, st.session_state["session_id"], prefetched=prefetched)
         # 1-3) 챗봇 메시지 추가
         with st.chat_message("ai"):
             st.write(ai_response)
@@ -62,7 +90,7 @@ if user_question := st.chat_input(placeholder="스프링 프레임워크에 관
 
     # 2-2) AI 답변 생성
     with st.spinner("답변을 생성하는 중입니다..."):
-        ai_response = get_ai_response(user_question)
+        ai_response = get_ai_response(user_question, st.session_state["session_id"])
     # 2-3) 챗봇 메시지 추가
     with st.chat_message("ai"):
         st.write(ai_response)